@@ -0,0 +1,4 @@
+"""
+benchmarks 包
+性能基准脚本，使用合成帧在任意平台上测量识别链路的耗时
+"""
@@ -0,0 +1,53 @@
+"""
+后台截图线程基准测试
+
+使用带固定截图耗时的合成来源，对比同步截图与后台截图线程下使用者每次读取帧的阻塞时间，
+并报告生产帧率、使用者延迟和丢帧数
+
+用法:
+    python -m benchmarks.bench_background_capture [--target-fps 30] [--capture-ms 15] [--reads 100]
+"""
+
+import argparse
+import time
+
+from benchmarks.bench_frame_bus import SlowSyntheticSource
+from benchmarks.common import format_timing, time_calls
+from capture.background_capture import BackgroundCapture
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后台截图线程基准")
+    parser.add_argument("--target-fps", type=float, default=30.0)
+    parser.add_argument("--buffer-size", type=int, default=3)
+    parser.add_argument("--capture-ms", type=float, default=15.0)
+    parser.add_argument("--reads", type=int, default=100)
+    parser.add_argument("--consumer-ms", type=float, default=50.0, help="使用者每次读取之间的处理时间")
+    args = parser.parse_args()
+
+    source = SlowSyntheticSource(args.capture_ms / 1000.0)
+    print(format_timing("sync read", time_calls(source.capture_array, args.reads, warmup=2)))
+
+    background = BackgroundCapture(source.capture_array, args.target_fps, args.buffer_size)
+    background.start()
+    background.wait_for_next(timeout=1.0)
+
+    # 只统计读取本身的阻塞时间
+    samples = []
+    for _ in range(args.reads):
+        start = time.perf_counter()
+        background.read_latest()
+        samples.append((time.perf_counter() - start) * 1000.0)
+        time.sleep(args.consumer_ms / 1000.0)
+    background.stop()
+
+    samples.sort()
+    print(f"background read              mean={sum(samples) / len(samples):.3f}ms  p50={samples[len(samples) // 2]:.3f}ms")
+    stats = background.get_stats()
+    print(f"生产帧率: {stats['production_fps']:.1f} FPS, 生产 {stats['produced']} 帧, 读取 {stats['read']} 次, "
+          f"丢弃 {stats['dropped']} 帧, 使用者延迟 avg={stats['lag_avg_ms']:.1f}ms max={stats['lag_max_ms']:.1f}ms, "
+          f"读取复制 {stats['read_copy_mb']:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
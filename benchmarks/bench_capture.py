@@ -0,0 +1,116 @@
+"""
+截图链路基准测试
+
+使用合成的GDI位图数据（与 GetBitmapBits 返回的BGRX字节相同格式），对比：
+    legacy: Image.frombuffer -> PIL crop -> np.array -> cvtColor(RGB2BGR)
+    array:  np.frombuffer -> 区域视图（模板匹配直接使用，面积检测再转为BGR）
+
+用法:
+    python -m benchmarks.bench_capture [--width 1920] [--height 1080] [--iterations 200]
+"""
+
+import argparse
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmarks.common import format_timing, time_calls
+from capture.frame_utils import bgrx_buffer_to_array, crop_view, to_bgr
+
+
+class SyntheticGdiBackend:
+    """合成GDI后端，每次调用返回新的BGRX字节对象，模拟 GetBitmapBits(True)"""
+
+    def __init__(self, width, height, seed=0):
+        self.width = width
+        self.height = height
+        rng = np.random.default_rng(seed)
+        self._pixels = rng.integers(0, 256, size=(height, width, 4), dtype=np.uint8)
+
+    def grab(self):
+        return self._pixels.tobytes()
+
+
+def fishing_regions(width, height):
+    """按照 FishingBot 的规则计算模板匹配区域和面积检测区域"""
+    ocr_w, ocr_h = int(width * 0.33), int(height * 0.16)
+    area_w, area_h = int(width * 0.33), int(height * 0.33)
+    return {
+        "ocr": (width - ocr_w, height - ocr_h, ocr_w, ocr_h),
+        "area": ((width - area_w) // 2, (height - area_h) // 2, area_w, area_h),
+    }
+
+
+def legacy_pipeline(bmpstr, width, height, region):
+    """旧链路，返回各阶段输出"""
+    img = Image.frombuffer('RGB', (width, height), bmpstr, 'raw', 'BGRX', 0, 1)
+    x, y, w, h = region
+    cropped = img.crop((x, y, x + w, y + h))
+    rgb = np.array(cropped)
+    bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    return [("Image.frombuffer", img), ("PIL crop", cropped), ("np.array", rgb), ("cvtColor RGB2BGR", bgr)]
+
+
+def array_pipeline(bmpstr, width, height, region, need_bgr=False):
+    """新链路，返回各阶段输出"""
+    frame = bgrx_buffer_to_array(bmpstr, width, height)
+    view = crop_view(frame, region)
+    stages = [("np.frombuffer", frame), ("crop_view", view)]
+    if need_bgr:
+        stages.append(("to_bgr", to_bgr(view)))
+    return stages
+
+
+def count_allocations(stages, source):
+    """统计各阶段产生的新缓冲区数量和字节数（视图不计入）"""
+    count = 0
+    total_bytes = 0
+    for _, output in stages:
+        if isinstance(output, Image.Image):
+            count += 1
+            total_bytes += output.width * output.height * len(output.getbands())
+        elif not np.shares_memory(output, np.frombuffer(source, dtype=np.uint8)):
+            count += 1
+            total_bytes += output.nbytes
+    return count, total_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="截图链路单帧耗时与内存分配基准")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    backend = SyntheticGdiBackend(args.width, args.height)
+    regions = fishing_regions(args.width, args.height)
+    width, height = args.width, args.height
+    bmpstr = backend.grab()
+
+    print(f"窗口: {width}x{height}, 迭代: {args.iterations}")
+    for name, region in regions.items():
+        need_bgr = name == "area"
+        legacy_stages = legacy_pipeline(bmpstr, width, height, region)
+        array_stages = array_pipeline(bmpstr, width, height, region, need_bgr)
+
+        # 两条链路得到的像素必须一致
+        same = np.array_equal(legacy_stages[-1][1], to_bgr(np.ascontiguousarray(array_stages[-1][1])))
+
+        legacy_count, legacy_bytes = count_allocations(legacy_stages, bmpstr)
+        array_count, array_bytes = count_allocations(array_stages, bmpstr)
+
+        print(f"[{name}] 区域: {region}, 像素一致: {same}")
+        print(f"  legacy 分配: {legacy_count} 次, {legacy_bytes / 1024:.0f} KiB")
+        print(f"  array  分配: {array_count} 次, {array_bytes / 1024:.0f} KiB")
+        print(format_timing("  legacy (PIL)", time_calls(
+            lambda: legacy_pipeline(backend.grab(), width, height, region), args.iterations)))
+        print(format_timing("  array (zero-copy)", time_calls(
+            lambda: array_pipeline(backend.grab(), width, height, region, need_bgr), args.iterations)))
+
+    # 合成后端本身的开销（模拟GetBitmapBits复制），两条链路都包含这一部分
+    print(format_timing("synthetic grab only", time_calls(backend.grab, args.iterations)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+识别吞吐量基准测试
+
+从帧来源（合成帧、图片目录或视频文件）读取整帧，截取模板匹配区域并执行模板匹配，
+统计每秒可处理的帧数
+
+用法:
+    python -m benchmarks.bench_detection --source synthetic [--frames 500]
+    python -m benchmarks.bench_detection --source images --path recordings/frames
+    python -m benchmarks.bench_detection --source video --path session.mp4
+    python -m benchmarks.bench_detection --source synthetic --planner
+"""
+
+import argparse
+import time
+
+from benchmarks.common import get_template_configs
+from bot.detection_planner import DetectionPlanner
+from bot.state_machine import StateMachine, TEMPLATE_STATES
+from capture.frame_source import ImageDirectorySource, SyntheticFrameSource, VideoFileSource
+from capture.region_capture import RegionCapture, calculate_fishing_regions
+from match.template_matcher import TemplateMatcher
+
+
+def create_source(args, matcher):
+    """根据命令行参数创建帧来源"""
+    if args.source == "images":
+        return ImageDirectorySource(args.path, preload=args.preload)
+    if args.source == "video":
+        return VideoFileSource(args.path)
+
+    templates = {name: info["image"] for name, info in matcher.templates.items()}
+    script = [(None, 20)] + [(name, 10) for name in templates]
+    return SyntheticFrameSource((args.width, args.height), templates, script)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="识别吞吐量基准")
+    parser.add_argument("--source", choices=["synthetic", "images", "video"], default="synthetic")
+    parser.add_argument("--path", help="图片目录或视频文件路径")
+    parser.add_argument("--preload", action="store_true", help="图片目录来源预先解码所有图片")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--planner", action="store_true", help="使用检测计划（按识别出的状态只匹配可能出现的模板）")
+    args = parser.parse_args()
+
+    if args.source != "synthetic" and not args.path:
+        parser.error("--source images/video 需要指定 --path")
+
+    matcher = TemplateMatcher()
+    matcher.load_templates(get_template_configs(), (args.width, args.height))
+    source = create_source(args, matcher)
+
+    # 文件类来源的尺寸可能与命令行不同，按实际尺寸重新加载模板
+    window_size = (source.window_width, source.window_height)
+    if window_size != (args.width, args.height):
+        matcher.load_templates(get_template_configs(), window_size)
+
+    ocr_capture = RegionCapture(source, calculate_fishing_regions(*window_size)["ocr"])
+
+    labelled = isinstance(source, SyntheticFrameSource)
+    if labelled:
+        # 位置跟踪只在模板匹配过一次之后生效：计时前先播放一遍脚本，记住每个模板的位置
+        # （与 bench_template_matcher 相同），再清空统计和结果备忘，计时部分反映稳态
+        for _ in range(sum(count for _, count in source.script)):
+            matcher.match_templates(ocr_capture.capture_region_array(), matcher.templates)
+        source.index = 0
+        matcher.clear_memo()
+        for stats in (matcher.tracking_stats, matcher.prefilter_stats, matcher.memo_stats):
+            stats.update(dict.fromkeys(stats, 0))
+
+    # 检测计划使用的状态按识别结果推进，与 StateHandler 相同
+    state_machine = StateMachine()
+    planner = DetectionPlanner(matcher, state_machine) if args.planner else None
+    evaluated = 0
+
+    detections = {}
+    correct = 0
+    processed = 0
+
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        label = source.current_label() if labelled else None
+        region = ocr_capture.capture_region_array()
+        if region is None:
+            break
+        if planner:
+            result = planner.detect(region, state_machine.state)
+        else:
+            result, count = matcher.match_templates(region, matcher.templates)
+            evaluated += count
+        name = result["name"] if result else None
+        if name in TEMPLATE_STATES:
+            state_machine.transition(TEMPLATE_STATES[name], name, result["score"], "template")
+        detections[name] = detections.get(name, 0) + 1
+        if labelled and name == label:
+            correct += 1
+        processed += 1
+    elapsed = time.perf_counter() - start
+    source.close()
+
+    print(f"来源: {args.source}, 尺寸: {window_size[0]}x{window_size[1]}, 帧数: {processed}")
+    print(f"耗时: {elapsed:.3f}s, 吞吐量: {processed / elapsed:.1f} FPS, 单帧: {elapsed / max(processed, 1) * 1000:.2f}ms")
+    print(f"识别结果分布: {detections}")
+    if labelled:
+        print(f"合成帧识别准确率: {correct / max(processed, 1) * 100:.1f}%")
+    tracking = matcher.get_tracking_stats()
+    print(f"位置跟踪: 命中率 {tracking['hit_rate'] * 100:.1f}%, 搜索面积 {tracking['search_area_ratio'] * 100:.1f}%")
+    prefilter = matcher.get_prefilter_stats()
+    print(f"预筛选: 通过率 {prefilter['pass_rate'] * 100:.1f}% ({prefilter['passed']}/{prefilter['checked']})")
+    memo = matcher.get_memo_stats()
+    print(f"结果备忘: 命中率 {memo['hit_rate'] * 100:.1f}% ({memo['hits']}/{memo['hits'] + memo['misses']}), "
+          f"条目 {memo['entries']}/{memo['max_entries']}, 淘汰 {memo['evictions']} 次")
+    if planner:
+        stats = planner.get_stats()
+        print(f"检测计划: 平均每帧匹配模板 {stats['templates_per_frame']:.2f} 个"
+              f"（不使用时 {stats['baseline_templates_per_frame']:.2f} 个）, "
+              f"提前结束 {stats['early_exits']} 次, 完整匹配 {stats['full_sweeps']} 次")
+    else:
+        print(f"平均每帧匹配模板 {evaluated / max(processed, 1):.2f} 个")
+
+
+if __name__ == "__main__":
+    main()
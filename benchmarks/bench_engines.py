@@ -0,0 +1,145 @@
+"""
+匹配引擎基准测试
+
+在同一组带标注的合成帧上对比各匹配引擎的准确率、与 opencv 引擎的得分差异和每帧耗时。
+--scale 2 将帧和模板放大两倍，模拟只有1080p模板时的4K画面；
+--sweep 对比各引擎在匹配区域变大、模板数增多时的每帧耗时
+
+用法:
+    python -m benchmarks.bench_engines [--engines opencv pyramid] [--resolution 1080p] [--scale 1]
+    python -m benchmarks.bench_engines --engines opencv fft --sweep
+"""
+
+import argparse
+
+import numpy as np
+
+from benchmarks.common import (format_timing, get_template_configs, make_benchmark_set, scale_template_image,
+                               time_calls)
+from match.engines import ENGINES
+from match.template_cache import compile_template
+from match.template_matcher import TemplateMatcher
+
+RESOLUTION_WINDOWS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+
+
+def create_matcher(engine, window_size, scale=1):
+    """创建使用指定引擎的匹配器，scale>1 时使用放大后重新编译的模板"""
+    matcher = TemplateMatcher(engine)
+    matcher.load_templates(get_template_configs(), window_size)
+    # 只比较引擎本身，不使用位置跟踪、预筛选和结果备忘
+    matcher.tracking_enabled = False
+    matcher.prefilter_enabled = False
+    matcher.memo_enabled = False
+    if scale > 1:
+        for name, info in list(matcher.templates.items()):
+            image = scale_template_image(info["image"], scale)
+            template_info = {"image": image, "path": info["path"], "threshold": info["threshold"]}
+            template_info.update(compile_template(image))
+            matcher.templates[name] = template_info
+    return matcher
+
+
+def evaluate(matcher, samples, scale=1):
+    """
+    统计引擎在基准帧集合上的识别结果和各模板的原始得分
+
+    返回:
+        (识别统计字典, 原始得分数组 [帧, 模板])
+    """
+    stats = {"correct": 0, "wrong": 0, "missed": 0, "false_positive": 0}
+    scores = np.empty((len(samples), len(matcher.templates)), dtype=np.float64)
+    for i, (label, location, frame) in enumerate(samples):
+        result = matcher.match_template(frame)
+        if label is None:
+            stats["correct" if result is None else "false_positive"] += 1
+        elif result is None:
+            stats["missed"] += 1
+        elif result["name"] == label and max(abs(result["location"][0] - location[0]),
+                                             abs(result["location"][1] - location[1])) <= scale:
+            stats["correct"] += 1
+        else:
+            stats["wrong"] += 1
+
+        frame_binary = matcher._binarize_frame(frame)
+        for j, template_info in enumerate(matcher.templates.values()):
+            scores[i, j], _ = matcher._search(frame_binary, template_info)
+    stats["accuracy"] = stats["correct"] / len(samples)
+    return stats, scores
+
+
+def sweep(engines, window_size, iterations, scales=(1, 2, 3), counts=(1, 3, 5)):
+    """按匹配区域放大倍数和模板数输出各引擎的每帧耗时（毫秒）"""
+    header = f"{'区域':>10} {'模板数':>6}" + "".join(f"{engine:>12}" for engine in engines)
+    print(header)
+    for scale in scales:
+        matchers = {engine: create_matcher(engine, window_size, scale) for engine in engines}
+        templates = {name: info["image"] for name, info in create_matcher("opencv", window_size).templates.items()}
+        _, _, frame = make_benchmark_set(templates, window_size, positions=1, idle_frames=0, scale=scale)[-1]
+        for count in counts:
+            row = f"{frame.shape[1]:>5}x{frame.shape[0]:<4} {count:>6}"
+            for engine, matcher in matchers.items():
+                names = list(matcher.templates)[:count]
+                timing = time_calls(lambda: matcher.match_templates(frame, names), iterations, warmup=2)
+                row += f"{timing['mean']:>10.2f}ms"
+            print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="匹配引擎准确率与耗时基准")
+    parser.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=sorted(ENGINES))
+    parser.add_argument("--resolution", choices=sorted(RESOLUTION_WINDOWS), default="1080p")
+    parser.add_argument("--scale", type=int, default=1, help="帧和模板的放大倍数")
+    parser.add_argument("--positions", type=int, default=4, help="每个模板放置的位置数")
+    parser.add_argument("--iterations", type=int, default=5, help="整个帧集合的计时轮数")
+    parser.add_argument("--sweep", action="store_true", help="按匹配区域尺寸和模板数对比每帧耗时")
+    args = parser.parse_args()
+
+    window_size = RESOLUTION_WINDOWS[args.resolution]
+    if args.sweep:
+        sweep(["opencv"] + [name for name in args.engines if name != "opencv"], window_size, max(args.iterations, 10))
+        return
+
+    reference = create_matcher("opencv", window_size)
+    templates = {name: info["image"] for name, info in reference.templates.items()}
+    samples = make_benchmark_set(templates, window_size, positions=args.positions, scale=args.scale)
+    height, width = samples[0][2].shape[:2]
+    print(f"分辨率: {args.resolution} x{args.scale}, 匹配区域: {width}x{height}, "
+          f"模板数: {len(templates)}, 帧数: {len(samples)}")
+
+    baseline_scores = None
+    for engine in ["opencv"] + [name for name in args.engines if name != "opencv"]:
+        matcher = create_matcher(engine, window_size, args.scale)
+        stats, scores = evaluate(matcher, samples, args.scale)
+        if baseline_scores is None:
+            baseline_scores = scores
+        # 只比较帧中实际出现的模板的得分，未匹配的模板各引擎可能返回估计得分
+        names = list(matcher.templates)
+        labelled = [(i, names.index(label)) for i, (label, _, _) in enumerate(samples) if label in names]
+        score_diff = max((abs(scores[i, j] - baseline_scores[i, j]) for i, j in labelled), default=0.0)
+
+        def run_set():
+            for _, _, frame in samples:
+                matcher.match_template(frame)
+
+        timing = time_calls(run_set, args.iterations, warmup=1)
+        per_frame = {key: value / len(samples) for key, value in timing.items()}
+        print(f"[{engine}] 准确率: {stats['accuracy'] * 100:.1f}% (正确 {stats['correct']}, 错误 {stats['wrong']}, "
+              f"漏检 {stats['missed']}, 误检 {stats['false_positive']}), 与opencv得分差: {score_diff:.2e}")
+        print(format_timing("  per frame", per_frame))
+        # 按模板尺寸分别计时（整区域搜索一个模板）
+        frame_binary = matcher._binarize_frame(samples[-1][2])
+        for name, template_info in matcher.templates.items():
+            t_w, t_h = template_info["size"]
+            print(format_timing(f"  {name} {t_w}x{t_h}", time_calls(
+                lambda: matcher._search(frame_binary, template_info), args.iterations, warmup=1)))
+        engine_stats = matcher.get_engine_stats()
+        if len(engine_stats) > 1:
+            print(f"  引擎统计: {engine_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+帧总线基准测试
+
+模拟检测线程和鱼线处理线程等多个使用者同时截图，对比直接访问帧来源与通过帧总线时的实际截图次数；
+并模拟 LineHandler 中背靠背的连续截图，统计帧缓存的命中情况
+
+用法:
+    python -m benchmarks.bench_frame_bus [--consumers 3] [--duration 2.0] [--capture-ms 15] [--max-age-ms 8]
+"""
+
+import argparse
+import threading
+import time
+
+from capture.frame_bus import FrameBus
+from capture.frame_source import SyntheticFrameSource
+from capture.region_capture import RegionCapture, calculate_fishing_regions
+
+
+class SlowSyntheticSource(SyntheticFrameSource):
+    """带固定截图耗时的合成来源，模拟GDI截图的阻塞时间"""
+
+    def __init__(self, capture_seconds, **kwargs):
+        super().__init__(**kwargs)
+        self.capture_seconds = capture_seconds
+        self.capture_calls = 0
+        self._lock = threading.Lock()
+
+    def capture_array(self):
+        time.sleep(self.capture_seconds)
+        with self._lock:
+            self.capture_calls += 1
+            return super().capture_array()
+
+
+def run_consumers(source_for_regions, consumers, duration):
+    """启动多个使用者线程，交替读取模板匹配区域和面积检测区域"""
+    regions = calculate_fishing_regions(1920, 1080)
+    names = ["ocr", "area"]
+    reads = [0] * consumers
+    stop = threading.Event()
+
+    def worker(index):
+        capture = RegionCapture(source_for_regions, regions[names[index % len(names)]])
+        while not stop.is_set():
+            if capture.capture_region_array() is not None:
+                reads[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(consumers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="帧总线截图次数基准")
+    parser.add_argument("--consumers", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--capture-ms", type=float, default=15.0)
+    parser.add_argument("--max-age-ms", type=float, default=8.0)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    direct_source = SlowSyntheticSource(args.capture_ms / 1000.0)
+    direct_reads = run_consumers(direct_source, args.consumers, args.duration)
+
+    bus_source = SlowSyntheticSource(args.capture_ms / 1000.0)
+    bus = FrameBus(bus_source)
+    bus_reads = run_consumers(bus, args.consumers, args.duration)
+
+    print(f"使用者: {args.consumers}, 时长: {args.duration}s, 单次截图: {args.capture_ms}ms")
+    print(f"直接访问: 区域读取 {direct_reads} 次, 实际截图 {direct_source.capture_calls} 次")
+    print(f"帧总线:   区域读取 {bus_reads} 次, 实际截图 {bus_source.capture_calls} 次, 统计 {bus.get_stats()}")
+
+    # 背靠背截图：按键后要求新帧，随后的面积检测和拉扯状态检测接受缓存帧
+    cached_source = SlowSyntheticSource(args.capture_ms / 1000.0)
+    cached_bus = FrameBus(cached_source, max_age=args.max_age_ms / 1000.0)
+    area = RegionCapture(cached_bus, calculate_fishing_regions(1920, 1080)["area"])
+    for _ in range(args.rounds):
+        area.capture_region_array(fresh=True)
+        area.capture_region_array()
+        area.capture_region_array()
+    stats = cached_bus.get_stats()
+    print(f"背靠背截图 (max_age={args.max_age_ms}ms): 请求 {args.rounds * 3} 次, 实际截图 {cached_source.capture_calls} 次, "
+          f"命中 {stats['cache_hits']}, 未命中 {stats['cache_misses']}, 命中率 {stats['cache_hit_rate'] * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+最近质心状态分类器基准测试
+
+在合成的带标注帧上训练分类器，用另一组随机种子生成的帧对比分类器与模板匹配的识别准确率和每帧耗时；
+指定 --model 时使用已训练的模型文件（如 python -m match.centroid_classifier 从录制归档训练得到的模型）
+
+用法:
+    python -m benchmarks.bench_state_classifier [--resolution 1080p] [--grid 96 24]
+    python -m benchmarks.bench_state_classifier --model models/centroid/1920x1080.npz
+    python -m benchmarks.bench_state_classifier --save models/centroid/1920x1080.npz
+"""
+
+import argparse
+
+import numpy as np
+
+from benchmarks.common import format_timing, get_template_configs, make_state_dataset, time_calls
+from match.centroid_classifier import CentroidClassifier, extract_features
+from match.template_matcher import TemplateMatcher
+
+RESOLUTION_WINDOWS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+
+
+def evaluate(detector, samples):
+    """
+    统计识别结果
+
+    返回:
+        (准确率, 混淆字典 {(标签, 识别结果): 帧数})
+    """
+    confusion = {}
+    correct = 0
+    for label, frame in samples:
+        result = detector.match_template(frame)
+        name = result["name"] if result else None
+        confusion[(label, name)] = confusion.get((label, name), 0) + 1
+        correct += name == label
+    return correct / len(samples), confusion
+
+
+def main():
+    parser = argparse.ArgumentParser(description="最近质心状态分类器与模板匹配的准确率和耗时对比")
+    parser.add_argument("--resolution", choices=sorted(RESOLUTION_WINDOWS), default="1080p")
+    parser.add_argument("--grid", type=int, nargs=2, default=[96, 24], metavar=("COLS", "ROWS"))
+    parser.add_argument("--train-frames", type=int, default=40, help="训练集中每个类别的帧数")
+    parser.add_argument("--test-frames", type=int, default=40, help="测试集中每个类别的帧数")
+    parser.add_argument("--jitter", type=int, default=2,
+                        help="模板位置的随机偏移范围（像素），分类器对位置敏感，偏移超过3像素时相似的提示会混淆")
+    parser.add_argument("--model", default=None, help="使用已训练的模型文件，不在合成帧上训练")
+    parser.add_argument("--save", default=None, help="将合成帧上训练的模型保存到该路径（可供模拟器 --model 使用）")
+    parser.add_argument("--iterations", type=int, default=3, help="整个测试集的计时轮数")
+    args = parser.parse_args()
+
+    window_size = RESOLUTION_WINDOWS[args.resolution]
+    matcher = TemplateMatcher()
+    matcher.load_templates(get_template_configs(), window_size)
+    # 每帧都执行完整的模板匹配，不复用结果
+    matcher.memo_enabled = False
+    matcher.tracking_enabled = False
+    templates = {name: info["image"] for name, info in matcher.templates.items()}
+
+    test_set = make_state_dataset(templates, window_size, args.test_frames, args.jitter, seed=1)
+    if args.model:
+        classifier = CentroidClassifier.load(args.model)
+        if classifier is None:
+            print(f"无法加载模型文件: {args.model}")
+            return
+    else:
+        train_set = make_state_dataset(templates, window_size, args.train_frames, args.jitter, seed=0)
+        grid = tuple(args.grid)
+        features = np.stack([extract_features(frame, grid) for _, frame in train_set])
+        classifier = CentroidClassifier.fit([label for label, _ in train_set], features, grid,
+                                            train_set[0][1].shape[:2])
+        if args.save:
+            print(f"模型已保存: {classifier.save(args.save, {'source': 'synthetic'})}")
+
+    height, width = test_set[0][1].shape[:2]
+    print(f"分辨率: {args.resolution}, 匹配区域: {width}x{height}, 网格: {classifier.grid[0]}x{classifier.grid[1]}, "
+          f"测试帧数: {len(test_set)}")
+
+    for name, detector in (("template", matcher), ("centroid", classifier)):
+        accuracy, confusion = evaluate(detector, test_set)
+        errors = {f"{label or '无提示'} -> {result or '无提示'}": count
+                  for (label, result), count in confusion.items() if label != result}
+        timing = time_calls(lambda: [detector.match_template(frame) for _, frame in test_set],
+                            args.iterations, warmup=1)
+        print(f"[{name}] 准确率: {accuracy * 100:.1f}%, 错误: {errors or '无'}")
+        print(format_timing("  per frame", {key: value / len(test_set) for key, value in timing.items()}))
+
+    frame = test_set[-1][1]
+    print(format_timing("stage: extract features", time_calls(lambda: classifier.features(frame), 200)))
+    vector = classifier.features(frame)
+    print(format_timing("stage: classify", time_calls(lambda: classifier.classify(vector), 200)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+TemplateMatcher 基准测试
+
+对比旧的逐次编译模板路径与预编译模板库路径的单次 match_template 耗时
+
+用法:
+    python -m benchmarks.bench_template_matcher [--resolution 1080p] [--iterations 200]
+"""
+
+import argparse
+
+import cv2
+import numpy as np
+
+from benchmarks.common import format_timing, get_template_configs, make_benchmark_set, make_ocr_frame, time_calls
+from match.template_matcher import TemplateMatcher
+
+RESOLUTION_WINDOWS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+
+
+def legacy_match_template(frame, templates):
+    """旧实现：每次调用都对每个模板重新灰度化、二值化并生成掩码"""
+    best_match = None
+    best_score = 0
+    for name, template_info in templates.items():
+        template = template_info["image"]
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        _, frame_binary = cv2.threshold(frame_gray, 210, 255, cv2.THRESH_BINARY)
+
+        bgr = template[:, :, 0:3]
+        alpha = template[:, :, 3]
+        bgr_gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        _, bgr_binary = cv2.threshold(bgr_gray, 210, 255, cv2.THRESH_BINARY)
+        mask = np.uint8(alpha > 0) * 255
+        result = cv2.matchTemplate(frame_binary, bgr_binary, cv2.TM_SQDIFF_NORMED, mask=mask)
+
+        min_val, _, min_loc, _ = cv2.minMaxLoc(result)
+        score = 1.0 - min_val
+        if score >= template_info["threshold"] and score > best_score:
+            best_score = score
+            best_match = {"name": name, "score": score, "location": min_loc}
+    return best_match
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TemplateMatcher 单次调用耗时基准")
+    parser.add_argument("--resolution", choices=sorted(RESOLUTION_WINDOWS), default="1080p")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    window_size = RESOLUTION_WINDOWS[args.resolution]
+    matcher = TemplateMatcher()
+    matcher.load_templates(get_template_configs(), window_size)
+    # 各项计时反复匹配同一帧，关闭结果备忘，只在最后单独统计
+    matcher.memo_enabled = False
+
+    frames = {
+        "idle": make_ocr_frame(window_size=window_size),
+        "收线": make_ocr_frame(matcher.templates["收线"]["image"], window_size=window_size),
+    }
+
+    print(f"分辨率: {args.resolution}, 模板数: {len(matcher.templates)}, 迭代: {args.iterations}")
+    for label, frame in frames.items():
+        before = legacy_match_template(frame, matcher.templates)
+        after = matcher.match_template(frame)
+        same = (before is None and after is None) or (
+            before is not None and after is not None and before["name"] == after["name"]
+            and abs(before["score"] - after["score"]) < 1e-6
+        )
+        print(f"[{label}] 结果一致: {same}")
+        print(format_timing("  before (legacy)", time_calls(lambda: legacy_match_template(frame, matcher.templates), args.iterations)))
+        print(format_timing("  after (current)", time_calls(lambda: matcher.match_template(frame), args.iterations)))
+
+    # 位置跟踪：模板出现在上次位置附近时只搜索周围的小窗口
+    frame = frames["收线"]
+    matcher.tracking_enabled = False
+    untracked = matcher.match_template(frame, "收线")
+    untracked_timing = time_calls(lambda: matcher.match_template(frame, "收线"), args.iterations)
+    matcher.tracking_enabled = True
+    tracked = matcher.match_template(frame, "收线")
+    same = untracked is not None and tracked is not None and untracked["location"] == tracked["location"] \
+        and abs(untracked["score"] - tracked["score"]) < 1e-6
+    matcher.tracking_stats = dict.fromkeys(matcher.tracking_stats, 0)
+    tracked_timing = time_calls(lambda: matcher.match_template(frame, "收线"), args.iterations)
+    stats = matcher.get_tracking_stats()
+    print(f"[位置跟踪 收线] 结果一致: {same}, 命中率: {stats['hit_rate'] * 100:.1f}%, "
+          f"搜索面积: {stats['search_area_ratio'] * 100:.1f}% (padding={matcher.tracking_padding}px)")
+    print(format_timing("  full region", untracked_timing))
+    print(format_timing("  tracked window", tracked_timing))
+
+    # 网格密度预筛选：空闲帧和其他模板的帧在完整匹配之前被排除
+    matcher.tracking_enabled = False
+    samples = make_benchmark_set({name: info["image"] for name, info in matcher.templates.items()}, window_size)
+    matcher.prefilter_enabled = False
+    expected = [matcher.match_template(frame) for _, _, frame in samples]
+    unfiltered_timing = time_calls(lambda: [matcher.match_template(frame) for _, _, frame in samples], 3, warmup=1)
+    matcher.prefilter_enabled = True
+    matcher.prefilter_stats = dict.fromkeys(matcher.prefilter_stats, 0)
+    results = [matcher.match_template(frame) for _, _, frame in samples]
+    same = all((a is None and b is None) or (a is not None and b is not None and a["name"] == b["name"]
+                                              and a["location"] == b["location"]) for a, b in zip(expected, results))
+    stats = matcher.get_prefilter_stats()
+    print(f"[预筛选 grid={matcher.prefilter_grid}] 结果一致: {same}, 通过率: 总数 {stats['total_pass_rate'] * 100:.1f}%, "
+          f"窗口 {stats['window_pass_rate'] * 100:.1f}%, 单元格 {stats['cells_pass_rate'] * 100:.1f}%, "
+          f"整体 {stats['pass_rate'] * 100:.1f}% ({len(samples)}帧)")
+    filtered_timing = time_calls(lambda: [matcher.match_template(frame) for _, _, frame in samples], 3, warmup=1)
+    print(format_timing("  without prefilter", {key: value / len(samples) for key, value in unfiltered_timing.items()}))
+    print(format_timing("  with prefilter", {key: value / len(samples) for key, value in filtered_timing.items()}))
+    for label, name in (("idle", "收线"), ("收线", "跳过"), ("收线", "收线")):
+        frame_binary = matcher._binarize_frame(frames[label])
+        print(format_timing(f"stage: prefilter {name} on {label}", time_calls(
+            lambda: matcher._prefilter(frame_binary, matcher.templates[name], name), args.iterations)))
+
+    # 结果备忘：提示显示期间的连续帧二值化后完全相同，重复的帧只计算哈希
+    matcher.prefilter_enabled = False
+    sequence = [frame for _, _, frame in samples for _ in range(10)]
+    expected = [matcher.match_template(frame) for frame in sequence]
+    unmemoized_timing = time_calls(lambda: [matcher.match_template(frame) for frame in sequence], 1, warmup=0)
+    matcher.memo_enabled = True
+    matcher.clear_memo()
+    matcher.memo_stats = dict.fromkeys(matcher.memo_stats, 0)
+    memoized_timing = time_calls(lambda: [matcher.match_template(frame) for frame in sequence], 1, warmup=0)
+    results = [matcher.match_template(frame) for frame in sequence]
+    same = all((a is None and b is None) or (a is not None and b is not None and a["name"] == b["name"]
+                                              and a["location"] == b["location"]) for a, b in zip(expected, results))
+    stats = matcher.get_memo_stats()
+    print(f"[结果备忘 每帧重复10次] 结果一致: {same}, 命中率: {stats['hit_rate'] * 100:.1f}%, "
+          f"条目: {stats['entries']}/{stats['max_entries']}")
+    print(format_timing("  without memo", {key: value / len(sequence) for key, value in unmemoized_timing.items()}))
+    print(format_timing("  with memo", {key: value / len(sequence) for key, value in memoized_timing.items()}))
+    frame_binary = matcher._binarize_frame(frames["收线"])
+    names = tuple(matcher.templates)
+    print(format_timing("stage: memo key (blake2b)", time_calls(
+        lambda: matcher._memo_key(frame_binary, names, None), args.iterations)))
+    matcher.memo_enabled = False
+
+    # 分阶段耗时：预处理每帧只执行一次，与模板数量无关（整区域搜索，不使用位置跟踪和预筛选）
+    matcher.prefilter_enabled = False
+    frame = frames["idle"]
+    frame_binary = matcher._binarize_frame(frame)
+    print(format_timing("stage: binarize frame", time_calls(lambda: matcher._binarize_frame(frame), args.iterations)))
+    for name, template_info in matcher.templates.items():
+        print(format_timing(
+            f"stage: matchTemplate {name}",
+            time_calls(lambda: matcher._match_with_alpha(frame_binary, template_info, 0.9, name), args.iterations)
+        ))
+
+
+if __name__ == "__main__":
+    main()
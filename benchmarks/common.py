@@ -0,0 +1,165 @@
+"""
+基准测试公共工具
+提供模板加载、合成帧生成和计时统计，供各个基准脚本复用
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from bot.state_machine import TEMPLATE_FILES
+
+TEMPLATE_DIR = os.path.join(ROOT_DIR, "img", "templates")
+
+
+def get_template_configs(threshold=0.9):
+    """获取基准测试使用的模板配置"""
+    return [
+        {"name": name, "path": os.path.join(TEMPLATE_DIR, file_name), "threshold": threshold}
+        for name, file_name in TEMPLATE_FILES
+    ]
+
+
+def ocr_region_size(window_size=(1920, 1080)):
+    """按照 FishingBot 的规则计算模板匹配区域尺寸 (width, height)"""
+    return int(window_size[0] * 0.33), int(window_size[1] * 0.16)
+
+
+def make_ocr_frame(template_img=None, window_size=(1920, 1080), location=None, seed=0):
+    """
+    生成合成的模板匹配区域帧
+
+    参数:
+        template_img: 要贴入帧中的模板图像（BGRA），为None时生成空闲帧
+        window_size: 窗口尺寸，用于计算区域大小
+        location: 模板左上角位置，默认放在区域右下部
+        seed: 随机种子
+
+    返回:
+        BGR格式的numpy数组
+    """
+    width, height = ocr_region_size(window_size)
+    rng = np.random.default_rng(seed)
+    # 游戏画面背景整体偏暗，二值化后基本为黑
+    frame = rng.integers(0, 160, size=(height, width, 3), dtype=np.uint8)
+
+    if template_img is not None:
+        t_h, t_w = template_img.shape[:2]
+        if location is None:
+            location = (width - t_w - width // 5, height - t_h - height // 4)
+        x, y = location
+        bgr = template_img[:, :, :3]
+        alpha = template_img[:, :, 3] > 0 if template_img.shape[2] == 4 else np.ones((t_h, t_w), bool)
+        roi = frame[y:y + t_h, x:x + t_w]
+        roi[alpha] = bgr[alpha]
+
+    return frame
+
+
+def scale_template_image(template_img, scale):
+    """按整数倍放大模板图像（最近邻），用于模拟没有随附模板的高分辨率"""
+    if scale == 1:
+        return template_img
+    return np.repeat(np.repeat(template_img, scale, axis=0), scale, axis=1)
+
+
+def make_benchmark_set(templates, window_size=(1920, 1080), positions=4, idle_frames=8, scale=1, seed=0):
+    """
+    生成各匹配引擎共用的带标注的基准帧集合
+
+    参数:
+        templates: 模板名称 -> 模板图像（BGRA）
+        window_size: 窗口尺寸（放大前）
+        positions: 每个模板放置的随机位置数
+        idle_frames: 不含模板的空闲帧数
+        scale: 帧和模板的放大倍数（如2倍模拟1080p模板下的4K画面）
+        seed: 随机种子
+
+    返回:
+        列表 [(模板名称或None, 模板左上角位置或None, BGR帧)]
+    """
+    rng = np.random.default_rng(seed)
+    width, height = ocr_region_size(window_size)
+    samples = []
+    for i in range(idle_frames):
+        frame = make_ocr_frame(window_size=window_size, seed=seed + i)
+        samples.append((None, None, scale_template_image(frame, scale)))
+    for name, template_img in templates.items():
+        t_h, t_w = template_img.shape[:2]
+        for i in range(positions):
+            location = (int(rng.integers(0, width - t_w)), int(rng.integers(0, height - t_h)))
+            frame = make_ocr_frame(template_img, window_size, location, seed=seed + idle_frames + i)
+            samples.append((name, (location[0] * scale, location[1] * scale), scale_template_image(frame, scale)))
+    return samples
+
+
+def make_state_dataset(templates, window_size=(1920, 1080), frames_per_class=20, jitter=3, distractors=2, seed=0):
+    """
+    生成状态识别用的带标注帧集合：模板贴在游戏中提示的固定位置附近（±jitter像素），
+    每帧另外画几个随机的亮色小块模拟特效和场景中的高亮物体
+
+    参数:
+        templates: 模板名称 -> 模板图像（BGRA）
+        window_size: 窗口尺寸
+        frames_per_class: 每个模板（以及无提示）的帧数
+        jitter: 模板位置的随机偏移范围（像素）
+        distractors: 每帧的亮色小块数量
+        seed: 随机种子
+
+    返回:
+        列表 [(模板名称或None, BGR帧)]
+    """
+    rng = np.random.default_rng(seed)
+    width, height = ocr_region_size(window_size)
+    samples = []
+    for name in [None] + list(templates):
+        for _ in range(frames_per_class):
+            template_img = templates.get(name) if name is not None else None
+            location = None
+            if template_img is not None:
+                t_h, t_w = template_img.shape[:2]
+                x = width - t_w - width // 5 + int(rng.integers(-jitter, jitter + 1))
+                y = height - t_h - height // 4 + int(rng.integers(-jitter, jitter + 1))
+                location = (x, y)
+            frame = make_ocr_frame(template_img, window_size, location, seed=int(rng.integers(1 << 30)))
+            for _ in range(distractors):
+                w, h = int(rng.integers(2, 12)), int(rng.integers(2, 12))
+                x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+                frame[y:y + h, x:x + w] = 255
+            samples.append((name, frame))
+    return samples
+
+
+def time_calls(func, iterations=200, warmup=10):
+    """
+    测量函数单次调用耗时
+
+    返回:
+        字典，包含mean/p50/p95（毫秒）
+    """
+    for _ in range(warmup):
+        func()
+
+    samples = np.empty(iterations, dtype=np.float64)
+    for i in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples[i] = (time.perf_counter() - start) * 1000.0
+
+    return {
+        "mean": float(samples.mean()),
+        "p50": float(np.percentile(samples, 50)),
+        "p95": float(np.percentile(samples, 95)),
+    }
+
+
+def format_timing(label, stats):
+    """格式化计时结果"""
+    return f"{label:<28} mean={stats['mean']:.3f}ms  p50={stats['p50']:.3f}ms  p95={stats['p95']:.3f}ms"
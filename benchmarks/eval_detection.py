@@ -0,0 +1,330 @@
+"""
+识别效果评估
+
+在带标注的帧数据集上运行状态识别器（模板匹配或最近质心分类器），统计各状态的混淆矩阵、
+各模板的精确率和召回率、各模板的得分分布（帧中有/没有该模板时分别统计）以及每帧耗时的 p50/p95/p99。
+数据集按分块交给进程池并行处理，结果保存为JSON，调整阈值前后的结果可以用 --baseline 对比
+
+数据集为一个目录，包含模板匹配区域的截图和标注文件 labels.json：
+    {"window": [1920, 1080], "frames": [{"file": "000000.png", "label": "收线"}, {"file": "000001.png", "label": null}]}
+
+每帧独立识别，不使用位置跟踪和结果备忘；每个进程内 OpenCV 单线程运行，耗时为单核耗时
+
+用法:
+    python -m benchmarks.eval_detection --export-synthetic datasets/synthetic_1080p
+    python -m benchmarks.eval_detection datasets/synthetic_1080p [更多数据集...] --threshold 0.85 --output eval.json
+    python -m benchmarks.eval_detection datasets/xxx --detector centroid --model models/centroid/1920x1080.npz
+    python -m benchmarks.eval_detection datasets/xxx --output eval_after.json --baseline eval_before.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from benchmarks.common import get_template_configs, make_state_dataset
+from bot.state_machine import FishingState, STATE_NAMES, TEMPLATE_STATES
+from capture.frame_source import read_image
+from match.engines import ENGINES
+
+logger = logging.getLogger(__name__)
+
+LABEL_FILE = "labels.json"
+# 得分直方图的区间数（[0, 1] 等分）
+HISTOGRAM_BINS = 20
+
+# 工作进程内按 (识别器参数, 窗口尺寸) 缓存的识别器
+_detectors = {}
+
+
+def load_dataset(directory):
+    """
+    加载数据集的标注文件
+
+    返回:
+        字典 {"name", "directory", "window", "frames": [(文件名, 标签)]}，标注文件不存在或无效时返回None；
+        name 为规范化的绝对路径，不同目录下的同名数据集不会混在一起
+    """
+    path = os.path.join(directory, LABEL_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            labels = json.load(f)
+        frames = [(item["file"], item.get("label")) for item in labels["frames"]]
+        return {"name": os.path.normpath(os.path.abspath(directory)), "directory": directory,
+                "window": tuple(labels["window"]), "frames": frames}
+    except Exception as e:
+        logger.error(f"加载数据集 {path} 失败: {e}")
+        return None
+
+
+def export_synthetic(directory, window_size, frames_per_class=40, jitter=2, seed=0):
+    """生成合成的带标注数据集（每个模板和无提示各 frames_per_class 帧），返回帧数"""
+    from match.template_matcher import TemplateMatcher
+
+    matcher = TemplateMatcher()
+    matcher.load_templates(get_template_configs(), window_size)
+    templates = {name: info["image"] for name, info in matcher.templates.items()}
+    samples = make_state_dataset(templates, window_size, frames_per_class, jitter, seed=seed)
+
+    os.makedirs(directory, exist_ok=True)
+    frames = []
+    for i, (label, frame) in enumerate(samples):
+        file_name = f"{i:06d}.png"
+        # imencode + tofile 兼容Windows下的中文路径
+        cv2.imencode(".png", frame)[1].tofile(os.path.join(directory, file_name))
+        frames.append({"file": file_name, "label": label})
+    with open(os.path.join(directory, LABEL_FILE), "w", encoding="utf-8") as f:
+        json.dump({"window": list(window_size), "frames": frames}, f, ensure_ascii=False, indent=2)
+    return len(frames)
+
+
+def create_detector(spec, window_size):
+    """
+    按参数创建识别器
+
+    参数:
+        spec: 识别器参数字典 {"detector": "template"|"centroid", "threshold", "engine", "prefilter", "model"}
+        window_size: 窗口尺寸，用于选择模板
+
+    返回:
+        识别器，模型文件无法加载时返回None
+    """
+    if spec["detector"] == "centroid":
+        from match.centroid_classifier import CentroidClassifier
+        return CentroidClassifier.load(spec["model"])
+
+    from match.template_matcher import TemplateMatcher
+    matcher = TemplateMatcher(spec["engine"])
+    matcher.load_templates(get_template_configs(spec["threshold"]), window_size)
+    matcher.tracking_enabled = False
+    matcher.memo_enabled = False
+    matcher.prefilter_enabled = spec["prefilter"]
+    return matcher
+
+
+def evaluate_chunk(spec, directory, window_size, frames):
+    """
+    在工作进程中识别一组帧
+
+    返回:
+        列表，每帧一个字典 {"file", "label", "predicted", "score", "scores", "latency_ms"}
+    """
+    key = (json.dumps(spec, sort_keys=True), tuple(window_size))
+    detector = _detectors.get(key)
+    if detector is None:
+        # 工作进程重新导入 config_manager 时日志级别会恢复为INFO
+        logging.getLogger().setLevel(logging.WARNING)
+        cv2.setNumThreads(1)
+        detector = create_detector(spec, window_size)
+        if detector is None:
+            raise RuntimeError(f"无法创建识别器: {spec}")
+        _detectors[key] = detector
+
+    records = []
+    for file_name, label in frames:
+        frame = read_image(os.path.join(directory, file_name))
+        if frame is None:
+            continue
+        start = time.perf_counter()
+        result = detector.match_template(frame)
+        latency = (time.perf_counter() - start) * 1000.0
+        records.append({
+            "file": file_name,
+            "label": label,
+            "predicted": result["name"] if result else None,
+            "score": float(result["score"]) if result else None,
+            "scores": detector.score_templates(frame),
+            "latency_ms": latency,
+        })
+    return records
+
+
+def _state_name(template_name):
+    """模板名称对应的状态名称，没有模板时为"未开始\""""
+    return STATE_NAMES[TEMPLATE_STATES.get(template_name, FishingState.IDLE)]
+
+
+def _distribution(values):
+    """得分分布：数量、分位数和 [0, 1] 上的直方图"""
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values, dtype=np.float64)
+    histogram, _ = np.histogram(np.clip(values, 0.0, 1.0), bins=HISTOGRAM_BINS, range=(0.0, 1.0))
+    return {
+        "count": int(len(values)),
+        "min": float(values.min()),
+        "p5": float(np.percentile(values, 5)),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "max": float(values.max()),
+        "histogram": histogram.tolist(),
+    }
+
+
+def summarize(records, template_names):
+    """
+    汇总识别结果
+
+    返回:
+        字典：帧数、准确率、各状态混淆矩阵（真实状态 -> 识别状态 -> 帧数）、各模板的精确率/召回率和得分分布、耗时分位数
+    """
+    states = [STATE_NAMES[state] for state in FishingState]
+    confusion = {actual: dict.fromkeys(states, 0) for actual in states}
+    templates = {}
+    for name in template_names:
+        tp = sum(1 for r in records if r["predicted"] == name and r["label"] == name)
+        fp = sum(1 for r in records if r["predicted"] == name and r["label"] != name)
+        fn = sum(1 for r in records if r["predicted"] != name and r["label"] == name)
+        positive = [r["scores"][name] for r in records if r["label"] == name and name in r["scores"]]
+        negative = [r["scores"][name] for r in records if r["label"] != name and name in r["scores"]]
+        templates[name] = {
+            "tp": tp, "fp": fp, "fn": fn,
+            "precision": tp / (tp + fp) if tp + fp else None,
+            "recall": tp / (tp + fn) if tp + fn else None,
+            # 有该模板的帧中最低得分与没有该模板的帧中最高得分之差，大于0时存在能完全区分的阈值
+            "margin": min(positive) - max(negative) if positive and negative else None,
+            "scores": {"positive": _distribution(positive), "negative": _distribution(negative)},
+        }
+    for r in records:
+        confusion[_state_name(r["label"])][_state_name(r["predicted"])] += 1
+
+    latencies = np.asarray([r["latency_ms"] for r in records], dtype=np.float64)
+    latency = {"count": 0}
+    if len(latencies):
+        latency = {"mean": float(latencies.mean()), "p50": float(np.percentile(latencies, 50)),
+                   "p95": float(np.percentile(latencies, 95)), "p99": float(np.percentile(latencies, 99)),
+                   "max": float(latencies.max())}
+    return {
+        "frames": len(records),
+        "accuracy": sum(r["predicted"] == r["label"] for r in records) / len(records) if records else None,
+        "confusion": confusion,
+        "templates": templates,
+        "latency_ms": latency,
+    }
+
+
+def print_summary(title, summary):
+    """输出汇总结果"""
+    if not summary["frames"]:
+        print(f"== {title}: 没有可用的帧")
+        return
+    print(f"== {title}: {summary['frames']} 帧, 准确率 {summary['accuracy'] * 100:.1f}%")
+    states = list(summary["confusion"])
+    print("混淆矩阵（行为真实状态，列为识别状态）:")
+    print(f"{'':>10}" + "".join(f"{state:>10}" for state in states))
+    for actual in states:
+        print(f"{actual:>10}" + "".join(f"{summary['confusion'][actual][state]:>10}" for state in states))
+    print(f"{'模板':>8} {'精确率':>7} {'召回率':>7} {'有模板得分p5':>12} {'无模板得分p95':>12} {'间隔':>8}")
+    for name, stats in summary["templates"].items():
+        precision = f"{stats['precision'] * 100:.1f}%" if stats["precision"] is not None else "-"
+        recall = f"{stats['recall'] * 100:.1f}%" if stats["recall"] is not None else "-"
+        positive, negative = stats["scores"]["positive"], stats["scores"]["negative"]
+        p5 = f"{positive['p5']:.3f}" if positive["count"] else "-"
+        p95 = f"{negative['p95']:.3f}" if negative["count"] else "-"
+        margin = f"{stats['margin']:+.3f}" if stats["margin"] is not None else "-"
+        print(f"{name:>8} {precision:>10} {recall:>10} {p5:>14} {p95:>16} {margin:>10}")
+    latency = summary["latency_ms"]
+    if "p50" in latency:
+        print(f"每帧耗时: mean={latency['mean']:.3f}ms  p50={latency['p50']:.3f}ms  "
+              f"p95={latency['p95']:.3f}ms  p99={latency['p99']:.3f}ms")
+
+
+def print_comparison(summary, baseline):
+    """与之前保存的结果对比准确率、各模板的精确率/召回率和耗时"""
+    def delta(value, before, scale=100.0, unit="%"):
+        if value is None or before is None:
+            return "-"
+        return f"{value * scale:.1f}{unit} ({(value - before) * scale:+.1f})"
+
+    print("== 与基线对比")
+    print(f"准确率: {delta(summary['accuracy'], baseline.get('accuracy'))}")
+    for name, stats in summary["templates"].items():
+        before = baseline.get("templates", {}).get(name, {})
+        print(f"  {name}: 精确率 {delta(stats['precision'], before.get('precision'))}, "
+              f"召回率 {delta(stats['recall'], before.get('recall'))}")
+    for key in ("p50", "p95", "p99"):
+        print(f"  耗时 {key}: {delta(summary['latency_ms'].get(key), baseline.get('latency_ms', {}).get(key), 1.0, 'ms')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在带标注的帧数据集上评估状态识别效果")
+    parser.add_argument("datasets", nargs="*", help="数据集目录（包含 labels.json）")
+    parser.add_argument("--detector", choices=["template", "centroid"], default="template")
+    parser.add_argument("--threshold", type=float, default=0.9, help="模板匹配阈值（_get_template_configs 的 threshold）")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="opencv", help="模板匹配引擎")
+    parser.add_argument("--no-prefilter", action="store_true", help="不使用网格密度预筛选")
+    parser.add_argument("--model", default=None, help="最近质心分类器的模型文件")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="进程数")
+    parser.add_argument("--chunk-size", type=int, default=32, help="每个任务处理的帧数")
+    parser.add_argument("--output", default=None, help="将结果保存为JSON文件")
+    parser.add_argument("--baseline", default=None, help="与之前保存的结果JSON对比")
+    parser.add_argument("--export-synthetic", default=None, metavar="DIR", help="生成合成的带标注数据集后退出")
+    parser.add_argument("--resolution", choices=["720p", "1080p"], default="1080p", help="合成数据集的分辨率")
+    args = parser.parse_args()
+
+    # config_manager 导入时已按INFO级别配置了根日志，这里直接调整级别
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.export_synthetic:
+        window_size = (1280, 720) if args.resolution == "720p" else (1920, 1080)
+        count = export_synthetic(args.export_synthetic, window_size)
+        print(f"已生成合成数据集: {args.export_synthetic} ({count} 帧)")
+        return
+    if not args.datasets:
+        parser.error("需要指定数据集目录，或使用 --export-synthetic 生成合成数据集")
+    if args.detector == "centroid" and not args.model:
+        parser.error("--detector centroid 需要指定 --model")
+
+    spec = {"detector": args.detector, "threshold": args.threshold, "engine": args.engine,
+            "prefilter": not args.no_prefilter, "model": args.model}
+    # 同一目录重复指定时只评估一次
+    datasets = {}
+    for dataset in map(load_dataset, args.datasets):
+        if dataset and dataset["name"] not in datasets:
+            datasets[dataset["name"]] = dataset
+    datasets = list(datasets.values())
+    if not datasets:
+        print("没有可用的数据集")
+        return
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {}
+        for dataset in datasets:
+            frames = dataset["frames"]
+            futures[dataset["name"]] = [
+                executor.submit(evaluate_chunk, spec, dataset["directory"], dataset["window"],
+                                frames[i:i + args.chunk_size])
+                for i in range(0, len(frames), args.chunk_size)
+            ]
+        results = {name: [record for future in chunk_futures for record in future.result()]
+                   for name, chunk_futures in futures.items()}
+    elapsed = time.perf_counter() - start
+
+    template_names = [config["name"] for config in get_template_configs()]
+    report = {"detector": spec, "created": time.strftime("%Y-%m-%d %H:%M:%S"), "wall_seconds": elapsed,
+              "datasets": {name: summarize(records, template_names) for name, records in results.items()}}
+    report["overall"] = summarize([record for records in results.values() for record in records], template_names)
+
+    print(f"识别器: {spec}, 数据集: {len(datasets)}, 进程数: {args.workers}, 耗时: {elapsed:.1f}s")
+    if len(datasets) > 1:
+        for name, summary in report["datasets"].items():
+            print_summary(name, summary)
+    print_summary("全部数据集", report["overall"])
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            print_comparison(report["overall"], json.load(f)["overall"])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,13 @@ def ensure_resolution_folders():
 # 在导入时执行
 ensure_resolution_folders()
 
-from .fishing_bot import FishingBot
+__all__ = ['FishingBot']
 
-__all__ = ['FishingBot'] 
\ No newline at end of file
+
+def __getattr__(name):
+    # FishingBot依赖Windows窗口和输入接口，延迟到首次访问时导入，
+    # 使状态处理器、回放模拟器等子模块可以在其他平台上单独使用
+    if name == 'FishingBot':
+        from .fishing_bot import FishingBot
+        return FishingBot
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}") 
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+取消令牌
+状态处理器切换到收线状态时取消令牌，鱼线处理中正在进行的等待和按住按键会立即结束，
+主循环不必等拉扯鱼线的固定延时走完才开始收线点击
+"""
+
+import threading
+
+from bot.clock import MonotonicClock
+
+
+class CancellationToken:
+    """可与时钟配合中断等待的取消令牌"""
+
+    def __init__(self, clock=None):
+        """
+        参数:
+            clock: 时钟（可选），取消时通过它唤醒可中断的等待，默认为单调时钟
+        """
+        self.clock = clock or MonotonicClock()
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._cancelled_at = None
+        self._reason = ""
+        self._consumed = True
+
+    @property
+    def cancelled(self):
+        """是否已被取消"""
+        return self._cancelled
+
+    @property
+    def cancelled_at(self):
+        """取消时的时钟时间，未取消时为None"""
+        return self._cancelled_at
+
+    @property
+    def reason(self):
+        """取消原因"""
+        return self._reason
+
+    def cancel(self, reason=""):
+        """
+        取消令牌并唤醒所有可中断的等待，重复取消不会更新取消时间
+
+        返回:
+            True表示本次调用完成了取消，False表示令牌此前已被取消
+        """
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._cancelled = True
+            self._cancelled_at = self.clock.time()
+            self._reason = reason
+            self._consumed = False
+        self.clock.notify()
+        return True
+
+    def reset(self):
+        """重置为未取消状态（进入新一轮拉扯鱼线时调用）"""
+        with self._lock:
+            self._cancelled = False
+            self._cancelled_at = None
+            self._reason = ""
+            self._consumed = True
+
+    def consume(self):
+        """
+        取出本次取消的时间，每次取消只会返回一次，用于统计取消到首次响应的延迟
+
+        返回:
+            取消时的时钟时间，未取消或已取出时返回None
+        """
+        with self._lock:
+            if not self._cancelled or self._consumed:
+                return None
+            self._consumed = True
+            return self._cancelled_at
+
+    def wait(self, seconds):
+        """
+        等待指定秒数，令牌被取消时立即返回
+
+        返回:
+            True表示等待因取消而提前结束，False表示等待完成
+        """
+        deadline = self.clock.time() + seconds
+        while not self._cancelled:
+            remaining = deadline - self.clock.time()
+            if remaining <= 0:
+                return False
+            self.clock.wait(remaining)
+        return True
@@ -0,0 +1,208 @@
+"""
+时钟
+机器人各处理器的等待和计时都通过时钟对象完成：
+    MonotonicClock: 单调时钟，不受系统时间调整影响（默认）
+    HighResolutionClock: 高精度时钟，短等待在最后阶段自旋，不受系统定时器粒度（Windows下约15.6ms）限制
+    VirtualClock: 虚拟时钟，离线回放时使用，等待只推进虚拟时间而不真正阻塞
+
+sleep() 等待固定时长；wait() 是可中断的等待，状态变化时调用 notify() 会立即唤醒所有 wait() 中的线程
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+
+
+class Clock(ABC):
+    """时钟基类，提供可中断等待的通知机制，实现类必须提供 time() 和 sleep()"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._generation = 0
+
+    @abstractmethod
+    def time(self):
+        """当前时间（秒）"""
+
+    @abstractmethod
+    def sleep(self, seconds):
+        """等待指定秒数，不会被 notify() 打断（用于按键间隔等需要固定时长的等待）"""
+
+    def wait(self, seconds):
+        """
+        可中断的等待
+
+        参数:
+            seconds: 最长等待时间（秒）
+
+        返回:
+            True表示被 notify() 提前唤醒，False表示等待超时
+        """
+        with self._condition:
+            generation = self._generation
+            return self._condition.wait_for(lambda: self._generation != generation, max(0.0, seconds))
+
+    def notify(self):
+        """唤醒所有 wait() 中的线程（例如状态发生变化时）"""
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+
+class MonotonicClock(Clock):
+    """单调时钟"""
+
+    def time(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class HighResolutionClock(Clock):
+    """
+    高精度时钟
+
+    计时使用 perf_counter；等待先交给系统休眠，剩余不足 spin_threshold 的部分自旋等待，
+    使10ms级的按键和点击间隔不会被系统定时器粒度拉长
+    """
+
+    def __init__(self, spin_threshold=0.002):
+        """
+        参数:
+            spin_threshold: 自旋等待的时长（秒）
+        """
+        super().__init__()
+        self.spin_threshold = spin_threshold
+
+    def time(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        deadline = time.perf_counter() + seconds
+        coarse = seconds - self.spin_threshold
+        if coarse > 0:
+            time.sleep(coarse)
+        while time.perf_counter() < deadline:
+            time.sleep(0)
+
+    def wait(self, seconds):
+        deadline = time.perf_counter() + seconds
+        with self._condition:
+            generation = self._generation
+            coarse = seconds - self.spin_threshold
+            if coarse > 0 and self._condition.wait_for(lambda: self._generation != generation, coarse):
+                return True
+        while time.perf_counter() < deadline:
+            if self._generation != generation:
+                return True
+            time.sleep(0)
+        return self._generation != generation
+
+
+class VirtualClock(Clock):
+    """
+    虚拟时钟
+
+    参与回放的线程等待时只登记唤醒时间，当所有参与线程都在等待时，
+    时钟直接跳到最早的唤醒时间并唤醒对应线程。线程的计算不消耗虚拟时间，
+    因此整段会话可以远快于实时地回放
+    """
+
+    # 检查已退出线程的真实时间间隔（秒）
+    _POLL_INTERVAL = 0.01
+
+    def __init__(self, start=0.0):
+        super().__init__()
+        self._now = start
+        self._threads = set()
+        self._waiting = {}
+        self._released = False
+
+    def time(self):
+        """当前虚拟时间（秒）"""
+        return self._now
+
+    def register(self, thread=None):
+        """
+        登记参与回放的线程，只有所有登记线程都在等待时时钟才会推进
+
+        参数:
+            thread: 线程对象，默认为当前线程
+        """
+        with self._condition:
+            self._threads.add(thread or threading.current_thread())
+
+    def sleep(self, seconds):
+        """等待指定的虚拟时间"""
+        self._wait(seconds, interruptible=False)
+
+    def wait(self, seconds):
+        """可中断地等待指定的虚拟时间"""
+        return self._wait(seconds, interruptible=True)
+
+    def _wait(self, seconds, interruptible):
+        current = threading.current_thread()
+        with self._condition:
+            if self._released:
+                return False
+            self._threads.add(current)
+            generation = self._generation
+            wake_time = self._now + max(0.0, seconds)
+            # 可中断的等待同时登记开始等待时的通知代数，被通知后在本线程醒来之前时钟不能继续推进
+            self._waiting[current] = (wake_time, generation if interruptible else None)
+            try:
+                while not self._released:
+                    if interruptible and self._generation != generation:
+                        return True
+                    if self._now >= wake_time:
+                        return False
+                    self._advance()
+                    # 时钟可能正好推进到本线程的唤醒时间，此时不需要再等待
+                    if self._now < wake_time:
+                        self._condition.wait(self._POLL_INTERVAL)
+                return False
+            finally:
+                del self._waiting[current]
+
+    def advance(self, seconds):
+        """从外部推进虚拟时间（无参与线程时使用）"""
+        with self._condition:
+            self._now += max(0.0, seconds)
+            self._condition.notify_all()
+
+    def release(self):
+        """结束回放，之后所有等待立即返回，用于让各线程退出"""
+        with self._condition:
+            self._released = True
+            self._condition.notify_all()
+
+    def _advance(self):
+        """所有存活的登记线程都在等待时，跳到最早的唤醒时间"""
+        self._threads = {thread for thread in self._threads if thread.is_alive()}
+        if any(thread not in self._waiting for thread in self._threads):
+            return
+        if any(generation is not None and generation != self._generation
+               for _, generation in self._waiting.values()):
+            return
+        next_time = min(wake_time for wake_time, _ in self._waiting.values())
+        if next_time > self._now:
+            self._now = next_time
+            self._condition.notify_all()
+
+
+CLOCKS = {
+    "monotonic": MonotonicClock,
+    "high_resolution": HighResolutionClock,
+}
+
+
+def create_clock(name="monotonic"):
+    """
+    按名称创建时钟
+
+    参数:
+        name: "monotonic" 或 "high_resolution"，未知名称时使用单调时钟
+    """
+    return CLOCKS.get(name, MonotonicClock)()
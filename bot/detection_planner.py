@@ -0,0 +1,121 @@
+"""
+检测计划
+根据当前钓鱼状态决定每帧匹配哪些模板以及匹配顺序：
+只匹配状态机转换表中接下来可能出现的模板，按钓鱼流程中的先后排序，
+某个模板得分足够高时不再匹配其余模板；每隔固定帧数做一次全部模板的完整匹配作为兜底
+"""
+
+import logging
+
+from bot.state_machine import FishingState, StateMachine, TEMPLATE_STATES
+
+logger = logging.getLogger(__name__)
+
+# 钓鱼流程中状态出现的先后顺序，用于给接下来可能出现的模板排序
+CYCLE_ORDER = (FishingState.HOOK, FishingState.PULL, FishingState.REEL, FishingState.SKIP)
+
+
+def _cycle_distance(state, target):
+    """target 在钓鱼流程中距离 state 的步数，当前状态自身为0"""
+    if target == state:
+        return 0
+    if state not in CYCLE_ORDER:
+        return CYCLE_ORDER.index(target) + 1
+    return (CYCLE_ORDER.index(target) - CYCLE_ORDER.index(state)) % len(CYCLE_ORDER)
+
+
+class DetectionPlanner:
+    """按状态选择模板的检测计划"""
+
+    def __init__(self, matcher, state_machine=None, high_confidence=0.95, full_sweep_interval=10):
+        """
+        参数:
+            matcher: 模板匹配器，需要提供 templates 和 match_templates()
+            state_machine: 状态机（可选），用于查询接下来可能出现的模板，默认使用默认转换表
+            high_confidence: 得分达到该值时提前结束本帧的匹配
+            full_sweep_interval: 每隔多少帧做一次全部模板的完整匹配，0表示不做
+        """
+        self.matcher = matcher
+        self.state_machine = state_machine or StateMachine()
+        self.high_confidence = high_confidence
+        self.full_sweep_interval = full_sweep_interval
+        # (状态, 已加载模板, 是否完整匹配) -> 匹配顺序
+        self._plans = {}
+
+        # 统计
+        self.frames = 0
+        self.templates_evaluated = 0
+        self.baseline_evaluated = 0
+        self.full_sweeps = 0
+        self.early_exits = 0
+
+    def plan(self, state, full=False):
+        """
+        获取指定状态下的模板匹配顺序
+
+        参数:
+            state: 当前状态
+            full: 是否包含全部已加载的模板（不可能出现的模板排在最后）
+
+        返回:
+            tuple: 模板名称
+        """
+        loaded = tuple(self.matcher.templates)
+        key = (state, loaded, full)
+        plan = self._plans.get(key)
+        if plan is None:
+            state = FishingState(state)
+            plausible = set(self.state_machine.next_templates(state))
+            names = [name for name in loaded if full or name in plausible]
+            # 可能出现的模板在前，同一状态的模板保持加载顺序，其余按钓鱼流程中的先后排序
+            names.sort(key=lambda name: (
+                name not in plausible,
+                _cycle_distance(state, TEMPLATE_STATES[name]) if name in TEMPLATE_STATES else len(CYCLE_ORDER),
+            ))
+            plan = tuple(names)
+            self._plans[key] = plan
+        return plan
+
+    def detect(self, frame, state):
+        """
+        按检测计划匹配一帧
+
+        参数:
+            frame: 模板匹配区域图像
+            state: 当前状态
+
+        返回:
+            最佳匹配结果字典或None（与 match_template 相同）
+        """
+        self.frames += 1
+        full = self.full_sweep_interval > 0 and self.frames % self.full_sweep_interval == 0
+        if full:
+            # 兜底：匹配全部模板，不提前结束
+            result, evaluated = self.matcher.match_templates(frame, self.plan(state, full=True))
+            self.full_sweeps += 1
+        else:
+            plan = self.plan(state)
+            result, evaluated = self.matcher.match_templates(frame, plan, self.high_confidence)
+            if evaluated < len(plan):
+                self.early_exits += 1
+
+        self.templates_evaluated += evaluated
+        # 不使用检测计划时每帧都会匹配全部模板
+        self.baseline_evaluated += len(self.matcher.templates)
+        return result
+
+    def get_stats(self):
+        """
+        获取检测计划统计
+
+        返回:
+            dict: 帧数、平均每帧匹配的模板数（使用前后）、完整匹配和提前结束的次数
+        """
+        frames = max(self.frames, 1)
+        return {
+            "frames": self.frames,
+            "templates_per_frame": self.templates_evaluated / frames,
+            "baseline_templates_per_frame": self.baseline_evaluated / frames,
+            "full_sweeps": self.full_sweeps,
+            "early_exits": self.early_exits,
+        }
@@ -1,13 +1,21 @@
 import logging
 import os
+import time
 
 from Ui_Manage.WindowManager import WinControl
+from bot.clock import create_clock
 from bot.line_handler import LineHandler
 from bot.main_loop import MainLoopHandler
 from bot.state_handler import StateHandler
+from bot.state_machine import TEMPLATE_FILES
 from capture.ScreenCaptureExtractor import ScreenCaptureExtractor
+from capture.frame_bus import FrameBus
+from capture.calibration import load_anchors, template_search_regions
+from capture.region_capture import calculate_fishing_regions
+from capture.session_recorder import SessionRecorder, RecordingInputProxy
 from config_manager import config_manager, CONFIG
 from controller.KeyboardController import get_input_handler
+from match.centroid_classifier import CentroidClassifier, model_path
 from match.template_matcher import TemplateMatcher
 
 # 配置日志
@@ -16,8 +24,13 @@ logger = logging.getLogger(__name__)
 class FishingBot:
     """钓鱼机器人类，实现自动钓鱼功能"""
     
-    def __init__(self):
-        """初始化钓鱼机器人"""
+    def __init__(self, frame_source=None, clock=None):
+        """初始化钓鱼机器人
+
+        参数:
+            frame_source: 帧来源（FrameSource实现），为None时使用GDI窗口截图
+            clock: 时钟（bot.clock中的实现），为None时按配置创建
+        """
         self.running = False
         self.stop_flag = False
         
@@ -57,14 +70,24 @@ class FishingBot:
             logger.error("未找到游戏窗口")
             # 不再退出，继续初始化其他组件
             
+        # 初始化帧来源：默认截取游戏窗口，也可注入图片目录、视频或合成帧来源
+        self._frame_source_injected = frame_source is not None
+        self.frame_source = frame_source if frame_source is not None else ScreenCaptureExtractor(self.hwnd)
+            
         # 初始化输入控制器
         self.input_handler = get_input_handler(self.config)
 
         # 设置F9键停止回调
         self.input_handler.external_on_key_press = self._on_f9_key_press
 
-        # 初始化模板匹配器，设置各种状态的模板
+        # 初始化模板匹配器，设置各种状态的模板；匹配引擎按部署配置选择
+        engine = config_manager.get("detection.engine.name", "opencv")
         self.template_matcher = TemplateMatcher()
+        self.template_matcher.set_engine(engine, config_manager.get(f"detection.engine.{engine}", {}))
+        self.template_matcher.prefilter_enabled = config_manager.get("detection.prefilter.enabled", True)
+        self.template_matcher.prefilter_grid = tuple(config_manager.get("detection.prefilter.grid", [4, 16]))
+        self.template_matcher.memo_enabled = config_manager.get("detection.memo.enabled", True)
+        self.template_matcher.memo_max_entries = config_manager.get("detection.memo.max_entries", 256)
 
         # 获取窗口尺寸
         window_width, window_height = self._get_window_size()
@@ -73,44 +96,46 @@ class FishingBot:
         self._load_templates(window_width, window_height)
         
         # 直接计算区域位置，不使用配置文件中的设置
-        # 面积检测区域：窗口中心区域，宽度和高度为窗口的1/3
-        area_width = int(window_width * 0.33)
-        area_height = int(window_height * 0.33)
-        area_x = (window_width - area_width) // 2
-        area_y = (window_height - area_height) // 2
-        
-        # 模板匹配区域：右下角区域，宽度为窗口的1/5，高度为窗口的1/6
-        ocr_width = int(window_width * 0.33)
-        ocr_height = int(window_height * 0.16)
-        ocr_x = window_width - ocr_width
-        ocr_y = window_height - ocr_height
+        # 面积检测区域为窗口中心1/3区域，模板匹配区域为右下角区域；
+        # 有当前分辨率的标定锚点时使用收缩后的区域，模板只在各自的锚点范围内搜索
+        anchors = None
+        if config_manager.get("capture.anchors.enabled", True):
+            anchors = load_anchors((window_width, window_height),
+                                   config_manager.get("capture.anchors.directory", "./anchors"))
+        regions = calculate_fishing_regions(window_width, window_height, anchors)
+        if anchors:
+            self.template_matcher.set_search_regions(template_search_regions(anchors, regions["ocr"]),
+                                                     regions["ocr"][2:])
+        ocr_x, ocr_y, ocr_width, ocr_height = regions["ocr"]
+        area_x, area_y, area_width, area_height = regions["area"]
         
         logger.info(f"模板匹配检测区域: x={ocr_x}, y={ocr_y}, w={ocr_width}, h={ocr_height}")
         logger.info(f"面积检测区域: x={area_x}, y={area_y}, w={area_width}, h={area_height}")
         
-        # 初始化屏幕截图提取器，为不同区域创建不同的提取器
-        self.temp_capture = ScreenCaptureExtractor(self.hwnd)
-        self.temp_capture.capture_region = (ocr_x, ocr_y, ocr_width, ocr_height)
-        # 设置提取器的位置为区域内的位置，而不是区域的左上角
-        self.temp_capture.positions = [(ocr_x + ocr_width // 2, ocr_y + ocr_height // 2)]
-        self.temp_capture.region_size = min(ocr_width, ocr_height) // 2  # 减小区域大小，避免超出范围
-        # 确保获取窗口尺寸并调整区域
-        self.temp_capture.update_window_size()
+        # 所有处理器共用同一个时钟，状态变化时可以唤醒其他处理器的等待；帧总线的帧龄也按该时钟计算
+        self.clock = clock if clock is not None else create_clock(config_manager.get("timing.clock", "monotonic"))
+        logger.info(f"使用时钟: {type(self.clock).__name__}")
+
+        # 确保获取窗口尺寸，再在帧总线上注册各检测区域
+        # 检测线程和鱼线处理同时截图时共享同一次整窗口截图，区域为该帧上的视图
+        self.frame_source.update_window_size()
+        # 连续的截图请求在最大帧龄内复用同一帧，按键之后的检测会要求新帧
+        max_frame_age = config_manager.get("capture.max_frame_age", 0.008)
+        self.frame_bus = FrameBus(self.frame_source, max_age=max_frame_age, clock=self.clock)
+        self.temp_capture = self.frame_bus.register_roi("ocr", regions["ocr"])
         self.temp_capture.adjust_region_to_window_bounds()
         
-        self.area_capture = ScreenCaptureExtractor(self.hwnd)
-        self.area_capture.capture_region = (area_x, area_y, area_width, area_height)
-        # 设置提取器的位置为区域内的位置，而不是区域的左上角
-        self.area_capture.positions = [(area_x + area_width//2, area_y + area_height//2)]
-        self.area_capture.region_size = min(area_width, area_height) // 2  # 减小区域大小，避免超出范围
-        # 确保获取窗口尺寸并调整区域
-        self.area_capture.update_window_size()
+        self.area_capture = self.frame_bus.register_roi("area", regions["area"])
         self.area_capture.adjust_region_to_window_bounds()
         
         # 初始化子模块
-        self.state_handler = StateHandler(self.template_matcher, self.temp_capture, self.input_handler)
-        self.line_handler = LineHandler(self.input_handler, self.area_capture, self.state_handler)
-        self.main_loop_handler = MainLoopHandler(self.state_handler, self.input_handler, self.line_handler)
+        state_detector = self._create_state_detector((window_width, window_height), regions["ocr"])
+        self.state_handler = StateHandler(state_detector, self.temp_capture, self.input_handler, clock=self.clock)
+        self.line_handler = LineHandler(self.input_handler, self.area_capture, self.state_handler, clock=self.clock)
+        self.main_loop_handler = MainLoopHandler(self.state_handler, self.input_handler, self.line_handler, clock=self.clock)
+
+        # 会话录制器，按配置在启动时创建
+        self.recorder = None
 
         # 初始化键盘监听器
         self.keyboard_listener = None
@@ -165,7 +190,12 @@ class FishingBot:
         window_width = 1920
         window_height = 1080
 
-        if self.game_window_found:
+        if self._frame_source_injected:
+            # 注入的帧来源自带画面尺寸
+            window_width = self.frame_source.window_width
+            window_height = self.frame_source.window_height
+            logger.info(f"使用帧来源尺寸: {window_width}x{window_height}")
+        elif self.game_window_found:
             window_rect = self.window_manager.get_window_rect(self.hwnd)
             if window_rect:
                 window_width = window_rect[2] - window_rect[0]
@@ -183,13 +213,25 @@ class FishingBot:
         template_dir = self._get_template_dir()
 
         return [
-            {"name": "收竿", "path": os.path.join(template_dir, "collect.png"), "threshold": threshold},
-            {"name": "提竿", "path": os.path.join(template_dir, "cast.png"), "threshold": threshold},
-            {"name": "拉扯鱼线", "path": os.path.join(template_dir, "pull.png"), "threshold": threshold},
-            {"name": "收线", "path": os.path.join(template_dir, "reel.png"), "threshold": threshold},
-            {"name": "跳过", "path": os.path.join(template_dir, "skip.png"), "threshold": threshold},
+            {"name": name, "path": os.path.join(template_dir, file_name), "threshold": threshold}
+            for name, file_name in TEMPLATE_FILES
         ]
 
+    def _create_state_detector(self, window_size, ocr_region):
+        """按配置选择状态识别器：模板匹配器，或当前分辨率的最近质心分类模型（没有可用模型时使用模板匹配）"""
+        if config_manager.get("detection.detector.name", "template") != "centroid":
+            return self.template_matcher
+        path = model_path(window_size, config_manager.get("detection.detector.centroid.directory", "./models/centroid"))
+        classifier = CentroidClassifier.load(path)
+        if classifier is None:
+            logger.warning(f"没有可用的状态分类模型 {path}，使用模板匹配识别状态")
+            return self.template_matcher
+        if classifier.frame_shape and classifier.frame_shape != (ocr_region[3], ocr_region[2]):
+            logger.warning(f"状态分类模型的区域尺寸与当前模板匹配区域不符（锚点变化后需要重新训练），使用模板匹配识别状态")
+            return self.template_matcher
+        logger.info(f"使用最近质心分类器识别状态: {path}")
+        return classifier
+
     def _load_templates(self, window_width, window_height):
         """加载模板配置"""
         template_configs = self._get_template_configs()
@@ -206,15 +248,20 @@ class FishingBot:
             if not self.game_window_found:
                 logger.error("未找到游戏窗口")
                 return False
+
+            # 同步新的窗口句柄到默认的截图来源
+            if not self._frame_source_injected:
+                self.frame_source.set_hwnd(self.hwnd)
+                self.frame_source.update_window_size()
         return True
 
     def _prepare_for_start(self, threshold=0.88):
         """准备启动的通用逻辑"""
-        # 检查游戏窗口
-        if not self._ensure_game_window():
+        # 检查游戏窗口（注入的帧来源不依赖游戏窗口）
+        if not self._frame_source_injected and not self._ensure_game_window():
             return False
 
-        # 获取窗口尺寸并加载模板
+        # 获取窗口尺寸并加载模板，注入的帧来源使用其自带的画面尺寸
         window_width, window_height = self._get_window_size()
         self._load_templates(window_width, window_height)
 
@@ -225,8 +272,9 @@ class FishingBot:
         # 重置状态
         self.state_handler.reset_state()
 
-        # 激活游戏窗口
-        self.window_manager.activate_window(self.hwnd)
+        # 激活游戏窗口，使用注入的帧来源时没有需要激活的窗口
+        if not self._frame_source_injected:
+            self.window_manager.activate_window(self.hwnd)
 
         return True
     
@@ -255,6 +303,12 @@ class FishingBot:
         self.state_handler.set_running_state(True)
         self.main_loop_handler.set_running_state(True)
         
+        # 按配置启动后台截图线程
+        self._start_background_capture()
+
+        # 按配置开始会话录制
+        self._start_recording()
+        
         # 启动状态检测线程
         self.state_handler.start_detection()
         
@@ -282,6 +336,15 @@ class FishingBot:
         
         # 停止键盘监听
         self._stop_keyboard_listener()
+        
+        # 停止后台截图线程
+        self._stop_background_capture()
+
+        # 结束会话录制
+        self._stop_recording()
+        
+        # 记录帧总线统计，便于观察缓存减少了多少次截图
+        logger.info(f"帧总线统计: {self.frame_bus.get_stats()}")
             
         logger.info(f"钓鱼机器人已停止 - 成功钓鱼次数: {fishing_count_record}")
 
@@ -301,11 +364,75 @@ class FishingBot:
         # 只设置状态处理器的运行状态
         self.state_handler.set_running_state(True)
         
+        # 按配置启动后台截图线程
+        self._start_background_capture()
+
+        # 按配置开始会话录制
+        self._start_recording()
+        
         # 启动状态检测线程
         self.state_handler.start_detection()
         
         logger.info("已启动仅模板识别模式 - 不会执行任何钓鱼操作")
     
+    def _start_background_capture(self):
+        """按配置启动后台截图线程，仅默认的窗口截图来源支持"""
+        if self._frame_source_injected or not config_manager.get("capture.background.enabled", False):
+            return
+        self.frame_source.start_background_capture(
+            config_manager.get("capture.background.target_fps", 30),
+            config_manager.get("capture.background.buffer_size", 3)
+        )
+
+    def _stop_background_capture(self):
+        """停止后台截图线程并记录截图统计"""
+        if self._frame_source_injected:
+            return
+        self.frame_source.stop_background_capture()
+        logger.info(f"截图统计: {self.frame_source.get_capture_stats()}")
+
+    def _start_recording(self):
+        """按配置开始会话录制，录制检测区域帧、识别状态和按键事件"""
+        if not config_manager.get("capture.recording.enabled", False):
+            return
+        directory = config_manager.get("capture.recording.directory", "./recordings")
+        path = os.path.join(directory, time.strftime("session_%Y%m%d_%H%M%S.nkrec"))
+        try:
+            self.recorder = SessionRecorder(
+                path,
+                budget_bytes=int(config_manager.get("capture.recording.budget_mb", 512) * 1024 * 1024),
+                chunk_size=int(config_manager.get("capture.recording.chunk_mb", 4) * 1024 * 1024),
+                encoding=config_manager.get("capture.recording.encoding", "raw"),
+            )
+        except Exception as e:
+            logger.error(f"创建会话录制失败: {e}")
+            self.recorder = None
+            return
+
+        self.frame_bus.attach_recorder(self.recorder, config_manager.get("capture.recording.rois", ["ocr"]))
+        self.state_handler.subscribe(self._record_state_event)
+        # 按键事件通过代理录制，状态处理器只读取停止标志，不需要代理
+        recording_input = RecordingInputProxy(self.input_handler, self.recorder)
+        self.line_handler.input_handler = recording_input
+        self.main_loop_handler.input_handler = recording_input
+
+    def _stop_recording(self):
+        """结束会话录制并还原输入控制器"""
+        if self.recorder is None:
+            return
+        self.frame_bus.attach_recorder(None, ())
+        self.state_handler.unsubscribe(self._record_state_event)
+        self.line_handler.input_handler = self.input_handler
+        self.main_loop_handler.input_handler = self.input_handler
+        self.recorder.close()
+        self.recorder = None
+
+    def _record_state_event(self, event):
+        """将状态变化事件写入会话录制"""
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record_state(event.state, event.template, event.score)
+
     def _on_f9_key_press(self, key, key_char):
         """F9键按下回调，处理停止信号"""
         from pynput.keyboard import Key
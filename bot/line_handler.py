@@ -1,23 +1,42 @@
 import logging
+import os
 import cv2
 import numpy as np
 
+from bot.cancellation import CancellationToken
+from bot.clock import MonotonicClock
+from bot.state_machine import FishingState
+from capture.frame_utils import to_bgr
+from capture.region_capture import calculate_fishing_regions
+
 logger = logging.getLogger(__name__)
 
 class LineHandler:
     """处理鱼线拉扯的类"""
 
-    def __init__(self, input_handler, area_capture, state_handler=None):
+    # 判断是否已退出拉扯鱼线状态时检查的其他状态模板
+    OTHER_STATE_TEMPLATES = ["收线", "跳过", "收竿", "提竿"]
+
+    def __init__(self, input_handler, area_capture, state_handler=None, mouse=None, clock=None):
         """初始化鱼线处理器
 
         参数:
             input_handler: 输入处理器
             area_capture: 区域截图器
             state_handler: 状态处理器（用于检查收线状态）
+            mouse: 鼠标控制器（可选），默认在首次使用时导入 controller.MouseController.mouse
+            clock: 时钟（可选），默认与状态处理器共用同一个时钟
         """
         self.input_handler = input_handler
         self.area_capture = area_capture
         self.state_handler = state_handler
+        self._mouse = mouse
+        # 未指定时钟时与状态处理器共用同一个时钟，状态变化才能唤醒本处理器的等待
+        if clock is None:
+            clock = getattr(state_handler, "clock", None) or MonotonicClock()
+        self.clock = clock
+        # 收线取消令牌：由状态处理器在切换到收线状态时取消，没有状态处理器时使用不会被取消的本地令牌
+        self.cancel_token = getattr(state_handler, "reel_token", None) or CancellationToken(clock)
 
         # 初始面积
         self.init_area = 0
@@ -33,9 +52,21 @@ class LineHandler:
         self.scale_x = 1.0
         self.scale_y = 1.0
 
+        # 拉扯状态检测使用的模板匹配器，按窗口尺寸懒加载一次
+        self._state_matcher = None
+        self._state_matcher_size = None
+
         # 尝试获取窗口尺寸并计算缩放因子
         #self._update_scale_factors()
     
+    @property
+    def mouse(self):
+        """鼠标控制器，未注入时在首次使用前才导入（依赖Windows接口）"""
+        if self._mouse is None:
+            from controller.MouseController import mouse
+            self._mouse = mouse
+        return self._mouse
+
     def _update_scale_factors(self):
         """更新缩放因子"""
         try:
@@ -51,6 +82,40 @@ class LineHandler:
         except Exception as e:
             logger.error(f"更新缩放因子出错: {e}")
 
+    def _get_state_matcher(self):
+        """获取拉扯状态检测用的模板匹配器，窗口尺寸不变时复用已加载的模板"""
+        window_size = (self.area_capture.window_width, self.area_capture.window_height)
+        if self._state_matcher is not None and self._state_matcher_size == window_size:
+            return self._state_matcher
+
+        from config_manager import config_manager
+        from match.template_matcher import TemplateMatcher
+
+        # 获取模板目录路径
+        template_dir = config_manager.get("paths.templates", "./img/templates")
+        template_configs = [
+            {"name": name, "path": os.path.join(template_dir, f"{name}.png"), "threshold": 0.8}
+            for name in ["拉扯鱼线"] + self.OTHER_STATE_TEMPLATES
+        ]
+
+        # 使用基于不同分辨率的模板匹配，模板来自进程级缓存
+        matcher = TemplateMatcher()
+        matcher.load_templates(template_configs, window_size)
+        self._state_matcher = matcher
+        self._state_matcher_size = window_size
+        return matcher
+
+    def _capture_area_image(self, fresh=False):
+        """截取面积检测区域，返回BGR图像（基于整窗口数组视图，不经过PIL），失败返回None
+
+        参数:
+            fresh: 是否要求新截取的帧，按键之后需要新帧，连续检测时可复用刚截取的帧
+        """
+        frame = self.area_capture.capture_region_array(fresh)
+        if frame is None:
+            return None
+        return to_bgr(frame)
+
     def handle_jerky_line(self, jerky_line_flag):
         """处理拉扯鱼线状态
         
@@ -75,7 +140,7 @@ class LineHandler:
         
         while attempt < max_attempts and current_jerky_state:
             # 先检查是否已经进入收线状态 - 使用双重检查
-            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                 logger.info("检测到收线状态，立即中断拉扯鱼线操作")
                 return
 
@@ -83,7 +148,7 @@ class LineHandler:
             self._press_keys('a')
 
             # 再次检查是否已经进入收线状态 - 使用双重检查
-            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                 logger.info("按下a键后检测到收线状态，立即中断拉扯鱼线操作")
                 return
 
@@ -94,7 +159,7 @@ class LineHandler:
                 return
             elif area_status == 0:  # 面积足够大
                 # 再次检查收线状态
-                if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+                if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                     logger.info("按下d键前检测到收线状态，立即中断拉扯鱼线操作")
                     return
 
@@ -102,7 +167,7 @@ class LineHandler:
                 self._press_keys('d')
 
                 # 再次检查是否已经进入收线状态 - 使用双重检查
-                if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+                if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                     logger.info("按下d键后检测到收线状态，立即中断拉扯鱼线操作")
                     return
 
@@ -113,7 +178,7 @@ class LineHandler:
                     return
                 elif area_status == 0:  # 面积仍然足够大
                     # 再次检查收线状态
-                    if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+                    if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                         logger.info("第二次按下a键前检测到收线状态，立即中断拉扯鱼线操作")
                         return
 
@@ -121,7 +186,7 @@ class LineHandler:
                     self._press_keys('a')
 
                     # 再次检查是否已经进入收线状态 - 使用双重检查
-                    if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+                    if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                         logger.info("第二次按下a键后检测到收线状态，立即中断拉扯鱼线操作")
                         return
             else:  # area_status == 1，面积很小
@@ -137,8 +202,9 @@ class LineHandler:
                     break
 
             attempt += 1
-            import time
-            time.sleep(0.05)  # 减少延迟时间，更频繁检查状态
+            if self.cancel_token.wait(0.05):  # 进入收线状态时立即结束等待
+                logger.info("等待过程中收线取消令牌被触发，立即中断拉扯鱼线操作")
+                return
     
     def check_remain_area(self):
         """
@@ -150,13 +216,13 @@ class LineHandler:
         """
         try:
             # 首先检查是否已经进入收线状态 - 使用双重检查
-            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                 logger.info("面积检测开始前发现收线状态，立即返回")
                 return 2
 
             # 使用区域截图器获取当前屏幕
-            captures = self.area_capture.capture_one_shot()
-            if not captures['full_region']:
+            img = self._capture_area_image()
+            if img is None:
                 logger.info("无法捕获面积检测区域的图像")
                 # 修改：无法捕获图像时直接执行交替按键
                 logger.info("无法捕获图像，开始交替按a-d键")
@@ -165,9 +231,6 @@ class LineHandler:
                     return 2
                 return 0
                 
-            # 转换为OpenCV格式
-            img = cv2.cvtColor(np.array(captures['full_region']), cv2.COLOR_RGB2BGR)
-
             # 优先检查收线状态（通过状态处理器）
             if self._is_line_retrieved_state():
                 logger.info("面积检测过程中通过状态处理器发现收线状态，立即中断")
@@ -233,25 +296,25 @@ class LineHandler:
         max_presses = 3
         press_count = 0
 
-        import time
 
         # 快速检查是否处于收线状态 - 使用双重检查
-        if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+        if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
             logger.info("交替按键开始前检测到收线状态，立即返回")
             return True
 
         while press_count < max_presses:
             # 按下 a 键前再次检查收线状态
-            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                 logger.info("按下a键前检测到收线状态，立即返回")
                 return True
 
-            # 按下 a 键
-            self.input_handler.press('a', 0.15)  # 恢复原来的按键时间
-            time.sleep(0.05)  # 减少等待时间，更频繁检查
+            # 按下 a 键，收线取消令牌触发时立即松开
+            if self._hold_key('a', 0.15) or self.cancel_token.wait(0.05):
+                logger.info("按住a键过程中收线取消令牌被触发，已释放按键，立即返回")
+                return True
 
             # 检查是否已经进入收线状态 - 使用双重检查
-            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                 logger.info("按下a键后检测到收线状态，立即返回")
                 return True
 
@@ -261,16 +324,17 @@ class LineHandler:
                 break
 
             # 按下 d 键前再次检查收线状态
-            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                 logger.info("按下d键前检测到收线状态，立即返回")
                 return True
 
-            # 按下 d 键
-            self.input_handler.press('d', 0.15)  # 恢复原来的按键时间
-            time.sleep(0.05)  # 减少等待时间，更频繁检查
+            # 按下 d 键，收线取消令牌触发时立即松开
+            if self._hold_key('d', 0.15) or self.cancel_token.wait(0.05):
+                logger.info("按住d键过程中收线取消令牌被触发，已释放按键，立即返回")
+                return True
 
             # 检查是否已经进入收线状态 - 使用双重检查
-            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+            if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                 logger.info("按下d键后检测到收线状态，立即返回")
                 return True
 
@@ -307,18 +371,17 @@ class LineHandler:
                 return
 
             # 检查状态处理器的收线状态
-            if self.state_handler and self.state_handler.running_state == 3:
+            if self.state_handler and self.state_handler.running_state == FishingState.REEL:
                 logger.info(f"按键 {key} 操作前检测到状态处理器已为收线状态(3)，立即中断")
                 return
 
             logger.info(f"开始按键操作: 按下 {key} 键, 持续时间: {interval}秒")
             # 记录初始面积
-            init_captures = self.area_capture.capture_one_shot()
-            if not init_captures['full_region']:
+            init_img = self._capture_area_image()
+            if init_img is None:
                 logger.info(f"按键 {key} 操作中无法捕获面积区域图像")
                 return
 
-            init_img = cv2.cvtColor(np.array(init_captures['full_region']), cv2.COLOR_RGB2BGR)
             init_hsv = cv2.cvtColor(init_img, cv2.COLOR_BGR2HSV)
             init_mask = cv2.inRange(init_hsv, self.lower, self.upper)
             init_contours, _ = cv2.findContours(init_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -332,8 +395,10 @@ class LineHandler:
             init_area = max([cv2.contourArea(c) for c in init_contours])
             logger.info(f"按键 {key} 操作前面积: {init_area:.2f}")
 
-            # 按下指定键 - 使用原来的按键时间
-            self.input_handler.press(key, interval)
+            # 按下指定键 - 使用原来的按键时间，收线取消令牌触发时立即松开
+            if self._hold_key(key, interval):
+                logger.info(f"按住 {key} 键过程中收线取消令牌被触发，已释放按键，立即中断")
+                return
 
             # 检查是否已经进入收线状态
             if self._is_line_retrieved_state():
@@ -341,17 +406,16 @@ class LineHandler:
                 return
 
             # 检查状态处理器的收线状态
-            if self.state_handler and self.state_handler.running_state == 3:
+            if self.state_handler and self.state_handler.running_state == FishingState.REEL:
                 logger.info(f"按键 {key} 操作后检测到状态处理器已为收线状态(3)，立即中断")
                 return
                 
-            # 记录按键后的面积
-            post_captures = self.area_capture.capture_one_shot()
-            if not post_captures['full_region']:
+            # 记录按键后的面积（必须是按键之后的新帧）
+            post_img = self._capture_area_image(fresh=True)
+            if post_img is None:
                 logger.info(f"按键 {key} 操作后无法捕获面积区域图像")
                 return
                 
-            post_img = cv2.cvtColor(np.array(post_captures['full_region']), cv2.COLOR_RGB2BGR)
             post_hsv = cv2.cvtColor(post_img, cv2.COLOR_BGR2HSV)
             post_mask = cv2.inRange(post_hsv, self.lower, self.upper)
             post_contours, _ = cv2.findContours(post_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -382,7 +446,7 @@ class LineHandler:
                 loop_count = 0
                 while loop_count < max_loops:
                     # 先检查是否进入收线状态 - 使用双重检查
-                    if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+                    if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                         logger.info(f"持续按住 {key} 过程中检测到收线状态，立即释放按键并中断")
                         self.input_handler.press_up(key)  # 确保释放按键
                         return
@@ -391,26 +455,26 @@ class LineHandler:
                     # 修改为按下不释放
                     self.input_handler.press(key, 0, keyup=False)
                     logger.info(f"持续按住 {key} 键不释放")
-                    # 继续保持按键按下，适当延迟以避免过度采样
-                    import time
-                    time.sleep(0.1)  # 减少延迟时间，更频繁检查状态
+                    # 继续保持按键按下，适当延迟以避免过度采样；收线取消令牌触发时立即释放
+                    if self.cancel_token.wait(0.1):
+                        logger.info(f"持续按住 {key} 过程中收线取消令牌被触发，立即释放按键并中断")
+                        self.input_handler.press_up(key)
+                        return
 
                     # 再次检查是否进入收线状态 - 使用双重检查
-                    if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == 3):
+                    if self._is_line_retrieved_state() or (self.state_handler and self.state_handler.running_state == FishingState.REEL):
                         logger.info(f"持续按住 {key} 延迟后检测到收线状态，立即释放按键并中断")
                         self.input_handler.press_up(key)  # 确保释放按键
                         return
                     
-                    # 检测面积
-                    captures = self.area_capture.capture_one_shot()
-                    if not captures['full_region']:
+                    # 检测面积（必须是按住按键之后的新帧）
+                    img = self._capture_area_image(fresh=True)
+                    if img is None:
                         # 跳出循环前释放按键
                         self.input_handler.press_up(key)
                         logger.info(f"无法捕获面积区域图像，释放按键 {key}")
                         break
                         
-                    img = cv2.cvtColor(np.array(captures['full_region']), cv2.COLOR_RGB2BGR)
-
                     # 再次检查是否进入收线状态（通过状态处理器）
                     if self._is_line_retrieved_state():
                         logger.info(f"持续按住 {key} 过程中通过状态处理器检测到收线状态，立即释放按键并中断")
@@ -465,71 +529,34 @@ class LineHandler:
         """
         try:
             # 使用区域截图器获取当前屏幕
-            captures = self.area_capture.capture_one_shot()
-            if not captures['full_region']:
+            img = self._capture_area_image()
+            if img is None:
                 logger.info("无法捕获屏幕进行拉扯状态检测")
                 return True  # 默认维持当前状态
             
-            # 转换为OpenCV格式
-            img = cv2.cvtColor(np.array(captures['full_region']), cv2.COLOR_RGB2BGR)
-            
-            # 方法1: 使用模板匹配检测状态
-            from config_manager import config_manager
-            import os
-            
-            # 获取模板目录路径
-            template_dir = config_manager.get("paths.templates", "./img/templates")
-            
-            # 不同状态的模板文件名
-            jerky_template = os.path.join(template_dir, "拉扯鱼线.png")
-            other_templates = [
-                os.path.join(template_dir, "收线.png"),
-                os.path.join(template_dir, "跳过.png"),
-                os.path.join(template_dir, "收竿.png"),
-                os.path.join(template_dir, "提竿.png")
-            ]
-            
-            # 使用基于不同分辨率的模板匹配
-            from match.template_matcher import TemplateMatcher
-            matcher = TemplateMatcher()
-            window_size = (self.area_capture.window_width, self.area_capture.window_height)
-            
-            # 检查拉扯鱼线模板是否存在
-            if os.path.exists(jerky_template):
-                # 加载模板
-                jerky_template_img = cv2.imread(jerky_template, cv2.IMREAD_COLOR)
-                if jerky_template_img is not None:
-                    # 添加模板到匹配器
-                    matcher.load_templates([{"name": "拉扯鱼线", "path": jerky_template, "threshold": 0.8}], window_size)
-                    
-                    # 进行模板匹配
-                    match_result = matcher.match_template(img, "拉扯鱼线")
-                    
-                    if match_result:
-                        logger.info(f"模板匹配检测到拉扯鱼线状态，匹配度: {match_result['score']:.4f}")
-                        return True
-                    else:
-                        logger.info(f"模板匹配未检测到拉扯鱼线状态")
+            # 方法1: 使用模板匹配检测状态（模板在首次使用时从进程级缓存加载，之后不再访问磁盘）
+            matcher = self._get_state_matcher()
+
+            # 检查拉扯鱼线模板
+            if "拉扯鱼线" in matcher.templates:
+                match_result = matcher.match_template(img, "拉扯鱼线")
+                if match_result:
+                    logger.info(f"模板匹配检测到拉扯鱼线状态，匹配度: {match_result['score']:.4f}")
+                    return True
+                else:
+                    logger.info(f"模板匹配未检测到拉扯鱼线状态")
             else:
-                logger.debug(f"拉扯鱼线模板不存在: {jerky_template}")
-            
+                logger.debug("拉扯鱼线模板不存在")
+
             # 检查其他状态模板
-            for template_path in other_templates:
-                if os.path.exists(template_path):
-                    template_img = cv2.imread(template_path, cv2.IMREAD_COLOR)
-                    if template_img is not None:
-                        # 添加模板到匹配器
-                        template_name = os.path.basename(template_path).replace(".png", "")
-                        matcher.load_templates([{"name": template_name, "path": template_path, "threshold": 0.8}], window_size)
-                        
-                        # 进行模板匹配
-                        match_result = matcher.match_template(img, template_name)
-                        
-                        if match_result:
-                            logger.info(f"检测到其他状态: {template_name}，匹配度: {match_result['score']:.4f}")
-                            return False
-                else:
-                    logger.debug(f"状态模板不存在: {template_path}")
+            for template_name in self.OTHER_STATE_TEMPLATES:
+                if template_name not in matcher.templates:
+                    logger.debug(f"状态模板不存在: {template_name}")
+                    continue
+                match_result = matcher.match_template(img, template_name)
+                if match_result:
+                    logger.info(f"检测到其他状态: {template_name}，匹配度: {match_result['score']:.4f}")
+                    return False
             
             # 方法2: 使用颜色特征检测
             # 如果模板匹配不可靠，可以通过检测屏幕上特定区域的颜色特征来判断
@@ -544,13 +571,16 @@ class LineHandler:
             # 提取指定颜色范围
             mask = cv2.inRange(hsv, jerky_lower, jerky_upper)
             
-            # 计算特定颜色的像素占比
-            total_pixels = mask.shape[0] * mask.shape[1]
+            # 计算特定颜色的像素占比：分母为默认面积检测区域的像素数，
+            # 锚点收缩了检测区域时判定所需的颜色像素数保持不变
+            _, _, default_width, default_height = calculate_fishing_regions(
+                self.area_capture.window_width, self.area_capture.window_height)["area"]
+            total_pixels = max(default_width * default_height, 1)
             color_pixels = cv2.countNonZero(mask)
             color_ratio = color_pixels / total_pixels
             
             # 根据颜色占比判断状态
-            color_threshold = 0.01  # 阈值，根据实际情况调整
+            color_threshold = 0.01  # 阈值（占默认面积检测区域的比例），根据实际情况调整
             if color_ratio > color_threshold:
                 logger.info(f"颜色特征检测到拉扯鱼线状态，颜色占比: {color_ratio:.4f}")
                 return True
@@ -572,9 +602,14 @@ class LineHandler:
             False: 不处于收线状态
         """
         try:
+            # 收线取消令牌在状态切换的同时被取消，检查它不需要读取状态
+            if self.cancel_token.cancelled:
+                logger.info("收线取消令牌已触发")
+                return True
+
             # 优先检查状态处理器的状态
             if self.state_handler and hasattr(self.state_handler, 'running_state'):
-                if self.state_handler.running_state == 3:  # 收线状态
+                if self.state_handler.running_state == FishingState.REEL:
                     logger.info("通过状态处理器检测到收线状态")
                     return True
 
@@ -598,34 +633,47 @@ class LineHandler:
 
             # 直接使用传入的状态处理器
             if self.state_handler:
-                # 强制设置状态为收线状态
-                self.state_handler.running_state = 3  # 收线状态
-                self.state_handler.jerky_line_flag = False  # 关闭拉扯鱼线标志
-                self.state_handler.line_retrieved_flag = True  # 设置收线标志
+                # 切换为收线状态，状态机会关闭拉扯鱼线标志并设置收线标志
+                self.state_handler.set_state(FishingState.REEL, trigger="line_handler")
 
                 logger.info("成功强制更新状态为收线状态，立即开始收线操作")
 
             # 直接开始执行收线操作，无需等待主循环
-            from controller.MouseController import mouse
             logger.info("立即开始执行收线操作 - 直接点击右键")
             for i in range(5):  # 增加点击次数，确保能成功收线
-                mouse.click_right(0.05)
-                import time
-                time.sleep(0.05)
+                self.mouse.click_right(0.05)
+                self.clock.sleep(0.05)
             
         except Exception as e:
             logger.error(f"通知收线状态出错: {e}")
             # 即使出错，也尝试点击右键
             try:
-                from controller.MouseController import mouse
                 logger.info("尝试直接点击右键进行收线")
                 for i in range(5):
-                    mouse.click_right(0.05)
-                    import time
-                    time.sleep(0.05)
+                    self.mouse.click_right(0.05)
+                    self.clock.sleep(0.05)
             except:
                 pass
 
+    def _hold_key(self, key, duration):
+        """
+        按住按键指定时长，收线取消令牌触发时提前松开
+
+        参数:
+            key: 要按下的键
+            duration: 按住时长（秒）
+
+        返回:
+            True: 按住过程中收线取消令牌被触发
+            False: 按满了指定时长
+        """
+        # 与原来的 press(key, tm) 使用相同的按键注入方式（不等待窗口切到前台），按住时长改由令牌等待
+        self.input_handler.press(key, 0, keyup=False)
+        try:
+            return self.cancel_token.wait(duration)
+        finally:
+            self.input_handler.press_up(key)
+
     def _release_all_keys(self, reason=""):
         """
         释放所有按键 - 统一的按键释放方法，减少重复代码
@@ -1,9 +1,13 @@
 import logging
 import threading
-import time
+from collections import deque
 import ctypes
 from ctypes import wintypes
-from controller.MouseController import mouse
+
+import numpy as np
+
+from bot.clock import MonotonicClock
+from bot.state_machine import FishingState
 
 # 定义鼠标输入结构，用于快速点击
 if ctypes.sizeof(ctypes.c_void_p) == 4:
@@ -32,17 +36,28 @@ logger = logging.getLogger(__name__)
 class MainLoopHandler:
     """处理钓鱼机器人主循环的类"""
 
-    def __init__(self, state_handler, input_handler, line_handler):
+    def __init__(self, state_handler, input_handler, line_handler, mouse=None, clock=None):
         """初始化主循环处理器
         
         参数:
             state_handler: 状态处理器
             input_handler: 输入控制器
             line_handler: 鱼线处理器
+            mouse: 鼠标控制器（可选），默认为 controller.MouseController.mouse
+            clock: 时钟（可选），默认与状态处理器共用同一个时钟
         """
         self.state_handler = state_handler
         self.input_handler = input_handler
         self.line_handler = line_handler
+        # 未指定时钟时与状态处理器共用同一个时钟，状态变化才能唤醒本处理器的等待
+        if clock is None:
+            clock = getattr(state_handler, "clock", None) or MonotonicClock()
+        self.clock = clock
+
+        # 鼠标控制器依赖Windows接口，未注入时在首次使用前才导入
+        if mouse is None:
+            from controller.MouseController import mouse
+        self.mouse = mouse
         
         # 连续钓鱼设置
         self.continuous_fishing = False
@@ -54,6 +69,9 @@ class MainLoopHandler:
         
         # 主循环线程
         self.main_thread = None
+
+        # 收线反应时间：收线取消令牌被触发到第一次收线点击的时间（秒），保留最近100次
+        self.reel_reaction_times = deque(maxlen=100)
         
         # 从配置文件获取收线按键设置
         from config_manager import config_manager
@@ -83,19 +101,14 @@ class MainLoopHandler:
             str: 当前检测到的模板名称，如果没有检测到则返回None
         """
         try:
-            # 获取当前屏幕截图
-            captures = self.state_handler.ocr_capture.capture_one_shot()
-            if not captures or 'full_region' not in captures or not captures['full_region']:
+            # 获取当前屏幕截图（BGRX区域视图，匹配器可直接处理）
+            template_img = self.state_handler.ocr_capture.capture_region_array()
+            if template_img is None:
                 logger.debug("无法获取屏幕截图进行模板检查")
                 return None
 
-            # 转换为OpenCV格式
-            import cv2
-            import numpy as np
-            template_img_cv = cv2.cvtColor(np.array(captures['full_region']), cv2.COLOR_RGB2BGR)
-
             # 使用模板匹配器检测当前模板
-            match_result = self.state_handler.template_matcher.match_template(template_img_cv)
+            match_result = self.state_handler.template_matcher.match_template(template_img)
 
             if match_result and match_result.get("score", 0) >= 0.8:
                 template_name = match_result.get("name")
@@ -143,7 +156,9 @@ class MainLoopHandler:
                     logger.info("检测到InputHandler停止信号，停止主循环")
                     self.stop_flag = True
                     break
-                if self.state_handler.running_state == 0 and self.continuous_fishing and self.state_handler.fishing_count > 0:
+                # 记录本轮开始时的状态事件，本轮结束后等待其后的状态变化
+                last_event = self.state_handler.last_event
+                if self.state_handler.running_state == FishingState.IDLE and self.continuous_fishing and self.state_handler.fishing_count > 0:
                     # 未开始且开启了连续钓鱼且已经钓过鱼
                     
                     # 如果已达到目标次数，则停止并重置钓鱼计数
@@ -158,7 +173,7 @@ class MainLoopHandler:
                         logger.warning("抛竿失败，跳过本轮")
                         continue
                                 
-                elif self.state_handler.running_state == 4:  # 跳过
+                elif self.state_handler.running_state == FishingState.SKIP:
                     logger.info("执行跳过操作")
 
                     # 检查是否仍然检测到跳过模板
@@ -166,42 +181,42 @@ class MainLoopHandler:
                     if current_template and current_template == "跳过":
                         # 确保有足够的按键间隔，使游戏能够响应
                         self.input_handler.press('f', 0.15)
-                        time.sleep(0.2)  # 增加等待时间
+                        self.clock.sleep(0.2)  # 增加等待时间
                         self.input_handler.press('f', 0.15)
-                        time.sleep(0.5)
+                        self.clock.sleep(0.5)
                         self.input_handler.press('f', 0.15)
                         logger.info(f"跳过操作完成，按F键3次")
 
                         # 检查收线标志，如果为true则重置状态为未开始
                         if self.state_handler.line_retrieved_flag:
                             logger.info("检测到收线标志为true，重置状态为未开始")
-                            self.state_handler.running_state = 0
-                            self.state_handler.line_retrieved_flag = False  # 重置收线标志
+                            # 回到未开始时状态机会清除收线标志
+                            self.state_handler.set_state(FishingState.IDLE, trigger="skip_done")
                     else:
                         logger.info("未检测到跳过模板，跳过F键操作")
                         # 如果没有检测到模板，等待状态自动重置
                         self.input_handler.press('f', 0.15)
-                        time.sleep(0.5)
+                        self.clock.wait(0.5)
                     
-                elif self.state_handler.running_state == 1:  # 收竿/提竿
+                elif self.state_handler.running_state == FishingState.HOOK:
                     logger.info("执行收竿/提竿操作 - 按S键")
                     self.input_handler.press('s', 0.2)
-                    time.sleep(0.2)
+                    self.clock.wait(0.2)
                     logger.info("收竿/提竿操作完成")
                     
-                elif self.state_handler.running_state == 2:  # 拉扯鱼线
+                elif self.state_handler.running_state == FishingState.PULL:
                     logger.info("执行拉扯鱼线操作 - 开始处理鱼线")
                     self.line_handler.handle_jerky_line(self.state_handler.jerky_line_flag)
                     logger.info("拉扯鱼线操作处理完成")
                     
-                elif self.state_handler.running_state == 3:  # 收线
+                elif self.state_handler.running_state == FishingState.REEL:
                     logger.info(f"执行收线操作 - 开始快速{self.reel_key}点击")
                     current_state = self.state_handler.running_state  # 记录当前状态
 
                     # 先激活一次窗口，避免重复激活
                     if self.reel_key == "right_click":
                         # 激活窗口但不点击
-                        mouse._activate_window()
+                        self.mouse._activate_window()
 
                     # 增加点击次数到50次，并减少间隔时间以提高响应速度
                     for i in range(50):
@@ -212,21 +227,25 @@ class MainLoopHandler:
                             logger.info(f"收线操作被中断 - 状态已从 [{old_state_name}] 变更为 [{new_state_name}]，点击次数: {i+1}/50")
                             break
 
+                        if i == 0:
+                            self._record_reel_reaction()
+
                         # 根据配置使用正确的收线按键
                         if self.reel_key == "right_click":
                             # 使用鼠标右键点击，进一步减少点击持续时间和间隔以提高响应速度
-                            mouse.press_right()
-                            time.sleep(0.01)  # 进一步减少按下时间
-                            mouse.release_right()
+                            self.mouse.press_right()
+                            self.clock.sleep(0.01)  # 进一步减少按下时间
+                            self.mouse.release_right()
                         else:
                             # 使用键盘按键
                             self.input_handler.press(self.reel_key, 0.01)  # 进一步减少按键时间
 
-                        time.sleep(0.01)  # 进一步减少等待时间，提高收线响应速度
+                        self.clock.wait(0.01)  # 进一步减少等待时间，提高收线响应速度
                         logger.debug(f"收线点击 {i+1}/50")
 
                 error_count = 0
-                time.sleep(0.05)
+                # 等待状态变化，最长0.05秒（保持当前状态下的重复操作节奏）
+                self.state_handler.wait_for_transition(last_event.sequence, timeout=0.05)
                 
             except Exception as e:
                 logger.error(f"主循环执行出错: {e}")
@@ -235,14 +254,41 @@ class MainLoopHandler:
                 # 如果错误次数过多，重置状态
                 if error_count >= max_errors:
                     logger.warning(f"错误次数过多({error_count}次)，重置状态")
-                    self.state_handler.running_state = 0
+                    self.state_handler.set_state(FishingState.IDLE, trigger="error")
                     error_count = 0
-                    time.sleep(1.0)
+                    self.clock.wait(1.0)
                 else:
-                    time.sleep(0.5)  # 短暂延迟后重试
+                    self.clock.wait(0.5)  # 短暂延迟后重试
         
         logger.info("钓鱼机器人主循环已停止")
 
+    def _record_reel_reaction(self):
+        """记录收线取消令牌被触发到第一次收线点击的时间，每次取消只记录一次"""
+        cancelled_at = self.state_handler.reel_token.consume()
+        if cancelled_at is None:
+            return
+        reaction = self.clock.time() - cancelled_at
+        self.reel_reaction_times.append(reaction)
+        logger.info(f"收线反应时间: {reaction * 1000:.1f}ms")
+
+    def get_reel_reaction_stats(self):
+        """
+        获取收线反应时间统计
+
+        返回:
+            dict: count 以及 mean/p50/p95/max（毫秒），没有记录时只有count
+        """
+        if not self.reel_reaction_times:
+            return {"count": 0}
+        times = np.array(self.reel_reaction_times) * 1000
+        return {
+            "count": len(times),
+            "mean": float(times.mean()),
+            "p50": float(np.percentile(times, 50)),
+            "p95": float(np.percentile(times, 95)),
+            "max": float(times.max()),
+        }
+
     def _cast_fishing_rod(self, max_attempts=3):
         """
         抛竿操作 - 优化版本，减少重复代码
@@ -253,17 +299,18 @@ class MainLoopHandler:
         返回:
             bool: True表示抛竿成功，False表示失败
         """
-        from controller.MouseController import mouse
-
         logger.info("开始新一轮钓鱼 - 点击右键")
-        time.sleep(1.0)  # 等待之前的状态完成
+        self.clock.sleep(1.0)  # 等待之前的状态完成
 
         for attempt in range(max_attempts):
-            mouse.click_right(0.05)
-            time.sleep(2.0)  # 等待钓鱼动作开始
+            self.mouse.click_right(0.05)
+            # 等待钓鱼动作开始，状态变化时立即被唤醒
+            deadline = self.clock.time() + 2.0
+            while self.state_handler.running_state == FishingState.IDLE and self.clock.time() < deadline:
+                self.clock.wait(deadline - self.clock.time())
 
             # 检查钓鱼动作是否开始
-            if self.state_handler.running_state != 0:
+            if self.state_handler.running_state != FishingState.IDLE:
                 logger.info(f"抛竿成功，尝试次数: {attempt + 1}")
                 return True
 
@@ -273,7 +320,7 @@ class MainLoopHandler:
                 logger.warning("多次尝试后钓鱼动作仍未开始")
 
         # 重置状态并返回失败
-        self.state_handler.running_state = 0
-        time.sleep(1.0)
+        self.state_handler.set_state(FishingState.IDLE, trigger="cast_failed")
+        self.clock.sleep(1.0)
         return False
 
@@ -0,0 +1,565 @@
+"""
+无界面回放模拟器
+使用虚拟时钟、模拟输入和合成（或录制的）画面驱动 StateHandler、MainLoopHandler 和 LineHandler，
+不需要游戏窗口即可在任意平台上回归测试钓鱼周期和识别延迟
+
+合成模式下画面由一个简化的钓鱼过程模型生成，会响应机器人的按键和点击；
+录制模式下按虚拟时间回放 SessionRecorder 的归档文件
+
+用法:
+    python -m bot.simulator --minutes 30
+    python -m bot.simulator --archive recordings/session_xxx.nkrec
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+
+import cv2
+import numpy as np
+
+# 添加项目根目录到Python路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from bot.clock import VirtualClock
+from bot.line_handler import LineHandler
+from bot.main_loop import MainLoopHandler
+from bot.state_handler import StateHandler
+from bot.state_machine import FishingState, TEMPLATE_FILES, TEMPLATE_STATES
+from capture.frame_bus import FrameBus
+from capture.frame_source import FrameSource, SyntheticFrameSource
+from capture.region_capture import calculate_fishing_regions
+from capture.session_recorder import ArchiveFrameSource, RECORD_STATE
+from match.centroid_classifier import CentroidClassifier
+from match.engines import ENGINES
+from match.template_matcher import TemplateMatcher
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(ROOT_DIR, "img", "templates")
+
+# 拉扯阶段黄色区域的颜色（落在 LineHandler 的HSV阈值内）
+YELLOW_BGR = (183, 236, 252)
+
+
+class SimulatedInput:
+    """模拟键盘，记录按键事件并转发给画面模型，按键时长消耗虚拟时间"""
+
+    def __init__(self, clock, scene=None):
+        self.clock = clock
+        self.scene = scene
+        self.stop_flag = False
+        self.external_on_key_press = None
+        self.events = []
+
+    def _emit(self, action, key):
+        self.events.append((self.clock.time(), action, key))
+        if self.scene is not None:
+            self.scene.on_input(action, key)
+
+    def press_down(self, key):
+        self._emit("down", key)
+
+    def press_up(self, key):
+        self._emit("up", key)
+
+    def press(self, key, tm=0.2, keyup=True):
+        self.press_down(key)
+        self.clock.sleep(tm)
+        if keyup:
+            self.press_up(key)
+
+
+class SimulatedMouse:
+    """模拟鼠标，接口与 controller.MouseController.mouse 中用到的部分一致"""
+
+    def __init__(self, clock, scene=None):
+        self.clock = clock
+        self.scene = scene
+        self.events = []
+
+    def _emit(self, action):
+        self.events.append((self.clock.time(), action, "right"))
+        if self.scene is not None:
+            self.scene.on_input(action, "right")
+
+    def _activate_window(self):
+        pass
+
+    def press_right(self):
+        self._emit("down")
+
+    def release_right(self):
+        self._emit("up")
+
+    def click_right(self, duration=0.1):
+        self.press_right()
+        self.clock.sleep(duration)
+        self.release_right()
+
+
+class FishingScene(SyntheticFrameSource):
+    """
+    简化的钓鱼过程模型
+
+    阶段: 等待咬钩 -> 提竿(按S) -> 拉扯鱼线(按A/D消耗体力) -> 收线(右键点击) -> 跳过(按F) -> 空闲(右键抛竿)
+    提竿提示超时未响应时鱼会逃走并回到空闲阶段。画面只在阶段或黄色区域变化时重新绘制，
+    frame_key 随之递增
+    """
+
+    PHASE_TEMPLATES = {"wait_bite": None, "hook": "提竿", "pull": "拉扯鱼线",
+                       "reel": "收线", "result": "跳过", "idle": None}
+
+    def __init__(self, clock, window_size, templates, seed=0, bite_delay=(1.0, 4.0), hook_window=3.0,
+                 pull_stamina=(4.0, 8.0), reel_clicks=(15, 25)):
+        """
+        参数:
+            clock: 虚拟时钟
+            window_size: 窗口尺寸 (width, height)
+            templates: 模板字典，名称 -> BGRA模板图像
+            seed: 随机种子
+            bite_delay: 抛竿后到咬钩的时间范围（秒）
+            hook_window: 提竿提示的有效时间（秒）
+            pull_stamina: 拉扯阶段鱼的体力范围（秒，自然消耗速度为每秒1，按A/D时额外消耗）
+            reel_clicks: 收线需要的点击次数范围
+        """
+        super().__init__(window_size, templates, seed=seed)
+        self.clock = clock
+        self.rng = np.random.default_rng(seed)
+        self.bite_delay = bite_delay
+        self.hook_window = hook_window
+        self.pull_stamina = pull_stamina
+        self.reel_clicks = reel_clicks
+        self.area_region = calculate_fishing_regions(self.window_width, self.window_height)["area"]
+
+        self._lock = threading.RLock()
+        self.frame_key = 0
+        self._rendered = None
+        self._held_keys = {}
+        self.timeline = []
+        self.catches = 0
+        self.escapes = 0
+        self._enter("wait_bite")
+
+    def _enter(self, phase):
+        now = self.clock.time()
+        self.phase = phase
+        self.phase_start = now
+        if phase == "wait_bite":
+            self.phase_end = now + self.rng.uniform(*self.bite_delay)
+        elif phase == "hook":
+            self.phase_end = now + self.hook_window
+        elif phase == "pull":
+            self.stamina_total = self.rng.uniform(*self.pull_stamina)
+            self.stamina = self.stamina_total
+            self._last_update = now
+        elif phase == "reel":
+            self.clicks_needed = int(self.rng.integers(self.reel_clicks[0], self.reel_clicks[1] + 1))
+        self.timeline.append((now, phase, self.PHASE_TEMPLATES[phase]))
+
+    def _update(self):
+        """按虚拟时间推进阶段"""
+        now = self.clock.time()
+        if self.phase == "wait_bite" and now >= self.phase_end:
+            self._enter("hook")
+        elif self.phase == "hook" and now >= self.phase_end:
+            self.escapes += 1
+            self._enter("idle")
+        elif self.phase == "pull":
+            self.stamina -= now - self._last_update
+            self._last_update = now
+            if self.stamina <= 0:
+                self._enter("reel")
+
+    def on_input(self, action, key):
+        """处理机器人的输入"""
+        with self._lock:
+            self._update()
+            now = self.clock.time()
+            if action == "down":
+                self._held_keys[key] = now
+            elif action == "up":
+                held = now - self._held_keys.pop(key, now)
+                if self.phase == "pull" and key in ("a", "d"):
+                    # 按住A/D越久，鱼的体力消耗越多
+                    self.stamina -= held * 1.5
+                    if self.stamina <= 0:
+                        self._enter("reel")
+
+            if action != "down":
+                return
+            if key == "right" and self.phase == "idle":
+                self._enter("wait_bite")
+            elif key == "s" and self.phase == "hook":
+                self._enter("pull")
+            elif key == "right" and self.phase == "reel":
+                self.clicks_needed -= 1
+                if self.clicks_needed <= 0:
+                    self._enter("result")
+            elif key == "f" and self.phase == "result":
+                self.catches += 1
+                self._enter("idle")
+
+    def current_label(self):
+        return self.PHASE_TEMPLATES[self.phase]
+
+    def capture_array(self):
+        with self._lock:
+            self._update()
+            # 黄色区域按体力比例分20档，只在档位变化时重新绘制
+            level = int(20 * max(0.0, self.stamina) / self.stamina_total) if self.phase == "pull" else -1
+            state = (self.phase, level)
+            if state != self._rendered:
+                np.copyto(self._frame, self._background)
+                name = self.current_label()
+                if name is not None and name in self.templates:
+                    self._paste_template(self.templates[name])
+                if level >= 0:
+                    x, y, w, h = self.area_region
+                    bar_w = max(1, int(w * 0.6 * level / 20))
+                    bar_h = max(2, h // 10)
+                    cv2.rectangle(self._frame, (x + (w - bar_w) // 2, y + (h - bar_h) // 2),
+                                  (x + (w + bar_w) // 2, y + (h + bar_h) // 2), YELLOW_BGR, -1)
+                self._rendered = state
+                self.frame_key += 1
+            return self._frame
+
+
+class ArchiveScene(FrameSource):
+    """按虚拟时间回放录制归档的画面，不响应输入"""
+
+    def __init__(self, clock, archive_path):
+        self.clock = clock
+        self.source = ArchiveFrameSource(archive_path)
+        self.window_width = self.source.window_width
+        self.window_height = self.source.window_height
+        self.start_time = self.source.timestamp_at(0)
+        self._offsets = [self.source.timestamp_at(i) - self.start_time for i in range(len(self.source))]
+        self.duration = self._offsets[-1]
+        self.frame_key = -1
+        self.timeline = []
+        self._lock = threading.Lock()
+
+        # 录制时识别到的状态变化，作为识别延迟的参照
+        archive = self.source.archive
+        for index, record in archive.iter_records(RECORD_STATE):
+            if record.timestamp >= self.start_time:
+                self.timeline.append((record.timestamp - self.start_time, archive.read_meta(index)["state"]))
+
+    def on_input(self, action, key):
+        pass
+
+    def capture_array(self):
+        with self._lock:
+            group = max(0, bisect_right(self._offsets, self.clock.time()) - 1)
+            if group != self.frame_key:
+                self.source.seek(group)
+                self.source.capture_array()
+                self.frame_key = group
+            return self.source._canvas
+
+
+class ContentKeyedMatcher:
+    """
+    按画面内容缓存匹配结果的匹配器包装
+
+    模拟画面在大部分时间内保持不变，相同内容的匹配结果必然相同，
+    缓存后回放速度不再受模板匹配耗时限制（虚拟时间中计算本身不消耗时间，结果不受影响）。
+    画面的 frame_key 不变时直接复用上次计算的内容摘要，不重复计算哈希
+    """
+
+    MAX_ENTRIES = 256
+
+    def __init__(self, matcher, scene):
+        self._matcher = matcher
+        self._scene = scene
+        self._cache = {}
+        self._digests = {}
+        self._digest_key = None
+
+    def __getattr__(self, name):
+        return getattr(self._matcher, name)
+
+    def _digest(self, frame):
+        frame_key = self._scene.frame_key
+        if frame_key != self._digest_key:
+            self._digests.clear()
+            self._digest_key = frame_key
+        view_key = (frame.__array_interface__["data"][0], frame.shape)
+        digest = self._digests.get(view_key)
+        if digest is None:
+            digest = hashlib.blake2b(np.ascontiguousarray(frame).data, digest_size=16).digest()
+            self._digests[view_key] = digest
+        return digest
+
+    def match_template(self, frame, template_name=None):
+        key = (self._digest(frame), frame.shape, template_name)
+        if key not in self._cache:
+            if len(self._cache) >= self.MAX_ENTRIES:
+                self._cache.clear()
+            self._cache[key] = self._matcher.match_template(frame, template_name)
+        return self._cache[key]
+
+    def match_templates(self, frame, names, stop_score=None):
+        key = (self._digest(frame), frame.shape, tuple(names), stop_score)
+        if key not in self._cache:
+            if len(self._cache) >= self.MAX_ENTRIES:
+                self._cache.clear()
+            self._cache[key] = self._matcher.match_templates(frame, names, stop_score)
+        return self._cache[key]
+
+
+def match_transitions(expected, observed, window=10.0):
+    """
+    计算识别延迟：对每个期望的状态变化，找到之后第一次变为相同状态的时间
+
+    参数:
+        expected: 列表 [(时间, 状态)]
+        observed: 列表 [(时间, 状态)]
+        window: 最大匹配间隔（秒）
+
+    返回:
+        (延迟列表, 未匹配数量)
+    """
+    latencies = []
+    missed = 0
+    times = [t for t, _ in observed]
+    for t_expected, state in expected:
+        start = bisect_right(times, t_expected - 1e-9)
+        for t_observed, observed_state in observed[start:]:
+            if t_observed - t_expected > window:
+                missed += 1
+                break
+            if observed_state == state:
+                latencies.append(t_observed - t_expected)
+                break
+        else:
+            missed += 1
+    return latencies, missed
+
+
+def _summarize(values):
+    if not values:
+        return {"count": 0}
+    arr = np.array(values)
+    return {
+        "count": len(values),
+        "mean": float(arr.mean()),
+        "p50": float(np.percentile(arr, 50)),
+        "p95": float(np.percentile(arr, 95)),
+        "max": float(arr.max()),
+    }
+
+
+class ReplaySimulator:
+    """
+    回放模拟器
+
+    在虚拟时钟下运行完整的状态检测线程和主循环线程，结束后汇总钓鱼周期、
+    识别延迟和收线反应时间
+    """
+
+    def __init__(self, window_size=(1920, 1080), seed=0, archive_path=None, target_count=0,
+                 use_match_cache=True, scene_options=None, engine=None, detector=None):
+        """
+        参数:
+            window_size: 合成画面的窗口尺寸
+            seed: 随机种子
+            archive_path: 录制归档路径，指定时回放录制画面而不使用合成画面
+            target_count: 目标钓鱼次数，0表示不限
+            use_match_cache: 是否按画面内容缓存匹配结果
+            scene_options: 传给 FishingScene 的参数
+            engine: 模板匹配引擎名称（见 match.engines.ENGINES）
+            detector: 状态识别器（可选，如 CentroidClassifier），默认由模板匹配器识别状态
+        """
+        self.clock = VirtualClock()
+        self.target_count = target_count
+
+        self.template_matcher = TemplateMatcher(engine)
+        if archive_path:
+            self.scene = ArchiveScene(self.clock, archive_path)
+        else:
+            self.scene = None
+        window_size = (self.scene.window_width, self.scene.window_height) if self.scene else window_size
+        configs = [{"name": name, "path": os.path.join(TEMPLATE_DIR, file_name), "threshold": 0.9}
+                   for name, file_name in TEMPLATE_FILES]
+        self.template_matcher.load_templates(configs, window_size)
+        if self.scene is None:
+            templates = {name: info["image"] for name, info in self.template_matcher.templates.items()}
+            self.scene = FishingScene(self.clock, window_size, templates, seed=seed, **(scene_options or {}))
+
+        self.detector = detector
+        matcher = detector or self.template_matcher
+        if use_match_cache:
+            matcher = ContentKeyedMatcher(matcher, self.scene)
+
+        regions = calculate_fishing_regions(*window_size)
+        self.frame_bus = FrameBus(self.scene, clock=self.clock)
+        ocr_capture = self.frame_bus.register_roi("ocr", regions["ocr"])
+        area_capture = self.frame_bus.register_roi("area", regions["area"])
+
+        self.input_handler = SimulatedInput(self.clock, self.scene)
+        self.mouse = SimulatedMouse(self.clock, self.scene)
+        self.state_events = []
+
+        self.state_handler = StateHandler(matcher, ocr_capture, self.input_handler, clock=self.clock)
+        self.state_handler.subscribe(self.state_events.append)
+        self.line_handler = LineHandler(self.input_handler, area_capture, self.state_handler,
+                                        mouse=self.mouse, clock=self.clock)
+        if use_match_cache:
+            # 拉扯状态检测使用独立的匹配器，同样按画面内容缓存
+            state_matcher = self.line_handler._get_state_matcher()
+            self.line_handler._state_matcher = ContentKeyedMatcher(state_matcher, self.scene)
+        self.main_loop_handler = MainLoopHandler(self.state_handler, self.input_handler, self.line_handler,
+                                                 mouse=self.mouse, clock=self.clock)
+        self.main_loop_handler.reel_key = "right_click"
+        # 保留整段回放的收线反应时间
+        self.main_loop_handler.reel_reaction_times = deque()
+
+    def run(self, duration):
+        """
+        运行模拟
+
+        参数:
+            duration: 虚拟时长（秒），回放录制时不超过录制时长
+
+        返回:
+            统计结果字典
+        """
+        if isinstance(self.scene, ArchiveScene):
+            duration = min(duration, self.scene.duration)
+
+        self.state_handler.reset_state()
+        self.state_handler.set_target_count(self.target_count)
+        self.main_loop_handler.set_continuous_fishing(True, self.target_count)
+        self.state_handler.set_running_state(True)
+        self.main_loop_handler.set_running_state(True)
+
+        wall_start = time.perf_counter()
+        # 模拟线程先登记，保证两个工作线程都登记之前虚拟时间不会推进
+        self.clock.register()
+        self.state_handler.start_detection()
+        self.main_loop_handler.start_main_loop()
+        self.clock.register(self.state_handler.template_thread)
+        self.clock.register(self.main_loop_handler.main_thread)
+
+        while self.clock.time() < duration and not self.state_handler.stop_flag:
+            if not self.main_loop_handler.main_thread.is_alive():
+                break
+            self.clock.sleep(min(1.0, duration - self.clock.time()))
+
+        virtual_elapsed = self.clock.time()
+        self.clock.release()
+        self.state_handler.stop_detection()
+        self.main_loop_handler.stop_main_loop()
+        wall_elapsed = time.perf_counter() - wall_start
+
+        return self._report(virtual_elapsed, wall_elapsed)
+
+    def _expected_transitions(self):
+        """画面上出现的状态变化（参照时间线）"""
+        if isinstance(self.scene, ArchiveScene):
+            return list(self.scene.timeline)
+        expected = []
+        for t, _, template in self.scene.timeline:
+            if template is not None:
+                expected.append((t, TEMPLATE_STATES[template]))
+        return expected
+
+    def _first_after(self, times, t):
+        """times中第一个不早于t的时间与t的差，没有时返回None"""
+        index = bisect_right(times, t - 1e-9)
+        return times[index] - t if index < len(times) else None
+
+    def _report(self, virtual_elapsed, wall_elapsed):
+        observed = [(event.timestamp, event.state) for event in self.state_events]
+        latencies, missed = match_transitions(self._expected_transitions(), observed)
+        click_times = [t for t, action, _ in self.mouse.events if action == "down"]
+
+        # 收线点击延迟：状态切换为收线（事件时间戳）到第一次右键点击，衡量主循环对状态事件的反应速度
+        reel_click = [self._first_after(click_times, event.timestamp) for event in self.state_events if event.state == FishingState.REEL]
+        reel_click = [latency for latency in reel_click if latency is not None]
+
+        report = {
+            "virtual_seconds": virtual_elapsed,
+            "wall_seconds": wall_elapsed,
+            "speedup": virtual_elapsed / wall_elapsed if wall_elapsed > 0 else 0.0,
+            "fishing_count": self.state_handler.fishing_count,
+            "state_transitions": len(self.state_events),
+            "detection_latency": _summarize(latencies),
+            "missed_transitions": missed,
+            "reel_click_latency": _summarize(reel_click),
+            # 收线取消令牌被触发到第一次收线点击
+            "cancel_to_reel_click": _summarize(list(self.main_loop_handler.reel_reaction_times)),
+            "state_machine": self.state_handler.get_state_metrics(),
+            "detection_plan": self.state_handler.get_detection_stats(),
+            "match_engine": self.template_matcher.get_engine_stats(),
+            "prefilter": self.template_matcher.get_prefilter_stats(),
+            # 启用 ContentKeyedMatcher 时重复画面在外层已被缓存，--no-match-cache 时才反映匹配器自身的备忘命中率
+            "match_memo": self.template_matcher.get_memo_stats(),
+            "state_detector": self.detector.get_stats() if self.detector else None,
+            "key_events": len(self.input_handler.events),
+            "mouse_events": len(self.mouse.events),
+        }
+
+        if isinstance(self.scene, FishingScene):
+            # 钓鱼周期：相邻两次成功钓鱼（按F离开结算画面）之间的时间
+            catch_times = [t for t, phase, _ in self.scene.timeline if phase == "idle"]
+            cycles = np.diff(catch_times).tolist() if len(catch_times) > 1 else []
+            # 收线反应时间：收线提示出现在画面上到第一次右键点击（包含识别延迟）
+            reactions = [self._first_after(click_times, t) for t, phase, _ in self.scene.timeline if phase == "reel"]
+            reactions = [latency for latency in reactions if latency is not None]
+            report.update({
+                "catches": self.scene.catches,
+                "escapes": self.scene.escapes,
+                "cycle_time": _summarize(cycles),
+                "reel_reaction": _summarize(reactions),
+            })
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面回放模拟器")
+    parser.add_argument("--minutes", type=float, default=30.0, help="虚拟时长（分钟）")
+    parser.add_argument("--archive", default=None, help="录制归档路径，不指定时使用合成画面")
+    parser.add_argument("--resolution", choices=["720p", "1080p"], default="1080p", help="合成画面分辨率")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--target", type=int, default=0, help="目标钓鱼次数，0表示不限")
+    parser.add_argument("--no-match-cache", action="store_true", help="每次都执行模板匹配（回放会慢很多）")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="opencv", help="模板匹配引擎")
+    parser.add_argument("--model", default=None, help="使用最近质心状态分类模型识别状态（见 match.centroid_classifier）")
+    parser.add_argument("--output", default=None, help="将结果保存为JSON文件")
+    parser.add_argument("--verbose", action="store_true", help="输出处理器的详细日志")
+    args = parser.parse_args()
+
+    # config_manager 导入时已按INFO级别配置了根日志，这里直接调整级别
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    window_size = (1280, 720) if args.resolution == "720p" else (1920, 1080)
+    detector = None
+    if args.model:
+        detector = CentroidClassifier.load(args.model)
+        if detector is None:
+            parser.error(f"无法加载模型文件: {args.model}")
+    simulator = ReplaySimulator(window_size, seed=args.seed, archive_path=args.archive,
+                                target_count=args.target, use_match_cache=not args.no_match_cache,
+                                engine=args.engine, detector=detector)
+    report = simulator.run(args.minutes * 60)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
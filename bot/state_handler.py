@@ -1,28 +1,38 @@
 import logging
 import threading
-import time
-import numpy as np
-import cv2
+from collections import deque, namedtuple
+
+from bot.cancellation import CancellationToken
+from bot.clock import MonotonicClock
+from bot.detection_planner import DetectionPlanner
+from bot.state_machine import FishingState, StateMachine, MIN_TEMPLATE_SCORE, STATE_NAMES, TEMPLATE_STATES
 
 logger = logging.getLogger(__name__)
 
+# 状态变化事件：sequence从1开始递增，timestamp为时钟时间，template和score为触发变化的模板及得分（如有）
+StateEvent = namedtuple("StateEvent", ["sequence", "state", "previous", "timestamp", "template", "score"])
+
 class StateHandler:
     """处理钓鱼状态的类"""
 
-    def __init__(self, template_matcher, ocr_capture, input_handler=None):
+    def __init__(self, template_matcher, ocr_capture, input_handler=None, clock=None):
         """初始化状态处理器
 
         参数:
             template_matcher: 模板匹配器
             temp_capture: OCR区域截图器
             input_handler: 输入控制器（可选，用于检查F9停止信号）
+            clock: 时钟（可选），默认为单调时钟，回放时传入虚拟时钟
         """
         self.template_matcher = template_matcher
         self.ocr_capture = ocr_capture
         self.input_handler = input_handler
+        self.clock = clock or MonotonicClock()
         
-        # 状态变量
-        self.running_state = 0  # 0:未开始，1:收竿/提竿，2:拉扯鱼线，3:收线，4:跳过
+        # 状态机，状态和转换规则见 bot/state_machine.py
+        self.state_machine = StateMachine(clock=self.clock)
+        # 检测计划：按当前状态只匹配接下来可能出现的模板
+        self.detection_planner = self._create_detection_planner()
         self.jerky_line_flag = False  # 是否在拉扯鱼线状态
         self.line_retrieved_flag = False  # 收线操作标志
         
@@ -36,23 +46,181 @@ class StateHandler:
         
         # 检测线程
         self.template_thread = None
+
+        # 状态事件：最近的事件历史和订阅回调
+        self._state_lock = threading.Lock()
+        self._last_event = StateEvent(0, FishingState.IDLE, FishingState.IDLE, self.clock.time(), None, None)
+        self._event_history = deque(maxlen=32)
+        self._subscribers = []
+
+        # 收线取消令牌：切换到收线状态时取消，鱼线处理据此立即中断等待并释放按键
+        self.reel_token = CancellationToken(self.clock)
         
         # 使用统一的状态名称映射
-        try:
-            from utils import STATE_NAMES
-            self.state_names = STATE_NAMES
-        except ImportError:
-            # 如果utils模块不可用，使用本地定义
-            self.state_names = {0: "未开始", 1: "收竿/提竿", 2: "拉扯鱼线", 3: "收线", 4: "跳过"}
+        self.state_names = STATE_NAMES
+
+        self._register_state_actions()
     
+    @property
+    def running_state(self):
+        """当前钓鱼状态（FishingState）"""
+        return self.state_machine.state
+
+    @running_state.setter
+    def running_state(self, value):
+        self.set_state(value)
+
+    @property
+    def last_event(self):
+        """最近一次状态变化事件（尚未变化时为序号0的初始事件）"""
+        return self._last_event
+
+    def set_state(self, state, template_name=None, score=None, trigger=None):
+        """
+        按状态机的转换表切换状态并发布状态事件
+
+        参数:
+            state: 新状态
+            template_name: 触发变化的模板名称（可选）
+            score: 模板匹配得分（可选）
+            trigger: 触发来源（可选），如 "template"、"timeout"、"error"
+
+        返回:
+            StateEvent，状态未变化、转换非法或被守卫拒绝时返回None
+        """
+        with self._state_lock:
+            # 进入/退出动作在锁内随转换一起执行
+            transition = self.state_machine.transition(state, template_name, score, trigger)
+            if transition is None:
+                return None
+            event = StateEvent(self._last_event.sequence + 1, transition.target, transition.source,
+                               transition.timestamp, template_name, score)
+            self._last_event = event
+            self._event_history.append(event)
+
+        # 唤醒所有可中断的等待，主循环和鱼线处理不必等到等待超时
+        self.clock.notify()
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"状态事件回调出错: {e}")
+        return event
+
+    def subscribe(self, callback):
+        """
+        订阅状态变化，回调在切换状态的线程中同步调用
+
+        参数:
+            callback: 回调函数，参数为StateEvent
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """取消订阅状态变化"""
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def wait_for_transition(self, after_sequence=None, states=None, timeout=None):
+        """
+        阻塞等待状态变化
+
+        参数:
+            after_sequence: 只返回序号大于该值的事件，默认为当前最新事件的序号
+            states: 只关心的状态集合，None表示任意状态
+            timeout: 超时时间（秒），None表示一直等待到检测停止
+
+        返回:
+            第一个满足条件的StateEvent，超时或检测已停止时返回None
+        """
+        if after_sequence is None:
+            after_sequence = self._last_event.sequence
+        deadline = None if timeout is None else self.clock.time() + timeout
+
+        while True:
+            with self._state_lock:
+                for event in self._event_history:
+                    if event.sequence > after_sequence and (states is None or event.state in states):
+                        return event
+            if deadline is None:
+                if self.stop_flag:
+                    return None
+                remaining = 1.0
+            else:
+                remaining = deadline - self.clock.time()
+                if remaining <= 0:
+                    return None
+            # 状态变化时 set_state() 会通过时钟唤醒这里的等待
+            self.clock.wait(min(remaining, 1.0))
+
     def set_running_state(self, running, stop_flag=False):
         """设置运行状态"""
         self.running = running
         self.stop_flag = stop_flag
     
+    def _create_detection_planner(self):
+        """按配置创建检测计划，未启用时返回None"""
+        from config_manager import config_manager
+        if not config_manager.get("detection.planner.enabled", True):
+            logger.info("检测计划未启用，每帧匹配全部模板")
+            return None
+        return DetectionPlanner(
+            self.template_matcher,
+            self.state_machine,
+            high_confidence=config_manager.get("detection.planner.high_confidence", 0.95),
+            full_sweep_interval=config_manager.get("detection.planner.full_sweep_interval", 10),
+        )
+
+    def get_detection_stats(self):
+        """获取检测计划统计，未启用检测计划时返回None"""
+        return self.detection_planner.get_stats() if self.detection_planner else None
+
+    def get_state_metrics(self):
+        """获取状态机统计（各状态停留时长、转换次数和非法转换次数）"""
+        with self._state_lock:
+            return self.state_machine.get_metrics()
+
+    def _register_state_actions(self):
+        """登记进入/退出状态时的动作，动作随状态切换同步执行，被唤醒的等待方看到的是一致的标志"""
+        machine = self.state_machine
+        machine.on_enter(FishingState.IDLE, self._on_enter_idle)
+        machine.on_enter(FishingState.PULL, self._on_enter_pull)
+        machine.on_exit(FishingState.PULL, self._on_exit_pull)
+        machine.on_enter(FishingState.REEL, self._on_enter_reel)
+        machine.on_enter(FishingState.SKIP, self._on_enter_skip)
+
+    def _on_enter_idle(self, transition):
+        """回到未开始：清除收线标志"""
+        self.line_retrieved_flag = False
+
+    def _on_enter_pull(self, transition):
+        """进入拉扯鱼线：设置拉扯标志，重置收线取消令牌"""
+        self.jerky_line_flag = True
+        self.reel_token.reset()
+
+    def _on_exit_pull(self, transition):
+        """退出拉扯鱼线：清除拉扯标志"""
+        self.jerky_line_flag = False
+
+    def _on_enter_reel(self, transition):
+        """进入收线：设置收线标志，取消收线令牌（同时唤醒可中断的等待）"""
+        self.line_retrieved_flag = True
+        self.reel_token.cancel("收线")
+        if transition.source == FishingState.PULL:
+            logger.info("从拉扯鱼线状态切换到收线状态，立即停止所有a/d键操作")
+
+    def _on_enter_skip(self, transition):
+        """进入跳过：先检测到收线时计为一次成功钓鱼，并清除收线标志"""
+        if self.line_retrieved_flag:
+            self.fishing_count += 1
+            logger.info(f"成功钓鱼! 当前次数: {self.fishing_count}/{self.target_fishing_count}")
+        else:
+            logger.info("检测到跳过操作，但没有先检测到收线操作，不计入钓鱼次数")
+        self.line_retrieved_flag = False
+
     def reset_state(self):
         """重置状态"""
-        self.running_state = 0
+        self.set_state(FishingState.IDLE, trigger="reset")
         self.jerky_line_flag = False
         self.line_retrieved_flag = False
         self.fishing_count = 0
@@ -82,7 +250,7 @@ class StateHandler:
         # 记录上次检测到的状态，避免重复日志
         last_detected_template = None
         # 计时器，用于检测长时间无匹配的情况
-        no_match_timer = time.time()
+        no_match_timer = self.clock.time()
         # 错误计数器
         error_count = 0
         
@@ -93,114 +261,48 @@ class StateHandler:
                     logger.info("检测到InputHandler停止信号，停止状态检测")
                     self.stop_flag = True
                     break
-                # 截取检测区域的屏幕
-                captures = self.ocr_capture.capture_one_shot()
-                if not captures or 'full_region' not in captures or not captures['full_region']:
-                    time.sleep(0.3)
+                # 截取检测区域的屏幕，直接得到整窗口BGRX数组上的区域视图
+                template_img = self.ocr_capture.capture_region_array()
+                if template_img is None:
+                    self.clock.sleep(0.3)
                     continue
                 
-                # 获取完整区域图像，而不是子区域
-                template_img = captures['full_region']
-                
-                # 确保图像是numpy数组格式，这是OpenCV的要求
-                if not isinstance(template_img, np.ndarray):
-                    # 如果是PIL Image，转换为numpy数组
-                    template_img_cv = cv2.cvtColor(np.array(template_img), cv2.COLOR_RGB2BGR)
+                # 使用模板匹配检测（启用检测计划时只匹配当前状态下可能出现的模板）
+                if self.detection_planner:
+                    match_result = self.detection_planner.detect(template_img, self.running_state)
                 else:
-                    # 已经是numpy数组，确保颜色通道正确
-                    if len(template_img.shape) == 3 and template_img.shape[2] == 3:
-                        template_img_cv = template_img.copy()
-                    else:
-                        # 如果是灰度图或其他格式，可能需要转换
-                        template_img_cv = cv2.cvtColor(template_img, cv2.COLOR_RGB2BGR)
-                
-                # 获取窗口尺寸，用于模板匹配
-                window_size = (self.ocr_capture.window_width, self.ocr_capture.window_height)
-                
-                # 使用模板匹配检测
-                match_result = self.template_matcher.match_template(template_img_cv)
+                    match_result = self.template_matcher.match_template(template_img)
                 
                 # 重置错误计数
                 error_count = 0
-                
-                if not match_result:
+
+                matched = False
+                if match_result:
+                    # 解析模板匹配结果，更新状态
+                    last_detected_template = self._handle_template_match(
+                        match_result["name"], match_result["score"], last_detected_template)
+                    # 只有转换成功或模板本来就对应当前状态时才算有匹配；被状态机拒绝的模板（如收线时仍显示的收竿）
+                    # 按无匹配处理，否则它会一直重置计时器，状态无法超时回到未开始
+                    matched = TEMPLATE_STATES.get(match_result["name"]) == self.running_state
+
+                if matched:
+                    no_match_timer = self.clock.time()
+                else:
                     # 长时间无匹配，重置状态为未开始
-                    if time.time() - no_match_timer > 4:  # 4秒无匹配则重置状态
-                        if self.running_state != 0:
+                    if self.clock.time() - no_match_timer > 4:  # 4秒无匹配则重置状态
+                        if self.running_state != FishingState.IDLE:
                             old_state_name = self.state_names.get(self.running_state, f"未知状态({self.running_state})")
                             
                             logger.info(f"4s无匹配，状态变更: [{old_state_name}] -> [未开始]")
-                            self.running_state = 0
-                            self.line_retrieved_flag = False  # 重置收线标志
-                            no_match_timer = time.time()  # 重置计时器
+                            self.set_state(FishingState.IDLE, trigger="timeout")
+                            no_match_timer = self.clock.time()  # 重置计时器
                             # 将上次检测到的状态记录为"未开始"
                             last_detected_template = "未开始"
                             logger.info("无匹配，当前模板：未开始")
-                    # 减少空检测时的等待时间
-                    time.sleep(0.05)
-                    continue
-                
-                # 有匹配，重置计时器
-                no_match_timer = time.time()
-                
-                # 解析模板匹配结果，更新状态
-                template_name = match_result["name"]
-                match_score = match_result["score"]
-                
-                # 设置匹配得分阈值，避免误识别 (使用TM_SQDIFF_NORMED方法，阈值0.8以上表示成功匹配)
-                min_score_threshold = 0.8
-
-                # 只有当得分超过阈值，并且与上次检测到的状态不同时，才记录日志和切换状态
-                if match_score >= min_score_threshold and template_name != last_detected_template:
-                    old_state = self.running_state
-                    old_state_name = self.state_names.get(old_state, f"未知状态({old_state})")
-                    
-                    logger.info(f"检测到模板: {template_name}, 得分: {match_score:.2f}, 准备切换状态")
-                    last_detected_template = template_name
-                    
-                    # 根据模板名称更新状态 - 使用优化的状态变更方法
-                    if template_name == "收线":
-                        self._change_state_to_reel(old_state_name)
-                    elif template_name == "跳过":
-                        self._change_state_to_skip(old_state_name)
-                        
-                        # 如果已经检测到收线操作，则计为一次成功钓鱼
-                        if self.line_retrieved_flag:
-                            self.fishing_count += 1
-                            logger.info(f"成功钓鱼! 当前次数: {self.fishing_count}/{self.target_fishing_count}")
-                            
-                            # 重置收线标志
-                            self.line_retrieved_flag = False
-                            
-                            # 如果达到目标次数，发出信号
-                            if self.target_fishing_count > 0 and self.fishing_count >= self.target_fishing_count:
-                                logger.info(f"已达到目标钓鱼次数: {self.target_fishing_count}")
-                                self.on_target_reached()
-                        else:
-                            logger.info("检测到跳过操作，但没有先检测到收线操作，不计入钓鱼次数")
-                            # 重置收线标志
-                            self.line_retrieved_flag = False
-                    elif template_name == "收竿" or template_name == "提竿":
-                        self.running_state = 1
-                        self.jerky_line_flag = False
-                        new_state_name = self.state_names.get(self.running_state, f"未知状态({self.running_state})")
-                        logger.info(f"状态变更: [{old_state_name}] -> [{new_state_name}], 检测到收竿/提竿操作")
-                    elif template_name == "拉扯鱼线":
-                        self.running_state = 2
-                        self.jerky_line_flag = True
-                        new_state_name = self.state_names.get(self.running_state, f"未知状态({self.running_state})")
-                        logger.info(f"状态变更: [{old_state_name}] -> [{new_state_name}], 检测到拉扯鱼线操作")
-                    
-                elif match_score >= min_score_threshold:
-                    # 相同状态但匹配度高，只在调试级别记录
-                    logger.debug(f"持续检测到模板: {template_name}, 得分: {match_score:.2f}")
-                else:
-                    # 匹配度不够高，可能是误识别
-                    logger.debug(f"检测到可能的模板: {template_name}, 但得分较低: {match_score:.2f}")
-                    # 设置为"未开始"状态，因为匹配度不够高
-                    if last_detected_template != "未开始":
-                        last_detected_template = "未开始"
-                        logger.info("匹配度不够高，当前模板：未开始")
+                    if not match_result:
+                        # 减少空检测时的等待时间
+                        self.clock.sleep(0.05)
+                        continue
             
             except Exception as e:
                 logger.error(f"模板匹配检测出错: {e}")
@@ -214,24 +316,76 @@ class StateHandler:
                     if hasattr(self.template_matcher, 'scaled_templates'):
                         self.template_matcher.scaled_templates.clear()
                     # 额外等待时间，让系统有机会恢复
-                    time.sleep(1.0)
+                    self.clock.sleep(1.0)
                     # 如果错误次数极多，可能需要重置状态
                     if error_count > 20:
-                        self.running_state = 0
-                        self.jerky_line_flag = False
-                        self.line_retrieved_flag = False
+                        self.set_state(FishingState.IDLE, trigger="error")
                         logger.warning("由于持续错误，已重置钓鱼状态")
                         error_count = 0
             
-            time.sleep(0.1)
+            self.clock.sleep(0.1)
         
         logger.info("模板匹配检测线程已停止")
     
+    def _handle_template_match(self, template_name, match_score, last_detected_template):
+        """
+        按一帧的模板匹配结果切换状态
+
+        参数:
+            template_name: 匹配到的模板名称
+            match_score: 匹配得分
+            last_detected_template: 上一次已处理的模板名称
+
+        返回:
+            新的已处理模板名称。状态机拒绝转换时不记为已处理，模板仍在画面上时下一帧重新尝试
+        """
+        # 设置匹配得分阈值，避免误识别（与状态机守卫条件使用同一阈值）
+        min_score_threshold = MIN_TEMPLATE_SCORE
+
+        # 只有当得分超过阈值，并且与上次已处理的模板不同时，才切换状态
+        if match_score >= min_score_threshold and template_name != last_detected_template:
+            old_state = self.running_state
+            old_state_name = self.state_names.get(old_state, f"未知状态({old_state})")
+
+            # 按状态机的转换表切换状态，进入状态时的动作（标志、计数、取消令牌）由状态机执行
+            target_state = TEMPLATE_STATES.get(template_name)
+            if target_state is None:
+                logger.debug(f"模板 {template_name} 没有对应的状态")
+                return template_name
+            if target_state == old_state:
+                # 状态已经一致（如收竿之后出现提竿），无需切换
+                return template_name
+            if not self.set_state(target_state, template_name, match_score, trigger="template"):
+                logger.debug(f"检测到模板: {template_name}, 得分: {match_score:.2f}, 状态转换被拒绝，下一帧重试")
+                return last_detected_template
+
+            logger.info(f"检测到模板: {template_name}, 得分: {match_score:.2f}")
+            self._log_state_change(old_state_name, self.state_names[target_state], f"检测到模板: {template_name}")
+
+            # 如果达到目标次数，发出信号
+            if (target_state == FishingState.SKIP and self.target_fishing_count > 0
+                    and self.fishing_count >= self.target_fishing_count):
+                logger.info(f"已达到目标钓鱼次数: {self.target_fishing_count}")
+                self.on_target_reached()
+            return template_name
+
+        if match_score >= min_score_threshold:
+            # 相同状态但匹配度高，只在调试级别记录
+            logger.debug(f"持续检测到模板: {template_name}, 得分: {match_score:.2f}")
+            return last_detected_template
+
+        # 匹配度不够高，可能是误识别
+        logger.debug(f"检测到可能的模板: {template_name}, 但得分较低: {match_score:.2f}")
+        # 设置为"未开始"状态，因为匹配度不够高
+        if last_detected_template != "未开始":
+            logger.info("匹配度不够高，当前模板：未开始")
+        return "未开始"
+
     def on_target_reached(self):
         """达到目标钓鱼次数时的回调，可被子类重写"""
         self.stop_flag = True
         self.fishing_count = 0  # 重置钓鱼计数为0
-        self.running_state = 0  # 将运行阶段设为未开始
+        self.set_state(FishingState.IDLE, trigger="target_reached")  # 将运行阶段设为未开始
         logger.info("已达到目标钓鱼次数，重置钓鱼计数为0，并将运行阶段设为未开始")
     
     def set_target_count(self, count):
@@ -247,36 +401,6 @@ class StateHandler:
         """获取当前钓鱼次数"""
         return self.fishing_count
 
-    def _change_state_to_reel(self, old_state_name):
-        """
-        切换到收线状态 - 优化版本，减少重复代码
-
-        参数:
-            old_state_name: 旧状态名称
-        """
-        old_running_state = self.running_state
-        self.running_state = 3
-        self.jerky_line_flag = False
-        self.line_retrieved_flag = True  # 设置收线标志为True
-
-        # 使用统一的日志记录方法
-        self._log_state_change(old_state_name, "收线", "检测到收线操作，设置收线标志")
-
-        # 如果之前处于拉扯鱼线状态，立即通知所有相关组件停止a/d键操作
-        if old_running_state == 2:
-            logger.info("从拉扯鱼线状态切换到收线状态，立即停止所有a/d键操作")
-
-    def _change_state_to_skip(self, old_state_name):
-        """
-        切换到跳过状态 - 优化版本，减少重复代码
-
-        参数:
-            old_state_name: 旧状态名称
-        """
-        self.running_state = 4
-        self.jerky_line_flag = False
-        self._log_state_change(old_state_name, "跳过")
-
     def _log_state_change(self, old_state_name, new_state_name, additional_info=""):
         """
         统一的状态变更日志记录
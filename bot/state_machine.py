@@ -0,0 +1,226 @@
+"""
+钓鱼状态机
+以声明式的转换表描述钓鱼过程：状态、允许的转换、守卫条件，以及进入/退出状态时的动作。
+StateMachine 按转换表执行状态切换，记录每个状态的进入时间和停留时长，
+并统计被拒绝的非法转换，便于在指标中发现误识别
+"""
+
+import logging
+from collections import Counter, namedtuple
+from enum import IntEnum
+
+from bot.clock import MonotonicClock
+
+logger = logging.getLogger(__name__)
+
+
+class FishingState(IntEnum):
+    """钓鱼状态，数值与原有的 running_state 保持一致"""
+    IDLE = 0  # 未开始
+    HOOK = 1  # 收竿/提竿
+    PULL = 2  # 拉扯鱼线
+    REEL = 3  # 收线
+    SKIP = 4  # 跳过
+
+
+STATE_NAMES = {
+    FishingState.IDLE: "未开始",
+    FishingState.HOOK: "收竿/提竿",
+    FishingState.PULL: "拉扯鱼线",
+    FishingState.REEL: "收线",
+    FishingState.SKIP: "跳过",
+}
+
+# 模板 -> 检测到该模板时切换到的状态
+TEMPLATE_STATES = {
+    "收竿": FishingState.HOOK,
+    "提竿": FishingState.HOOK,
+    "拉扯鱼线": FishingState.PULL,
+    "收线": FishingState.REEL,
+    "跳过": FishingState.SKIP,
+}
+
+# 模板名称 -> 模板文件名（img/templates 及其分辨率子目录下），按匹配顺序排列；
+# FishingBot._get_template_configs、模拟器、标定、分类器训练和基准测试共用
+TEMPLATE_FILES = [
+    ("收竿", "collect.png"),
+    ("提竿", "cast.png"),
+    ("拉扯鱼线", "pull.png"),
+    ("收线", "reel.png"),
+    ("跳过", "skip.png"),
+]
+
+# 允许的转换：源状态 -> 可以切换到的状态
+# 任何状态都可以回到未开始（超时、出错和结算后的重置）；
+# 收线之后不会再出现提竿，结算画面之后只有重新抛竿才会出现提竿
+TRANSITIONS = {
+    FishingState.IDLE: {FishingState.HOOK, FishingState.PULL, FishingState.REEL, FishingState.SKIP},
+    FishingState.HOOK: {FishingState.IDLE, FishingState.PULL, FishingState.REEL, FishingState.SKIP},
+    FishingState.PULL: {FishingState.IDLE, FishingState.HOOK, FishingState.REEL, FishingState.SKIP},
+    FishingState.REEL: {FishingState.IDLE, FishingState.PULL, FishingState.SKIP},
+    FishingState.SKIP: {FishingState.IDLE, FishingState.HOOK},
+}
+
+# 模板匹配得分阈值（TM_SQDIFF_NORMED，0.8以上表示成功匹配）
+MIN_TEMPLATE_SCORE = 0.8
+
+# 转换请求：trigger 为触发来源（"template"、"timeout"、"error" 等），timestamp 为时钟时间
+Transition = namedtuple("Transition", ["source", "target", "template", "score", "trigger", "timestamp"])
+
+
+def template_score_guard(transition):
+    """由模板触发的转换要求匹配得分达到阈值"""
+    return transition.score is None or transition.score >= MIN_TEMPLATE_SCORE
+
+
+# 守卫条件：目标状态 -> 守卫函数列表，任一守卫返回False时拒绝转换
+GUARDS = {
+    FishingState.HOOK: [template_score_guard],
+    FishingState.PULL: [template_score_guard],
+    FishingState.REEL: [template_score_guard],
+    FishingState.SKIP: [template_score_guard],
+}
+
+
+class StateMachine:
+    """按转换表执行状态切换的状态机（不加锁，由调用方保证串行调用）"""
+
+    def __init__(self, transitions=None, guards=None, clock=None, initial=FishingState.IDLE):
+        """
+        参数:
+            transitions: 转换表，默认为 TRANSITIONS
+            guards: 守卫条件，默认为 GUARDS
+            clock: 时钟（可选），默认为单调时钟
+            initial: 初始状态
+        """
+        transitions = TRANSITIONS if transitions is None else transitions
+        guards = GUARDS if guards is None else guards
+        self.clock = clock or MonotonicClock()
+
+        # 转换表转为不可变集合，合法性检查为O(1)查找
+        self._allowed = {FishingState(state): frozenset(targets) for state, targets in transitions.items()}
+        self._guards = {FishingState(state): tuple(funcs) for state, funcs in guards.items()}
+        self._on_enter = {}
+        self._on_exit = {}
+
+        # 每个状态接下来可能出现的模板（保持当前状态的模板和可转换到的状态的模板）
+        self._next_templates = {
+            state: tuple(name for name, target in TEMPLATE_STATES.items()
+                         if target == state or target in allowed)
+            for state, allowed in self._allowed.items()
+        }
+
+        self.state = FishingState(initial)
+        now = self.clock.time()
+        # 每个状态最近一次进入和退出的时间、累计停留时长和进入次数
+        self.entered_at = {self.state: now}
+        self.exited_at = {}
+        self.time_in_state = dict.fromkeys(FishingState, 0.0)
+        self.visits = Counter({self.state: 1})
+        # 转换统计：(源状态, 目标状态) -> 次数
+        self.transition_counts = Counter()
+        self.illegal_transitions = Counter()
+        # 当前状态下已经警告过的非法转换，同一转换在状态变化之前只警告一次（误识别的模板会逐帧重复）
+        self._warned_illegal = set()
+        self.guard_rejections = Counter()
+
+    def on_enter(self, state, action):
+        """登记进入状态时的动作，action(transition) 在状态切换后、通知等待方之前执行"""
+        self._on_enter.setdefault(FishingState(state), []).append(action)
+
+    def on_exit(self, state, action):
+        """登记退出状态时的动作，action(transition) 在状态切换前执行"""
+        self._on_exit.setdefault(FishingState(state), []).append(action)
+
+    def can_transition(self, source, target):
+        """转换表是否允许从 source 切换到 target"""
+        return target in self._allowed.get(source, ())
+
+    def next_templates(self, state=None):
+        """
+        指定状态（默认为当前状态）下可能出现的模板名称，用于有针对性地匹配
+
+        返回:
+            tuple: 模板名称
+        """
+        return self._next_templates.get(self.state if state is None else state, ())
+
+    def transition(self, target, template=None, score=None, trigger=None):
+        """
+        切换到目标状态
+
+        参数:
+            target: 目标状态
+            template: 触发转换的模板名称（可选）
+            score: 模板匹配得分（可选）
+            trigger: 触发来源（可选）
+
+        返回:
+            Transition，状态未变化、转换非法或被守卫拒绝时返回None
+        """
+        target = FishingState(target)
+        source = self.state
+        if target == source:
+            return None
+
+        if target not in self._allowed.get(source, ()):
+            self.illegal_transitions[(source, target)] += 1
+            message = (f"非法状态转换被拒绝: [{STATE_NAMES[source]}] -> [{STATE_NAMES[target]}]"
+                       f"（模板: {template}, 来源: {trigger}）")
+            if target in self._warned_illegal:
+                logger.debug(message)
+            else:
+                self._warned_illegal.add(target)
+                logger.warning(message)
+            return None
+
+        transition = Transition(source, target, template, score, trigger, self.clock.time())
+        for guard in self._guards.get(target, ()):
+            if not guard(transition):
+                self.guard_rejections[(source, target)] += 1
+                logger.debug(f"状态转换被守卫条件 {guard.__name__} 拒绝: "
+                             f"[{STATE_NAMES[source]}] -> [{STATE_NAMES[target]}]")
+                return None
+
+        for action in self._on_exit.get(source, ()):
+            action(transition)
+
+        now = transition.timestamp
+        self._warned_illegal.clear()
+        self.time_in_state[source] += now - self.entered_at[source]
+        self.exited_at[source] = now
+        self.state = target
+        self.entered_at[target] = now
+        self.visits[target] += 1
+        self.transition_counts[(source, target)] += 1
+
+        for action in self._on_enter.get(target, ()):
+            action(transition)
+        return transition
+
+    def time_in_current_state(self):
+        """当前状态已停留的时间（秒）"""
+        return self.clock.time() - self.entered_at[self.state]
+
+    def get_metrics(self):
+        """
+        获取状态机统计
+
+        返回:
+            dict: 当前状态、各状态的进入次数和累计停留时长、转换次数、非法转换和守卫拒绝次数
+        """
+        def pairs(counter):
+            return {f"{STATE_NAMES[source]}->{STATE_NAMES[target]}": count
+                    for (source, target), count in counter.items()}
+
+        time_in_state = dict(self.time_in_state)
+        time_in_state[self.state] += self.time_in_current_state()
+        return {
+            "state": STATE_NAMES[self.state],
+            "visits": {STATE_NAMES[state]: self.visits[state] for state in FishingState},
+            "time_in_state": {STATE_NAMES[state]: seconds for state, seconds in time_in_state.items()},
+            "transitions": pairs(self.transition_counts),
+            "illegal_transitions": pairs(self.illegal_transitions),
+            "illegal_total": sum(self.illegal_transitions.values()),
+            "guard_rejections": pairs(self.guard_rejections),
+        }
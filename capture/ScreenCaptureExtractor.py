@@ -8,14 +8,19 @@ import ctypes
 from PIL import Image
 from collections import deque
 
+from capture.background_capture import BackgroundCapture
+from capture.frame_source import FrameSource
+from capture.frame_utils import bgrx_buffer_to_array, crop_view
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class ScreenCaptureExtractor:
+class ScreenCaptureExtractor(FrameSource):
     """
     屏幕截图提取器
     用于指定窗口和区域的快速截图，自动计算大区域和小区域
+    作为FrameSource的GDI实现，capture_array返回整个窗口的BGRX数组
     """
     # PrintWindow API 常量
     PW_CLIENTONLY = 1
@@ -47,6 +52,9 @@ class ScreenCaptureExtractor:
         self.frame_times = deque(maxlen=100)
         self.last_fps = 0
         
+        # 后台截图线程（可选）
+        self.background_capture = None
+        
         # 如果提供了位置，计算大区域
         if self.positions:
             self.calculate_capture_region()
@@ -121,6 +129,109 @@ class ScreenCaptureExtractor:
         返回:
             成功返回PIL Image对象，失败返回None
         """
+        grabbed = self._grab_window_bits(method)
+        if grabbed is None:
+            return None
+        
+        bmpstr, width, height = grabbed
+        try:
+            # 转换为PIL图像
+            return Image.frombuffer('RGB', (width, height), bmpstr, 'raw', 'BGRX', 0, 1)
+        except Exception as e:
+            logger.error(f"窗口截图转换失败: {e}")
+            return None
+    
+    def capture_array(self, method="auto"):
+        """
+        截取整个窗口，直接返回GDI位图数据的NumPy视图，不经过PIL
+        后台截图线程运行时，无阻塞地返回环形缓冲区中的最新帧
+        
+        参数:
+            method: 截图方法，可以是"auto"、"printwindow"或"bitblt"
+            
+        返回:
+            成功返回形状为 (height, width, 4) 的BGRX数组，失败返回None
+        """
+        if self.background_capture is not None and self.background_capture.running:
+            return self.background_capture.read_latest()
+        return self._capture_array_direct(method)
+    
+    def capture_fresh_array(self):
+        """
+        获取新截取的整窗口帧
+        后台截图线程运行时，等待调用之后生产的下一帧
+        """
+        if self.background_capture is not None and self.background_capture.running:
+            return self.background_capture.wait_for_next()
+        return self._capture_array_direct()
+    
+    def start_background_capture(self, target_fps=30, buffer_size=3):
+        """
+        启动后台截图线程，之后的截图请求直接读取最新帧，不再阻塞在GDI调用上
+        
+        参数:
+            target_fps: 目标截图帧率
+            buffer_size: 环形缓冲区槽位数
+        """
+        if self.background_capture is not None and self.background_capture.running:
+            logger.warning("后台截图线程已在运行")
+            return
+        self.background_capture = BackgroundCapture(self._capture_array_direct, target_fps, buffer_size)
+        self.background_capture.start()
+    
+    def stop_background_capture(self):
+        """停止后台截图线程，恢复同步截图"""
+        if self.background_capture is not None:
+            self.background_capture.stop()
+    
+    def get_capture_stats(self):
+        """
+        获取截图统计信息
+        
+        返回:
+            字典，包含截图帧率，后台线程运行时还包含使用者延迟和丢帧数
+        """
+        stats = {"fps": self.get_fps(), "background": False}
+        if self.background_capture is not None:
+            stats.update(self.background_capture.get_stats())
+            stats["background"] = self.background_capture.running
+        return stats
+    
+    def _capture_array_direct(self, method="auto"):
+        """在当前线程同步截取整个窗口，返回BGRX数组"""
+        grabbed = self._grab_window_bits(method)
+        if grabbed is None:
+            return None
+        
+        bmpstr, width, height = grabbed
+        return bgrx_buffer_to_array(bmpstr, width, height)
+    
+    def capture_region_array(self, method="auto"):
+        """
+        截取大区域，返回整窗口数组上的视图
+        
+        返回:
+            成功返回 (h, w, 4) 的BGRX数组视图，失败返回None
+        """
+        if not self.capture_region:
+            logger.error("未计算大区域")
+            return None
+        
+        frame = self.capture_array(method)
+        if frame is None:
+            return None
+        return crop_view(frame, self.capture_region)
+    
+    def _grab_window_bits(self, method="auto"):
+        """
+        使用GDI截取整个窗口的原始位图数据
+        
+        参数:
+            method: 截图方法，可以是"auto"、"printwindow"或"bitblt"
+            
+        返回:
+            成功返回 (BGRX字节数据, 宽度, 高度)，失败返回None
+        """
         if not self.hwnd:
             logger.error("未设置窗口句柄")
             return None
@@ -204,12 +315,6 @@ class ScreenCaptureExtractor:
             bmpinfo = save_bitmap.GetInfo()
             bmpstr = save_bitmap.GetBitmapBits(True)
             
-            # 转换为PIL图像
-            img = Image.frombuffer(
-                'RGB',
-                (bmpinfo['bmWidth'], bmpinfo['bmHeight']),
-                bmpstr, 'raw', 'BGRX', 0, 1)
-            
             # 清理资源
             win32gui.DeleteObject(save_bitmap.GetHandle())
             save_dc.DeleteDC()
@@ -223,7 +328,7 @@ class ScreenCaptureExtractor:
                 if elapsed > 0:
                     self.last_fps = (len(self.frame_times) - 1) / elapsed
             
-            return img
+            return bmpstr, bmpinfo['bmWidth'], bmpinfo['bmHeight']
         except Exception as e:
             logger.error(f"窗口截图失败: {e}")
             return None
@@ -363,7 +468,9 @@ class ScreenCaptureExtractor:
         }
     
     def get_fps(self):
-        """获取当前FPS"""
+        """获取当前FPS，后台截图线程运行时为其生产帧率"""
+        if self.background_capture is not None and self.background_capture.running:
+            return self.background_capture.get_fps()
         return self.last_fps
     
     def update_window_size(self):
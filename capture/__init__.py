@@ -1,14 +1,4 @@
-import ctypes
-import logging
-import time
-from ctypes import windll
-import cv2
-import numpy as np
-import psutil
-import pythoncom
-import win32api
-import win32con
-import win32gui
-import win32print
-import win32process
-from PIL import Image
+"""
+capture 包
+包含窗口截图和帧处理相关模块
+"""
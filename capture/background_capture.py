@@ -0,0 +1,189 @@
+"""
+后台截图线程
+生产者线程按目标帧率截图并写入预分配的环形缓冲区，使用者无阻塞地读取最新帧，
+未被读取就被新帧覆盖的旧帧计为丢弃
+
+生产者不分配内存；使用者每次读取得到最新帧的副本（一次整窗口分配和复制，1080p BGRX约8MB），
+调用方可以任意长时间持有，复制的字节数计入统计 read_copy_mb
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundCapture:
+    """后台截图线程与最新帧优先的环形缓冲区"""
+
+    def __init__(self, grab, target_fps=30, buffer_size=3):
+        """
+        参数:
+            grab: 截图函数，返回整窗口数组或None
+            target_fps: 目标生产帧率
+            buffer_size: 环形缓冲区槽位数，至少为2（生产者写入的槽位总是与最新帧不同）
+        """
+        self.grab = grab
+        self.target_fps = target_fps
+        self.buffer_size = max(2, buffer_size)
+
+        self._ring = None
+        self._write_index = 0
+        self._latest_slot = None
+        self._latest_sequence = 0
+        self._latest_timestamp = 0.0
+        self._consumed_sequence = 0
+
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # 统计信息
+        self.produced_count = 0
+        self.dropped_count = 0
+        self.failed_count = 0
+        self.read_count = 0
+        self.copy_bytes = 0
+        self.frame_times = deque(maxlen=100)
+        self.lags = deque(maxlen=200)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动生产者线程"""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._produce_loop, daemon=True)
+        self._thread.start()
+        logger.info(f"后台截图线程已启动，目标帧率: {self.target_fps}, 缓冲区: {self.buffer_size}")
+
+    def stop(self):
+        """停止生产者线程"""
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2)
+        self._thread = None
+        logger.info(f"后台截图线程已停止，统计: {self.get_stats()}")
+
+    def _produce_loop(self):
+        """生产者循环，按目标帧率截图"""
+        period = 1.0 / self.target_fps if self.target_fps > 0 else 0.0
+        while not self._stop_event.is_set():
+            start = time.time()
+            try:
+                frame = self.grab()
+            except Exception as e:
+                logger.error(f"后台截图出错: {e}")
+                frame = None
+
+            if frame is None:
+                self.failed_count += 1
+            else:
+                self._publish(frame)
+
+            remaining = period - (time.time() - start)
+            if remaining > 0:
+                self._stop_event.wait(remaining)
+
+    def _publish(self, frame):
+        """将新帧复制到环形缓冲区并发布为最新帧"""
+        if self._ring is None or self._ring[0].shape != frame.shape:
+            # 首帧或窗口尺寸变化时分配缓冲区，之后只复制不分配。
+            # 替换缓冲区时撤销最新帧：旧的槽位下标在新缓冲区中指向尚未写入的槽位，新帧发布之前读取返回None
+            with self._condition:
+                self._ring = [np.empty_like(frame) for _ in range(self.buffer_size)]
+                self._write_index = 0
+                self._latest_slot = None
+
+        slot = self._write_index
+        np.copyto(self._ring[slot], frame)
+        self._write_index = (slot + 1) % self.buffer_size
+        timestamp = time.time()
+
+        with self._condition:
+            # 上一帧从未被读取就被覆盖为旧帧，计为丢弃
+            if self._latest_sequence > self._consumed_sequence:
+                self.dropped_count += 1
+            self._latest_slot = slot
+            self._latest_sequence += 1
+            self._latest_timestamp = timestamp
+            self.produced_count += 1
+            self.frame_times.append(timestamp)
+            self._condition.notify_all()
+
+    def _take_latest(self):
+        """在持有锁的情况下复制最新帧并记录延迟
+
+        生产者只写入最新帧以外的槽位，持有锁时最新帧槽位不会被改写；
+        返回副本，调用方持有帧期间不受后续生产周期覆盖槽位的影响
+        """
+        if self._latest_slot is None:
+            return None
+        self._consumed_sequence = self._latest_sequence
+        self.read_count += 1
+        self.lags.append(time.time() - self._latest_timestamp)
+        frame = self._ring[self._latest_slot]
+        self.copy_bytes += frame.nbytes
+        return frame.copy()
+
+    def read_latest(self):
+        """
+        无阻塞地读取最新帧
+
+        返回:
+            最新帧数组的副本，尚无帧时返回None
+        """
+        with self._condition:
+            return self._take_latest()
+
+    def wait_for_next(self, timeout=None):
+        """
+        等待调用之后生产的下一帧
+
+        参数:
+            timeout: 超时时间（秒），None表示按目标帧率等待两个周期
+
+        返回:
+            新帧数组，超时或线程已停止时返回当前最新帧
+        """
+        if timeout is None:
+            timeout = 2.0 / self.target_fps if self.target_fps > 0 else 0.1
+        with self._condition:
+            sequence = self._latest_sequence
+            self._condition.wait_for(
+                lambda: self._latest_sequence > sequence or self._stop_event.is_set(), timeout
+            )
+            return self._take_latest()
+
+    def get_fps(self):
+        """获取生产帧率"""
+        with self._condition:
+            if len(self.frame_times) < 2:
+                return 0
+            elapsed = self.frame_times[-1] - self.frame_times[0]
+            return (len(self.frame_times) - 1) / elapsed if elapsed > 0 else 0
+
+    def get_stats(self):
+        """获取生产帧率、使用者延迟和丢帧统计"""
+        fps = self.get_fps()
+        with self._condition:
+            lags = list(self.lags)
+            return {
+                "production_fps": fps,
+                "produced": self.produced_count,
+                "read": self.read_count,
+                "read_copy_mb": self.copy_bytes / (1024 * 1024),
+                "dropped": self.dropped_count,
+                "failed": self.failed_count,
+                "lag_avg_ms": float(np.mean(lags) * 1000) if lags else 0.0,
+                "lag_max_ms": float(np.max(lags) * 1000) if lags else 0.0,
+            }
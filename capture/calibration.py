@@ -0,0 +1,297 @@
+"""
+检测区域标定
+扫描录制的会话归档，统计每个模板和拉扯阶段黄色区域在窗口中实际出现的范围，
+加上安全边距后按分辨率保存为锚点文件。启动时截图层按锚点收缩检测区域，
+匹配器只在每个模板的锚点范围内搜索，需要截取和搜索的像素大幅减少
+
+用法:
+    python -m capture.calibration recordings/session_xxx.nkrec [更多归档...] [--margin 16] [--output ./anchors]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# 添加项目根目录到Python路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from bot.state_machine import TEMPLATE_FILES
+from capture.frame_utils import to_bgr
+from capture.region_capture import calculate_fishing_regions
+from capture.session_recorder import RECORD_FRAME, SessionArchive
+
+logger = logging.getLogger(__name__)
+
+ANCHOR_VERSION = 1
+
+# 拉扯阶段黄色区域的HSV范围（与 LineHandler 的面积检测阈值一致）
+YELLOW_LOWER = np.array([22, 54, 250])
+YELLOW_UPPER = np.array([25, 88, 255])
+# 小于该面积的黄色轮廓视为噪点
+MIN_YELLOW_AREA = 20
+
+
+def anchor_path(window_size, directory="./anchors"):
+    """锚点文件路径，每个分辨率一个文件，如 anchors/1920x1080.json"""
+    return os.path.join(directory, f"{window_size[0]}x{window_size[1]}.json")
+
+
+def load_anchors(window_size, directory="./anchors"):
+    """
+    加载指定分辨率的锚点文件
+
+    参数:
+        window_size: 窗口尺寸 (width, height)
+        directory: 锚点目录
+
+    返回:
+        锚点字典，文件不存在或无效时返回None
+    """
+    path = anchor_path(window_size, directory)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            anchors = json.load(f)
+        if anchors.get("version") != ANCHOR_VERSION or tuple(anchors.get("window", ())) != tuple(window_size):
+            logger.warning(f"锚点文件与当前窗口尺寸或版本不符，忽略: {path}")
+            return None
+        logger.info(f"已加载检测区域锚点: {path}")
+        return anchors
+    except Exception as e:
+        logger.error(f"加载锚点文件 {path} 失败: {e}")
+        return None
+
+
+def save_anchors(anchors, directory="./anchors"):
+    """保存锚点文件，返回文件路径"""
+    os.makedirs(directory, exist_ok=True)
+    path = anchor_path(anchors["window"], directory)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(anchors, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def template_search_regions(anchors, ocr_region):
+    """
+    将锚点中各模板的窗口坐标范围换算为相对模板匹配区域的坐标
+
+    参数:
+        anchors: 锚点字典
+        ocr_region: 模板匹配区域 (x, y, w, h)
+
+    返回:
+        字典 {模板名称: (x, y, w, h)}，超出区域的部分会被裁剪
+    """
+    rx, ry, rw, rh = ocr_region
+    regions = {}
+    for name, (x, y, w, h) in anchors.get("templates", {}).items():
+        x0, y0 = max(0, x - rx), max(0, y - ry)
+        x1, y1 = min(rw, x + w - rx), min(rh, y + h - ry)
+        if x1 > x0 and y1 > y0:
+            regions[name] = (x0, y0, x1 - x0, y1 - y0)
+    return regions
+
+
+def _union(box, other):
+    """合并两个 (x0, y0, x1, y1) 边界"""
+    if box is None:
+        return other
+    return (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+
+
+def _expand(box, margin, window_size):
+    """边界加上边距并裁剪到窗口内，返回 (x, y, w, h)"""
+    x0, y0, x1, y1 = box
+    x0, y0 = max(0, x0 - margin), max(0, y0 - margin)
+    x1, y1 = min(window_size[0], x1 + margin), min(window_size[1], y1 + margin)
+    return [int(x0), int(y0), int(x1 - x0), int(y1 - y0)]
+
+
+class AnchorCalibrator:
+    """从录制帧中统计模板和黄色区域出现范围的标定器"""
+
+    def __init__(self, window_size, template_configs, margin=16):
+        """
+        参数:
+            window_size: 窗口尺寸 (width, height)
+            template_configs: 模板配置列表（与 TemplateMatcher.load_templates 相同）
+            margin: 安全边距（像素）
+        """
+        from match.template_matcher import TemplateMatcher
+
+        self.window_size = tuple(window_size)
+        self.margin = margin
+        self.matcher = TemplateMatcher()
+        self.matcher.load_templates(template_configs, self.window_size)
+        # 标定需要每个模板在整个区域内的真实位置
+        self.matcher.tracking_enabled = False
+
+        self.template_boxes = {}
+        self.template_hits = {}
+        self.yellow_box = None
+        self.yellow_hits = 0
+        self.frames = {"ocr": 0, "area": 0}
+
+    def add_ocr_frame(self, image, region):
+        """统计模板匹配区域帧中各模板的位置"""
+        self.frames["ocr"] += 1
+        rx, ry = region[0], region[1]
+        for name, template_info in self.matcher.templates.items():
+            match = self.matcher.match_template(image, name)
+            if not match:
+                continue
+            x, y = match["location"]
+            t_w, t_h = template_info["size"]
+            box = (rx + x, ry + y, rx + x + t_w, ry + y + t_h)
+            self.template_boxes[name] = _union(self.template_boxes.get(name), box)
+            self.template_hits[name] = self.template_hits.get(name, 0) + 1
+
+    def add_area_frame(self, image, region):
+        """统计面积检测区域帧中黄色区域（最大轮廓）的位置"""
+        self.frames["area"] += 1
+        hsv = cv2.cvtColor(to_bgr(image), cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, YELLOW_LOWER, YELLOW_UPPER)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return
+        contour = max(contours, key=cv2.contourArea)
+        if cv2.contourArea(contour) < MIN_YELLOW_AREA:
+            return
+        x, y, w, h = cv2.boundingRect(contour)
+        rx, ry = region[0], region[1]
+        self.yellow_box = _union(self.yellow_box, (rx + x, ry + y, rx + x + w, ry + y + h))
+        self.yellow_hits += 1
+
+    def build(self):
+        """
+        生成锚点
+
+        返回:
+            锚点字典：各模板的出现范围、收缩后的检测区域和统计信息；
+            有模板从未出现时保留默认的模板匹配区域，未录制到黄色区域时保留默认的面积检测区域
+        """
+        defaults = calculate_fishing_regions(*self.window_size)
+        templates = {name: _expand(box, self.margin, self.window_size) for name, box in self.template_boxes.items()}
+        regions = {}
+
+        missing = [name for name in self.matcher.templates if name not in templates]
+        if templates and not missing:
+            ocr_box = None
+            for x, y, w, h in templates.values():
+                ocr_box = _union(ocr_box, (x, y, x + w, y + h))
+            regions["ocr"] = _expand(ocr_box, 0, self.window_size)
+        else:
+            regions["ocr"] = list(defaults["ocr"])
+            if missing:
+                logger.warning(f"以下模板在录制中从未出现，保留默认的模板匹配区域: {missing}")
+
+        if self.yellow_box is not None:
+            regions["area"] = _expand(self.yellow_box, self.margin, self.window_size)
+        else:
+            regions["area"] = list(defaults["area"])
+            logger.warning("录制中没有检测到黄色区域（需要录制 area 区域），保留默认的面积检测区域")
+
+        return {
+            "version": ANCHOR_VERSION,
+            "window": list(self.window_size),
+            "margin": self.margin,
+            "regions": regions,
+            "templates": templates,
+            "samples": {"frames": dict(self.frames), "templates": dict(self.template_hits), "yellow": self.yellow_hits},
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+def calibrate_archives(paths, template_configs, margin=16, step=1):
+    """
+    标定一个或多个录制归档
+
+    参数:
+        paths: 归档路径列表
+        template_configs: 模板配置列表
+        margin: 安全边距（像素）
+        step: 每隔多少帧取样一次
+
+    返回:
+        字典 {窗口尺寸: 锚点字典}，不同分辨率的录制分别标定
+    """
+    calibrators = {}
+    for path in paths:
+        archive = SessionArchive(path)
+        try:
+            _scan_archive(archive, calibrators, template_configs, margin, step)
+        finally:
+            archive.close()
+    return {window_size: calibrator.build() for window_size, calibrator in calibrators.items()}
+
+
+def _scan_archive(archive, calibrators, template_configs, margin, step):
+    """将归档中的帧交给对应分辨率的标定器（原始编码的帧是内存映射上的视图，不能在关闭归档后持有）"""
+    for count, (index, _) in enumerate(archive.iter_records(RECORD_FRAME)):
+        if count % step:
+            continue
+        image, meta = archive.read_frame(index)
+        window_size = tuple(meta.get("window", (image.shape[1], image.shape[0])))
+        region = meta.get("region", (0, 0, image.shape[1], image.shape[0]))
+        calibrator = calibrators.get(window_size)
+        if calibrator is None:
+            calibrator = AnchorCalibrator(window_size, template_configs, margin)
+            calibrators[window_size] = calibrator
+        if meta.get("roi") == "ocr":
+            calibrator.add_ocr_frame(image, region)
+        elif meta.get("roi") == "area":
+            calibrator.add_area_frame(image, region)
+
+
+def summarize_anchors(anchors):
+    """对比默认区域，统计锚点减少的截图和搜索像素"""
+    defaults = calculate_fishing_regions(*anchors["window"])
+    summary = {}
+    for name, (x, y, w, h) in anchors["regions"].items():
+        default_pixels = defaults[name][2] * defaults[name][3]
+        summary[name] = {"region": [x, y, w, h], "pixels": w * h, "default_pixels": default_pixels,
+                         "ratio": w * h / default_pixels if default_pixels else 1.0}
+    ocr_pixels = anchors["regions"]["ocr"][2] * anchors["regions"]["ocr"][3]
+    summary["templates"] = {
+        name: {"search_pixels": w * h, "ratio": w * h / ocr_pixels if ocr_pixels else 1.0}
+        for name, (x, y, w, h) in template_search_regions(anchors, anchors["regions"]["ocr"]).items()
+    }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从录制归档标定检测区域锚点")
+    parser.add_argument("archives", nargs="+", help="录制归档路径")
+    parser.add_argument("--margin", type=int, default=16, help="安全边距（像素）")
+    parser.add_argument("--step", type=int, default=1, help="每隔多少帧取样一次")
+    parser.add_argument("--output", default="./anchors", help="锚点文件目录")
+    parser.add_argument("--templates", default=os.path.join(ROOT_DIR, "img", "templates"), help="模板目录")
+    parser.add_argument("--dry-run", action="store_true", help="只输出结果，不保存锚点文件")
+    args = parser.parse_args()
+
+    template_configs = [{"name": name, "path": os.path.join(args.templates, file_name), "threshold": 0.9}
+                        for name, file_name in TEMPLATE_FILES]
+
+    results = calibrate_archives(args.archives, template_configs, args.margin, max(1, args.step))
+    if not results:
+        print("归档中没有帧记录")
+        return
+
+    for anchors in results.values():
+        report = {"anchors": anchors, "summary": summarize_anchors(anchors)}
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if not args.dry_run:
+            print(f"锚点已保存: {save_anchors(anchors, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
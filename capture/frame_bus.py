@@ -0,0 +1,243 @@
+"""
+帧总线
+每个时刻只执行一次整窗口截图，并将最新帧（带序号和时间戳）发布给所有使用者，
+各检测区域以视图的形式从同一帧中截取；连续的截图请求在最大帧龄内直接复用最新帧
+"""
+
+import logging
+import threading
+from collections import namedtuple
+
+from bot.clock import MonotonicClock
+from capture.frame_source import FrameSource
+from capture.frame_utils import crop_view
+from capture.region_capture import RegionCapture
+
+logger = logging.getLogger(__name__)
+
+# 已发布的帧：data为整窗口数组，sequence从1开始递增，timestamp为截图完成时的时钟时间
+Frame = namedtuple("Frame", ["data", "sequence", "timestamp"])
+
+
+class FrameBus(FrameSource):
+    """
+    帧总线
+
+    多个线程同时请求截图时，只有第一个请求会真正截图，其余请求等待并共享同一帧，
+    因此截图开销不会随使用者数量增长。最新帧的帧龄不超过max_age时，
+    capture_array() 直接返回缓存帧；capture_fresh_array() 总是使用调用之后才开始的截图
+    """
+
+    def __init__(self, frame_source, max_age=0.0, clock=None):
+        """
+        参数:
+            frame_source: 底层帧来源（FrameSource实现）
+            max_age: 缓存帧的最大帧龄（秒），0表示不复用缓存帧
+            clock: 时钟（可选），帧时间戳和帧龄按该时钟计算，回放时传入虚拟时钟；默认为单调时钟
+        """
+        self.frame_source = frame_source
+        self.max_age = max_age
+        self.clock = clock or MonotonicClock()
+        self.rois = {}
+
+        self._condition = threading.Condition()
+        self._latest = None
+        self._sequence = 0
+        self._capturing = False
+        self._capturing_fresh = False
+        self._started_ticks = 0
+        self._finished_ticks = 0
+        self._tick_result = None
+
+        # 会话录制（可选），每个新发布的帧录制一次
+        self.recorder = None
+        self.recorded_rois = ()
+
+        # 统计信息
+        self.capture_count = 0  # 实际截图次数
+        self.shared_count = 0   # 共享其他请求截图结果的次数
+        self.cache_hits = 0     # 在最大帧龄内复用缓存帧的次数
+        self.cache_misses = 0   # 缓存帧过期或要求新帧而截图的次数
+
+    @property
+    def window_width(self):
+        return self.frame_source.window_width
+
+    @property
+    def window_height(self):
+        return self.frame_source.window_height
+
+    def update_window_size(self):
+        """更新窗口尺寸"""
+        return self.frame_source.update_window_size()
+
+    def get_fps(self):
+        """获取底层来源的FPS"""
+        return self.frame_source.get_fps()
+
+    def close(self):
+        self.frame_source.close()
+
+    def tick(self, fresh=False):
+        """
+        执行一次整窗口截图并发布，已有截图正在进行时等待并共享其结果
+
+        参数:
+            fresh: 是否向底层来源请求新截取的帧（底层来源带有后台截图线程时有区别）
+
+        返回:
+            本次发布的Frame，截图失败返回None
+        """
+        with self._condition:
+            # 要求新帧时只能共享进入之后才开始的、同样要求新帧的截图：
+            # 进入之前已经开始的截图可能早于调用方的按键，共享它会得到按键之前的画面
+            entered = self._started_ticks
+            while self._capturing:
+                # 等待正在进行的截图完成（按截图批次判断，避免被后续截图饿死）
+                pending = self._started_ticks
+                shareable = not fresh or (pending > entered and self._capturing_fresh)
+                self._condition.wait_for(lambda: self._finished_ticks >= pending)
+                if shareable:
+                    self.shared_count += 1
+                    return self._tick_result
+            self._capturing = True
+            self._capturing_fresh = fresh
+            self._started_ticks += 1
+
+        data = None
+        try:
+            data = self.frame_source.capture_fresh_array() if fresh else self.frame_source.capture_array()
+        finally:
+            with self._condition:
+                if data is not None:
+                    self._sequence += 1
+                    self._latest = Frame(data, self._sequence, self.clock.time())
+                    self._tick_result = self._latest
+                    self.capture_count += 1
+                else:
+                    self._tick_result = None
+                self._capturing = False
+                self._finished_ticks += 1
+                self._condition.notify_all()
+                result = self._tick_result
+
+        if result is not None and self.recorder is not None:
+            self._record(result)
+        return result
+
+    def capture_array(self, max_age=None):
+        """
+        FrameSource接口：获取整窗口帧，最新帧未超过最大帧龄时直接复用
+
+        参数:
+            max_age: 本次调用允许的最大帧龄（秒），None表示使用总线的默认值
+
+        返回:
+            整窗口数组，截图失败返回None
+        """
+        max_age = self.max_age if max_age is None else max_age
+        if max_age > 0:
+            with self._condition:
+                latest = self._latest
+                if latest is not None and self.clock.time() - latest.timestamp <= max_age:
+                    self.cache_hits += 1
+                    return latest.data
+                self.cache_misses += 1
+
+        frame = self.tick()
+        return frame.data if frame is not None else None
+
+    def capture_fresh_array(self):
+        """获取新截取的整窗口帧，不使用缓存帧"""
+        with self._condition:
+            self.cache_misses += 1
+        frame = self.tick(fresh=True)
+        return frame.data if frame is not None else None
+
+    def latest(self):
+        """获取最近发布的帧，尚未截图时返回None"""
+        with self._condition:
+            return self._latest
+
+    def wait_for_frame(self, after_sequence=0, timeout=None):
+        """
+        等待序号大于after_sequence的帧发布
+
+        参数:
+            after_sequence: 已处理的帧序号
+            timeout: 超时时间（秒），None表示一直等待
+
+        返回:
+            新发布的Frame，超时返回None
+        """
+        with self._condition:
+            published = self._condition.wait_for(
+                lambda: self._latest is not None and self._latest.sequence > after_sequence, timeout
+            )
+            return self._latest if published else None
+
+    def register_roi(self, name, region):
+        """
+        注册命名检测区域
+
+        参数:
+            name: 区域名称，如"ocr"、"area"
+            region: 区域 (x, y, width, height)
+
+        返回:
+            绑定到本总线的RegionCapture
+        """
+        capture = RegionCapture(self, region)
+        self.rois[name] = capture
+        logger.info(f"帧总线注册区域 {name}: {region}")
+        return capture
+
+    def attach_recorder(self, recorder, roi_names=None):
+        """
+        挂载会话录制器，之后每个新发布的帧都会录制指定的区域
+
+        参数:
+            recorder: SessionRecorder实例，None表示取消录制
+            roi_names: 要录制的区域名称列表，None表示录制所有已注册区域
+        """
+        self.recorded_rois = tuple(roi_names) if roi_names is not None else tuple(self.rois)
+        self.recorder = recorder
+
+    def _record(self, frame):
+        """将帧中需要录制的区域交给录制器（录制器只复制数据，写盘在其后台线程中进行）
+
+        帧时间戳是总线时钟的时间，录制记录与状态、按键事件一样使用录制器的墙上时间（截图刚完成时）
+        """
+        window_size = (self.window_width, self.window_height)
+        for name in self.recorded_rois:
+            capture = self.rois.get(name)
+            if capture is None:
+                continue
+            view = crop_view(frame.data, capture.capture_region)
+            if view is not None:
+                self.recorder.record_frame(name, view, capture.capture_region, window_size, frame.sequence)
+
+    def roi(self, name, frame=None):
+        """
+        获取命名区域在指定帧（默认最新帧）上的视图
+
+        返回:
+            区域视图，没有可用帧时返回None
+        """
+        frame = frame if frame is not None else self.latest()
+        if frame is None:
+            return None
+        return crop_view(frame.data, self.rois[name].capture_region)
+
+    def get_stats(self):
+        """获取帧总线统计信息"""
+        with self._condition:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "sequence": self._sequence,
+                "captures": self.capture_count,
+                "shared": self.shared_count,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "cache_hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,226 @@
+"""
+帧来源
+定义识别链路使用的帧来源接口，以及不依赖游戏窗口的图片目录、视频文件和合成帧实现，
+可用于在任意平台上回放和测量识别性能
+"""
+
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FrameSource(ABC):
+    """
+    帧来源接口
+
+    实现类必须提供 capture_array()，返回整个窗口的BGR或BGRX数组，
+    并维护 window_width / window_height 属性
+    """
+
+    window_width = 1920
+    window_height = 1080
+
+    @abstractmethod
+    def capture_array(self):
+        """
+        获取一帧完整窗口图像
+
+        返回:
+            形状为 (height, width, 3或4) 的uint8数组，失败返回None
+        """
+
+    def capture_fresh_array(self):
+        """
+        获取一帧新截取的完整窗口图像，不使用任何缓存
+
+        没有缓存的来源直接等同于 capture_array()
+        """
+        return self.capture_array()
+
+    def update_window_size(self):
+        """更新窗口尺寸，文件类来源的尺寸在打开时确定"""
+        return True
+
+    def get_fps(self):
+        """获取当前FPS"""
+        return getattr(self, "last_fps", 0)
+
+    def close(self):
+        """释放来源占用的资源"""
+        pass
+
+    def _record_frame_time(self):
+        """记录帧时间并更新FPS"""
+        if not hasattr(self, "frame_times"):
+            self.frame_times = deque(maxlen=100)
+            self.last_fps = 0
+        self.frame_times.append(time.time())
+        if len(self.frame_times) >= 2:
+            elapsed = self.frame_times[-1] - self.frame_times[0]
+            if elapsed > 0:
+                self.last_fps = (len(self.frame_times) - 1) / elapsed
+
+
+def read_image(path, flags=cv2.IMREAD_COLOR):
+    """读取图像，兼容Windows下的中文路径"""
+    image = cv2.imread(path, flags)
+    if image is None:
+        try:
+            image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), flags)
+        except Exception as e:
+            logger.error(f"读取图像失败: {path}, {e}")
+            return None
+    return image
+
+
+class ImageDirectorySource(FrameSource):
+    """图片目录回放，按文件名顺序逐帧返回目录中的图像"""
+
+    IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+    def __init__(self, directory, loop=True, preload=False):
+        """
+        参数:
+            directory: 图片目录
+            loop: 播放到末尾后是否从头开始
+            preload: 是否预先解码所有图片（测量识别吞吐量时可排除解码开销）
+        """
+        self.directory = directory
+        self.loop = loop
+        self.paths = sorted(
+            os.path.join(directory, name) for name in os.listdir(directory)
+            if name.lower().endswith(self.IMAGE_EXTENSIONS)
+        )
+        if not self.paths:
+            raise ValueError(f"目录中没有图片: {directory}")
+
+        self.index = 0
+        self._frames = [read_image(path) for path in self.paths] if preload else None
+
+        first = self._frames[0] if preload else read_image(self.paths[0])
+        if first is None:
+            raise ValueError(f"无法读取图片: {self.paths[0]}")
+        self.window_height, self.window_width = first.shape[:2]
+        logger.info(f"图片目录来源: {directory}, 共 {len(self.paths)} 帧, 尺寸 {self.window_width}x{self.window_height}")
+
+    def __len__(self):
+        return len(self.paths)
+
+    def capture_array(self):
+        if self.index >= len(self.paths):
+            if not self.loop:
+                return None
+            self.index = 0
+
+        if self._frames is not None:
+            frame = self._frames[self.index]
+        else:
+            frame = read_image(self.paths[self.index])
+        self.index += 1
+
+        if frame is not None:
+            self._record_frame_time()
+        return frame
+
+
+class VideoFileSource(FrameSource):
+    """视频文件回放，使用cv2.VideoCapture逐帧解码"""
+
+    def __init__(self, path, loop=True):
+        """
+        参数:
+            path: 视频文件路径
+            loop: 播放到末尾后是否从头开始
+        """
+        self.path = path
+        self.loop = loop
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise ValueError(f"无法打开视频文件: {path}")
+
+        self.window_width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.window_height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        logger.info(f"视频来源: {path}, 共 {self.frame_count} 帧, 尺寸 {self.window_width}x{self.window_height}")
+
+    def capture_array(self):
+        ok, frame = self.capture.read()
+        if not ok and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.capture.read()
+        if not ok:
+            return None
+
+        self._record_frame_time()
+        return frame
+
+    def close(self):
+        self.capture.release()
+
+
+class SyntheticFrameSource(FrameSource):
+    """
+    合成帧生成器
+
+    生成偏暗的噪声背景，并按照脚本在模板匹配区域贴入指定的模板，
+    用于在没有游戏和录像的环境中测量识别链路
+    """
+
+    def __init__(self, window_size=(1920, 1080), templates=None, script=None, seed=0):
+        """
+        参数:
+            window_size: 窗口尺寸 (width, height)
+            templates: 模板字典，名称 -> BGRA模板图像
+            script: 帧脚本，列表，每项为 (模板名称或None, 帧数)，播放完后循环
+            seed: 随机种子
+        """
+        self.window_width, self.window_height = window_size
+        self.templates = templates or {}
+        self.script = script or [(None, 1)]
+        self.index = 0
+
+        rng = np.random.default_rng(seed)
+        self._background = rng.integers(
+            0, 160, size=(self.window_height, self.window_width, 3), dtype=np.uint8
+        )
+        self._frame = np.empty_like(self._background)
+        self._timeline = [name for name, count in self.script for _ in range(count)]
+
+        from capture.region_capture import calculate_fishing_regions
+        self.ocr_region = calculate_fishing_regions(self.window_width, self.window_height)["ocr"]
+
+    def current_label(self):
+        """获取下一帧将要显示的模板名称（用于统计识别准确率）"""
+        return self._timeline[self.index % len(self._timeline)]
+
+    def capture_array(self):
+        name = self.current_label()
+        self.index += 1
+
+        # 复用输出缓冲区，和GDI截图一样，调用方不应长期持有返回的帧
+        np.copyto(self._frame, self._background)
+        if name is not None and name in self.templates:
+            self._paste_template(self.templates[name])
+
+        self._record_frame_time()
+        return self._frame
+
+    def _paste_template(self, template_img):
+        """将模板贴入模板匹配区域的固定位置"""
+        x, y, w, h = self.ocr_region
+        t_h, t_w = template_img.shape[:2]
+        px = x + w - t_w - w // 5
+        py = y + h - t_h - h // 4
+        bgr = template_img[:, :, :3]
+        if template_img.shape[2] == 4:
+            alpha = template_img[:, :, 3] > 0
+        else:
+            alpha = np.ones((t_h, t_w), dtype=bool)
+        self._frame[py:py + t_h, px:px + t_w][alpha] = bgr[alpha]
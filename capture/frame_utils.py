@@ -0,0 +1,57 @@
+"""
+帧数据工具
+在GDI位图数据、NumPy数组和区域视图之间转换，尽量避免额外复制
+"""
+
+import cv2
+import numpy as np
+
+
+def bgrx_buffer_to_array(buffer, width, height):
+    """
+    将GDI返回的BGRX字节数据包装为NumPy数组，不复制数据
+
+    参数:
+        buffer: 位图字节数据（bytes、bytearray或memoryview）
+        width: 位图宽度
+        height: 位图高度
+
+    返回:
+        形状为 (height, width, 4) 的uint8数组；数据来自bytes时为只读
+    """
+    return np.frombuffer(buffer, dtype=np.uint8, count=width * height * 4).reshape(height, width, 4)
+
+
+def crop_view(frame, region):
+    """
+    截取区域，返回原数组上的视图，区域超出边界时自动裁剪
+
+    参数:
+        frame: 输入帧数组
+        region: 区域 (x, y, width, height)
+
+    返回:
+        区域视图，区域为空时返回None
+    """
+    x, y, w, h = region
+    frame_h, frame_w = frame.shape[:2]
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(frame_w, x + w), min(frame_h, y + h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return frame[y0:y1, x0:x1]
+
+
+def to_bgr(frame):
+    """
+    转换为OpenCV常用的3通道BGR图像，已是BGR或灰度图时直接返回
+
+    参数:
+        frame: BGRX/BGRA/BGR/灰度数组
+
+    返回:
+        BGR或灰度数组
+    """
+    if frame.ndim == 3 and frame.shape[2] == 4:
+        return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+    return frame
@@ -0,0 +1,113 @@
+"""
+区域截图
+基于任意帧来源截取固定区域，返回整帧数组上的视图
+"""
+
+import logging
+
+from capture.frame_utils import crop_view
+
+logger = logging.getLogger(__name__)
+
+
+def calculate_fishing_regions(window_width, window_height, anchors=None):
+    """
+    计算钓鱼识别使用的检测区域
+
+    参数:
+        window_width: 窗口宽度
+        window_height: 窗口高度
+        anchors: 检测区域标定得到的锚点（可选），窗口尺寸一致时使用其中收缩后的区域
+
+    返回:
+        字典 {"ocr": (x, y, w, h), "area": (x, y, w, h)}
+    """
+    # 面积检测区域：窗口中心区域，宽度和高度为窗口的1/3
+    area_width = int(window_width * 0.33)
+    area_height = int(window_height * 0.33)
+    area_x = (window_width - area_width) // 2
+    area_y = (window_height - area_height) // 2
+
+    # 模板匹配区域：右下角区域，宽度为窗口的1/3，高度为窗口的1/6
+    ocr_width = int(window_width * 0.33)
+    ocr_height = int(window_height * 0.16)
+    ocr_x = window_width - ocr_width
+    ocr_y = window_height - ocr_height
+
+    regions = {
+        "ocr": (ocr_x, ocr_y, ocr_width, ocr_height),
+        "area": (area_x, area_y, area_width, area_height),
+    }
+    if anchors and tuple(anchors.get("window", ())) == (window_width, window_height):
+        for name, region in anchors.get("regions", {}).items():
+            if name in regions:
+                regions[name] = tuple(region)
+    return regions
+
+
+class RegionCapture:
+    """
+    区域截图器
+    从帧来源获取整帧并返回指定区域的视图，接口与 ScreenCaptureExtractor 的区域截图保持一致
+    """
+
+    def __init__(self, frame_source, capture_region=None):
+        """
+        参数:
+            frame_source: 帧来源（FrameSource实现）
+            capture_region: 区域 (x, y, width, height)
+        """
+        self.frame_source = frame_source
+        self.capture_region = capture_region
+
+    @property
+    def window_width(self):
+        return self.frame_source.window_width
+
+    @property
+    def window_height(self):
+        return self.frame_source.window_height
+
+    def update_window_size(self):
+        """更新窗口尺寸"""
+        return self.frame_source.update_window_size()
+
+    def adjust_region_to_window_bounds(self):
+        """调整捕获区域到窗口边界内"""
+        if not self.capture_region:
+            logger.warning("未设置捕获区域，无法进行调整")
+            return False
+
+        x, y, width, height = self.capture_region
+        x = max(0, x)
+        y = max(0, y)
+        width = min(width, self.window_width - x)
+        height = min(height, self.window_height - y)
+
+        if (x, y, width, height) != tuple(self.capture_region):
+            logger.warning(f"捕获区域超出窗口范围，已调整为: x={x}, y={y}, w={width}, h={height}")
+        self.capture_region = (x, y, width, height)
+        return True
+
+    def capture_region_array(self, fresh=False):
+        """
+        截取区域
+
+        参数:
+            fresh: 是否要求新截取的帧（例如按键之后），否则允许使用来源缓存的帧
+
+        返回:
+            成功返回区域视图数组，失败返回None
+        """
+        if not self.capture_region:
+            logger.error("未设置捕获区域")
+            return None
+
+        frame = self.frame_source.capture_fresh_array() if fresh else self.frame_source.capture_array()
+        if frame is None:
+            return None
+        return crop_view(frame, self.capture_region)
+
+    def get_fps(self):
+        """获取当前FPS"""
+        return self.frame_source.get_fps()
@@ -0,0 +1,473 @@
+"""
+会话录制
+将识别链路看到的区域帧、时间戳、识别状态和输入事件写入分块的内存映射归档文件，
+用于复现现场问题和离线回放
+
+归档文件布局（小端）:
+    文件头: 魔数、版本、分块大小、分块数量、写入位置和计数
+    分块索引: 每个分块一项，记录代次、首条记录序号、记录数、已用字节和时间范围
+    分块数据: chunk_count 个固定大小的分块，每条记录不跨分块
+
+文件大小在创建时按磁盘配额固定，写满后循环覆盖最旧的分块
+"""
+
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from capture.frame_source import FrameSource
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"NKREC001"
+VERSION = 1
+
+# 魔数, 版本, 分块大小, 分块数量, 当前写入分块, 已开始的分块总数, 已写入的记录总数
+HEADER_STRUCT = struct.Struct("<8sIIIIQQ")
+# 代次(0表示空), 首条记录序号, 记录数, 已用字节, 开始时间, 结束时间
+CHUNK_STRUCT = struct.Struct("<QQIIdd")
+# 负载长度, 记录类型, 标志位, 元数据长度, 时间戳, 记录序号
+RECORD_STRUCT = struct.Struct("<IBBHdQ")
+
+PAGE_SIZE = 4096
+RECORD_ALIGN = 8
+
+# 记录类型
+RECORD_FRAME = 1
+RECORD_STATE = 2
+RECORD_INPUT = 3
+
+RECORD_TYPE_NAMES = {RECORD_FRAME: "frame", RECORD_STATE: "state", RECORD_INPUT: "input"}
+
+# 帧编码
+ENCODING_RAW = "raw"
+ENCODING_PNG = "png"
+
+# 归档中一条记录的位置信息（不含负载）
+RecordInfo = namedtuple("RecordInfo", ["sequence", "type", "timestamp", "offset", "meta_len", "payload_len"])
+
+
+def _align(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _header_size(chunk_count):
+    return _align(HEADER_STRUCT.size + chunk_count * CHUNK_STRUCT.size, PAGE_SIZE)
+
+
+class SessionRecorder:
+    """
+    会话录制器
+
+    record_* 方法只复制数据并放入队列，由后台写入线程编码并写入内存映射文件，
+    队列已满时丢弃记录而不阻塞识别线程
+    """
+
+    def __init__(self, path, budget_bytes=256 * 1024 * 1024, chunk_size=4 * 1024 * 1024,
+                 encoding=ENCODING_RAW, queue_size=64):
+        """
+        参数:
+            path: 归档文件路径
+            budget_bytes: 磁盘配额（字节），文件大小不会超过该值；放不下文件头和一个页大小的分块时抛出ValueError
+            chunk_size: 分块大小（字节），单条记录不能超过分块大小；配额放不下一个分块时缩小到配额以内
+            encoding: 帧编码方式，"raw"为原始像素（可零拷贝读取），"png"为无损压缩
+            queue_size: 写入队列长度
+        """
+        if encoding not in (ENCODING_RAW, ENCODING_PNG):
+            raise ValueError(f"不支持的帧编码: {encoding}")
+
+        self.path = path
+        self.encoding = encoding
+        self.chunk_size = _align(chunk_size, PAGE_SIZE)
+
+        # 配额放不下一个完整分块时缩小分块，文件大小始终不超过配额
+        max_chunk_size = (budget_bytes - _header_size(1)) // PAGE_SIZE * PAGE_SIZE
+        if max_chunk_size < PAGE_SIZE:
+            raise ValueError(f"录制配额 {budget_bytes} 字节过小，至少需要 {_header_size(1) + PAGE_SIZE} 字节")
+        if self.chunk_size > max_chunk_size:
+            logger.warning(f"录制配额 {budget_bytes} 字节放不下 {self.chunk_size} 字节的分块，分块缩小为 {max_chunk_size} 字节")
+            self.chunk_size = max_chunk_size
+
+        # 先按配额估算分块数量，再扣除文件头占用的空间
+        chunk_count = max(1, budget_bytes // self.chunk_size)
+        while chunk_count > 1 and _header_size(chunk_count) + chunk_count * self.chunk_size > budget_bytes:
+            chunk_count -= 1
+        self.chunk_count = chunk_count
+        self.header_size = _header_size(chunk_count)
+        self.file_size = self.header_size + self.chunk_count * self.chunk_size
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "w+b")
+        self._file.truncate(self.file_size)
+        self._mmap = mmap.mmap(self._file.fileno(), self.file_size)
+
+        # 写入状态（仅写入线程访问）
+        self._write_chunk = 0
+        self._chunks_started = 0
+        self._chunk_used = 0
+        self._sequence = 0
+        self._start_chunk(0, 0)
+
+        # 统计信息
+        self.written_count = 0
+        self.dropped_count = 0
+        self.oversize_count = 0
+        self.bytes_written = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        logger.info(f"开始录制会话: {path}, 配额 {self.file_size / 1024 / 1024:.0f}MB, "
+                     f"分块 {self.chunk_count}x{self.chunk_size / 1024 / 1024:.1f}MB, 编码 {encoding}")
+
+    # ---------- 录制接口（识别线程调用） ----------
+
+    def record_frame(self, roi_name, image, region=None, window_size=None, frame_sequence=None, timestamp=None):
+        """
+        录制一帧区域图像
+
+        参数:
+            roi_name: 区域名称
+            image: 区域图像数组（会被复制，调用方可以继续复用缓冲区）
+            region: 区域在窗口中的位置 (x, y, w, h)
+            window_size: 窗口尺寸 (width, height)
+            frame_sequence: 帧总线上的帧序号
+            timestamp: 截图时间，默认为当前时间
+        """
+        meta = {"roi": roi_name}
+        if region is not None:
+            meta["region"] = [int(v) for v in region]
+        if window_size is not None:
+            meta["window"] = [int(v) for v in window_size]
+        if frame_sequence is not None:
+            meta["frame"] = int(frame_sequence)
+        self._enqueue(RECORD_FRAME, timestamp, meta, np.array(image, copy=True))
+
+    def record_state(self, state, template_name=None, score=None, timestamp=None):
+        """录制识别状态变化"""
+        meta = {"state": int(state), "template": template_name}
+        if score is not None:
+            meta["score"] = round(float(score), 4)
+        self._enqueue(RECORD_STATE, timestamp, meta, None)
+
+    def record_input(self, action, *args, timestamp=None):
+        """录制输入事件，如 press('a', 0.15)"""
+        meta = {"action": action, "args": [arg if isinstance(arg, (int, float, str, bool)) else str(arg) for arg in args]}
+        self._enqueue(RECORD_INPUT, timestamp, meta, None)
+
+    def _enqueue(self, record_type, timestamp, meta, payload):
+        if self._closed:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        try:
+            self._queue.put_nowait((record_type, timestamp, meta, payload))
+        except queue.Full:
+            self.dropped_count += 1
+
+    # ---------- 写入线程 ----------
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write_record(*item)
+            except Exception as e:
+                logger.error(f"写入录制记录失败: {e}")
+
+    def _encode_frame(self, meta, image):
+        """在写入线程中编码帧，BGRX的填充通道不写入文件"""
+        if image.ndim == 3 and image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        meta["shape"] = list(image.shape)
+        meta["encoding"] = self.encoding
+        if self.encoding == ENCODING_PNG:
+            ok, encoded = cv2.imencode(".png", image)
+            if not ok:
+                raise ValueError("PNG编码失败")
+            return encoded.tobytes()
+        return np.ascontiguousarray(image).tobytes()
+
+    def _write_record(self, record_type, timestamp, meta, payload):
+        payload_bytes = self._encode_frame(meta, payload) if record_type == RECORD_FRAME else b""
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        size = _align(RECORD_STRUCT.size + len(meta_bytes) + len(payload_bytes), RECORD_ALIGN)
+
+        if size > self.chunk_size:
+            self.oversize_count += 1
+            logger.warning(f"录制记录过大 ({size} 字节)，超过分块大小，已丢弃")
+            return
+
+        if self._chunk_used + size > self.chunk_size:
+            # 当前分块写满，切换到下一个分块（写满配额后覆盖最旧的分块）
+            self._start_chunk((self._write_chunk + 1) % self.chunk_count, self._sequence)
+
+        self._sequence += 1
+        offset = self.header_size + self._write_chunk * self.chunk_size + self._chunk_used
+        RECORD_STRUCT.pack_into(self._mmap, offset, len(payload_bytes), record_type, 0,
+                                len(meta_bytes), timestamp, self._sequence)
+        start = offset + RECORD_STRUCT.size
+        self._mmap[start:start + len(meta_bytes)] = meta_bytes
+        start += len(meta_bytes)
+        self._mmap[start:start + len(payload_bytes)] = payload_bytes
+        self._chunk_used += size
+
+        # 记录写完后再更新索引，读取方只会看到完整的记录
+        generation, first_sequence, count, _, start_time, _ = self._read_chunk_entry(self._write_chunk)
+        if count == 0:
+            first_sequence, start_time = self._sequence, timestamp
+        CHUNK_STRUCT.pack_into(self._mmap, HEADER_STRUCT.size + self._write_chunk * CHUNK_STRUCT.size,
+                               generation, first_sequence, count + 1, self._chunk_used, start_time, timestamp)
+        self._write_header()
+
+        self.written_count += 1
+        self.bytes_written += size
+
+    def _start_chunk(self, chunk_index, first_sequence):
+        self._write_chunk = chunk_index
+        self._chunks_started += 1
+        self._chunk_used = 0
+        CHUNK_STRUCT.pack_into(self._mmap, HEADER_STRUCT.size + chunk_index * CHUNK_STRUCT.size,
+                               self._chunks_started, first_sequence + 1, 0, 0, 0.0, 0.0)
+        self._write_header()
+
+    def _read_chunk_entry(self, chunk_index):
+        return CHUNK_STRUCT.unpack_from(self._mmap, HEADER_STRUCT.size + chunk_index * CHUNK_STRUCT.size)
+
+    def _write_header(self):
+        HEADER_STRUCT.pack_into(self._mmap, 0, MAGIC, VERSION, self.chunk_size, self.chunk_count,
+                                self._write_chunk, self._chunks_started, self._sequence)
+
+    # ---------- 生命周期 ----------
+
+    def close(self):
+        """等待队列写完并关闭归档文件"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join(timeout=10)
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.close()
+        logger.info(f"会话录制已结束: {self.path}, 统计: {self.get_stats()}")
+
+    def get_stats(self):
+        """获取录制统计信息"""
+        return {
+            "written": self.written_count,
+            "dropped": self.dropped_count,
+            "oversize": self.oversize_count,
+            "bytes": self.bytes_written,
+            "chunks_started": self._chunks_started,
+            "wrapped": self._chunks_started > self.chunk_count,
+        }
+
+
+class SessionArchive:
+    """
+    会话归档读取器
+
+    打开时只扫描分块索引和记录头，不解码任何负载；帧按需读取，原始编码的帧直接返回内存映射上的视图
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, chunk_size, chunk_count, _, _, _ = HEADER_STRUCT.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是有效的录制归档: {path}")
+        if version != VERSION:
+            raise ValueError(f"不支持的归档版本: {version}")
+
+        self.chunk_size = chunk_size
+        self.chunk_count = chunk_count
+        self.header_size = _header_size(chunk_count)
+        self.records = self._scan_records()
+        self._timestamps = [record.timestamp for record in self.records]
+        self._frame_indices = [i for i, record in enumerate(self.records) if record.type == RECORD_FRAME]
+
+    def _scan_records(self):
+        """按代次顺序遍历分块，只读取记录头建立索引"""
+        chunks = []
+        for index in range(self.chunk_count):
+            entry = CHUNK_STRUCT.unpack_from(self._mmap, HEADER_STRUCT.size + index * CHUNK_STRUCT.size)
+            generation, _, count, used, _, _ = entry
+            if generation and count:
+                chunks.append((generation, index, count, used))
+        chunks.sort()
+
+        records = []
+        for _, index, count, used in chunks:
+            offset = self.header_size + index * self.chunk_size
+            end = offset + used
+            for _ in range(count):
+                if offset + RECORD_STRUCT.size > end:
+                    break
+                payload_len, record_type, _, meta_len, timestamp, sequence = RECORD_STRUCT.unpack_from(self._mmap, offset)
+                records.append(RecordInfo(sequence, record_type, timestamp, offset, meta_len, payload_len))
+                offset += _align(RECORD_STRUCT.size + meta_len + payload_len, RECORD_ALIGN)
+        return records
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def frame_count(self):
+        return len(self._frame_indices)
+
+    def read_meta(self, index):
+        """读取记录的元数据"""
+        record = self.records[index]
+        start = record.offset + RECORD_STRUCT.size
+        return json.loads(bytes(self._mmap[start:start + record.meta_len]).decode("utf-8"))
+
+    def read_frame(self, index):
+        """
+        读取帧记录
+
+        参数:
+            index: 记录下标（self.records中的位置）
+
+        返回:
+            (图像数组, 元数据)；原始编码时图像为只读的内存映射视图
+        """
+        record = self.records[index]
+        if record.type != RECORD_FRAME:
+            raise ValueError(f"记录 {index} 不是帧记录")
+        meta = self.read_meta(index)
+        start = record.offset + RECORD_STRUCT.size + record.meta_len
+        if meta.get("encoding") == ENCODING_PNG:
+            data = np.frombuffer(self._mmap, dtype=np.uint8, count=record.payload_len, offset=start)
+            return cv2.imdecode(data, cv2.IMREAD_UNCHANGED), meta
+        shape = tuple(meta["shape"])
+        image = np.frombuffer(self._mmap, dtype=np.uint8, count=int(np.prod(shape)), offset=start).reshape(shape)
+        return image, meta
+
+    def frame(self, frame_index):
+        """按帧序号（只计算帧记录）随机读取一帧"""
+        return self.read_frame(self._frame_indices[frame_index])
+
+    def index_at_time(self, timestamp):
+        """查找时间戳不晚于timestamp的最后一条记录下标，没有时返回-1"""
+        return bisect_right(self._timestamps, timestamp) - 1
+
+    def iter_records(self, record_type=None):
+        """遍历记录，产出 (下标, RecordInfo)"""
+        for index, record in enumerate(self.records):
+            if record_type is None or record.type == record_type:
+                yield index, record
+
+    def describe(self):
+        """获取归档概要"""
+        counts = {}
+        for record in self.records:
+            name = RECORD_TYPE_NAMES.get(record.type, str(record.type))
+            counts[name] = counts.get(name, 0) + 1
+        duration = self.records[-1].timestamp - self.records[0].timestamp if self.records else 0.0
+        return {"records": len(self.records), "counts": counts, "duration": duration}
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class ArchiveFrameSource(FrameSource):
+    """
+    录制回放帧来源
+
+    按录制顺序逐帧回放，将同一帧序号的各区域图像贴回整窗口画布，
+    识别链路按原来的区域截取即可得到录制时的图像
+    """
+
+    def __init__(self, archive, loop=False):
+        """
+        参数:
+            archive: SessionArchive实例或归档文件路径
+            loop: 播放到末尾后是否从头开始
+        """
+        self.archive = archive if isinstance(archive, SessionArchive) else SessionArchive(archive)
+        self.loop = loop
+
+        # 按帧总线的帧序号分组，同一次截图的多个区域合成一帧
+        self.groups = []
+        group_key = None
+        for index, _ in self.archive.iter_records(RECORD_FRAME):
+            meta = self.archive.read_meta(index)
+            key = meta.get("frame", index)
+            if key != group_key:
+                self.groups.append([])
+                group_key = key
+            self.groups[-1].append(index)
+        if not self.groups:
+            raise ValueError(f"归档中没有帧记录: {self.archive.path}")
+
+        first_meta = self.archive.read_meta(self.groups[0][0])
+        self.window_width, self.window_height = first_meta.get("window", first_meta["shape"][1::-1])
+        self._canvas = np.zeros((self.window_height, self.window_width, 3), dtype=np.uint8)
+        self.index = 0
+
+    def __len__(self):
+        return len(self.groups)
+
+    def timestamp_at(self, group_index):
+        """获取指定帧的录制时间"""
+        return self.archive.records[self.groups[group_index][0]].timestamp
+
+    def seek(self, group_index):
+        """随机定位到指定帧"""
+        self.index = group_index
+
+    def capture_array(self):
+        if self.index >= len(self.groups):
+            if not self.loop:
+                return None
+            self.index = 0
+
+        for record_index in self.groups[self.index]:
+            image, meta = self.archive.read_frame(record_index)
+            x, y, w, h = meta.get("region", (0, 0, image.shape[1], image.shape[0]))
+            if image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            self._canvas[y:y + h, x:x + w] = image[:h, :w, :3]
+        self.index += 1
+
+        self._record_frame_time()
+        return self._canvas
+
+
+class RecordingInputProxy:
+    """输入控制器代理，转发调用的同时把按键和鼠标事件写入录制"""
+
+    RECORDED_METHODS = {"press", "press_down", "press_up", "click_right", "press_right", "release_right"}
+
+    def __init__(self, target, recorder):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_recorder", recorder)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in self.RECORDED_METHODS and callable(attr):
+            def recorded(*args, **kwargs):
+                self._recorder.record_input(name, *args)
+                return attr(*args, **kwargs)
+            return recorded
+        return attr
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
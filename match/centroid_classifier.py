@@ -0,0 +1,383 @@
+"""
+最近质心状态分类器
+把二值化后的模板匹配区域缩小为固定尺寸的密度向量（每个网格单元的白色像素比例），
+与离线学到的各模板质心和"无提示"质心比较，距离最近的类别即为识别结果。
+每帧只需一次二值化、一次缩放和一次小矩阵乘法，不需要逐个模板搜索
+
+分类器提供与 TemplateMatcher 相同的 templates / match_template / match_templates 接口，
+可以直接交给 StateHandler 和 DetectionPlanner 使用。识别结果没有模板位置，location 为None
+
+训练数据来自录制归档：归档中只记录了帧和状态变化，帧的标签由模板匹配器逐帧识别得到，
+按分辨率分别训练并保存为模型文件
+
+用法:
+    python -m match.centroid_classifier recordings/session_xxx.nkrec [更多归档...] [--grid 96 24] [--output ./models/centroid]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# 添加项目根目录到Python路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from bot.state_machine import TEMPLATE_FILES
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION = 1
+# 模型文件中"无提示"类别的标签
+NONE_LABEL = ""
+
+
+def model_path(window_size, directory="./models/centroid"):
+    """模型文件路径，每个分辨率一个文件，如 models/centroid/1920x1080.npz"""
+    return os.path.join(directory, f"{window_size[0]}x{window_size[1]}.npz")
+
+
+def binarize(frame):
+    """灰度化并二值化（与 TemplateMatcher 的帧预处理相同）"""
+    if len(frame.shape) == 3:
+        code = cv2.COLOR_BGRA2GRAY if frame.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        frame = cv2.cvtColor(frame, code)
+    _, binary = cv2.threshold(frame, 210, 255, cv2.THRESH_BINARY)
+    return binary
+
+
+def extract_features(frame, grid=(96, 24)):
+    """
+    将帧转换为密度向量
+
+    参数:
+        frame: 模板匹配区域图像（BGR、BGRX或灰度）
+        grid: 网格列数和行数
+
+    返回:
+        float32 向量，长度为 列数*行数，每个元素为对应网格单元的白色像素比例
+    """
+    small = cv2.resize(binarize(frame), tuple(grid), interpolation=cv2.INTER_AREA)
+    return small.reshape(-1).astype(np.float32) * np.float32(1.0 / 255.0)
+
+
+class CentroidClassifier:
+    """最近质心状态分类器"""
+
+    def __init__(self, labels, centroids, radii, grid=(96, 24), frame_shape=None, accept_score=0.8):
+        """
+        参数:
+            labels: 类别标签列表，模板名称或None（无提示）
+            centroids: 各类别的质心 [类别数, 向量长度]
+            radii: 各类别的接受半径，距离超过半径时判定为无提示
+            grid: 网格列数和行数
+            frame_shape: 训练时模板匹配区域的尺寸 (height, width)，为None时不检查
+            accept_score: 距离等于接受半径时的得分（与状态机的 MIN_TEMPLATE_SCORE 一致）
+        """
+        self.labels = list(labels)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.radii = np.asarray(radii, dtype=np.float32)
+        self.grid = tuple(int(v) for v in grid)
+        self.frame_shape = tuple(frame_shape) if frame_shape is not None else None
+        self.accept_score = accept_score
+        self._centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+
+        # 与 TemplateMatcher 相同的接口：templates 的键为可识别的模板名称
+        self.templates = {label: {"class": index} for index, label in enumerate(self.labels) if label is not None}
+        self.last_match = None
+        self._shape_warned = False
+        self.stats = {"frames": 0, "matched": 0, "rejected_radius": 0, "shape_mismatch": 0}
+
+    @classmethod
+    def fit(cls, labels, features, grid=(96, 24), frame_shape=None, radius_scale=1.5, accept_score=0.8):
+        """
+        从带标签的密度向量训练分类器
+
+        参数:
+            labels: 每个向量的标签（模板名称或None）
+            features: 密度向量 [样本数, 向量长度]
+            grid: 提取向量时使用的网格
+            frame_shape: 模板匹配区域的尺寸 (height, width)
+            radius_scale: 接受半径为本类别训练样本距离99分位数的倍数，
+                且不小于到最近的其他质心距离的一半
+            accept_score: 距离等于接受半径时的得分
+
+        返回:
+            CentroidClassifier，没有任何模板样本时返回None
+        """
+        features = np.asarray(features, dtype=np.float32)
+        names = sorted({label for label in labels if label is not None})
+        if not names or len(features) == 0:
+            logger.error("训练数据中没有任何模板样本，无法训练")
+            return None
+        class_labels = names + ([None] if any(label is None for label in labels) else [])
+
+        targets = np.array([class_labels.index(label) for label in labels])
+        centroids = np.stack([features[targets == k].mean(axis=0) for k in range(len(class_labels))])
+
+        # 类别之间的质心距离
+        diff = centroids[:, None, :] - centroids[None, :, :]
+        separation = np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+        np.fill_diagonal(separation, np.inf)
+
+        radii = np.empty(len(class_labels), dtype=np.float32)
+        for k in range(len(class_labels)):
+            own = features[targets == k] - centroids[k]
+            spread = np.quantile(np.sqrt(np.einsum("ij,ij->i", own, own)), 0.99)
+            nearest = separation[k].min()
+            radii[k] = max(radius_scale * spread, 0.5 * nearest if np.isfinite(nearest) else spread)
+            radii[k] = max(radii[k], 1e-6)
+        return cls(class_labels, centroids, radii, grid, frame_shape, accept_score)
+
+    def save(self, path, meta=None):
+        """保存模型文件，meta 为额外保存的说明信息（如样本数）"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        info = {"version": MODEL_VERSION, "grid": list(self.grid), "accept_score": self.accept_score,
+                "frame_shape": list(self.frame_shape) if self.frame_shape else None,
+                "created": time.strftime("%Y-%m-%d %H:%M:%S")}
+        info.update(meta or {})
+        labels = np.array([NONE_LABEL if label is None else label for label in self.labels])
+        np.savez(path, labels=labels, centroids=self.centroids, radii=self.radii,
+                 info=np.array(json.dumps(info, ensure_ascii=False)))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """
+        加载模型文件
+
+        返回:
+            CentroidClassifier，文件不存在或无效时返回None
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                info = json.loads(str(data["info"]))
+                if info.get("version") != MODEL_VERSION:
+                    logger.warning(f"模型文件版本不符，忽略: {path}")
+                    return None
+                labels = [None if label == NONE_LABEL else str(label) for label in data["labels"]]
+                classifier = cls(labels, data["centroids"], data["radii"], info["grid"],
+                                 info.get("frame_shape"), info.get("accept_score", 0.8))
+            logger.info(f"已加载状态分类模型: {path}")
+            return classifier
+        except Exception as e:
+            logger.error(f"加载模型文件 {path} 失败: {e}")
+            return None
+
+    def features(self, frame):
+        """提取一帧的密度向量"""
+        return extract_features(frame, self.grid)
+
+    def classify(self, features):
+        """
+        对一批密度向量分类
+
+        参数:
+            features: [样本数, 向量长度] 或单个向量
+
+        返回:
+            (最近的类别索引数组, 到该质心的距离数组)
+        """
+        features = np.atleast_2d(np.asarray(features, dtype=np.float32))
+        # |f - c|^2 = |f|^2 - 2 f·c + |c|^2
+        squared = features @ self.centroids.T
+        squared *= -2.0
+        squared += self._centroid_norms
+        squared += np.einsum("ij,ij->i", features, features)[:, None]
+        nearest = squared.argmin(axis=1)
+        distances = np.sqrt(np.maximum(squared[np.arange(len(features)), nearest], 0.0))
+        return nearest, distances
+
+    def score(self, class_index, distance):
+        """距离换算为得分：距离为0时为1，等于接受半径时为 accept_score"""
+        return max(0.0, 1.0 - (1.0 - self.accept_score) * float(distance) / float(self.radii[class_index]))
+
+    def score_templates(self, frame, names=None):
+        """
+        计算各模板类别的得分（与 TemplateMatcher.score_templates 相同的接口，用于分析得分分布）
+
+        返回:
+            字典 {模板名称: 得分}，距离超过接受半径越多得分越低，最低为0
+        """
+        features = self.features(frame)
+        squared = self._centroid_norms - 2.0 * (self.centroids @ features) + float(features @ features)
+        distances = np.sqrt(np.maximum(squared, 0.0))
+        return {name: self.score(info["class"], distances[info["class"]])
+                for name, info in self.templates.items() if names is None or name in names}
+
+    def match_template(self, frame, template_name=None):
+        """
+        识别一帧（与 TemplateMatcher.match_template 相同的接口）
+
+        参数:
+            frame: 模板匹配区域图像
+            template_name: 只接受该模板的识别结果，为None时接受全部模板
+
+        返回:
+            识别结果字典 {"name", "score", "location"} 或None
+        """
+        if template_name:
+            if template_name not in self.templates:
+                logger.warning(f"未找到指定模板: {template_name}")
+                return None
+            names = (template_name,)
+        else:
+            names = self.templates
+        best_match, _ = self.match_templates(frame, names)
+        return best_match
+
+    def match_templates(self, frame, names, stop_score=None):
+        """
+        识别一帧，最近的类别不在 names 中时视为未匹配（与 TemplateMatcher.match_templates 相同的接口）
+
+        参数:
+            frame: 模板匹配区域图像
+            names: 可以接受的模板名称序列
+            stop_score: 兼容参数，分类器一次比较全部质心，不需要提前结束
+
+        返回:
+            (识别结果字典或None, 参与比较的模板数)
+        """
+        evaluated = sum(1 for name in names if name in self.templates)
+        if self.frame_shape and tuple(frame.shape[:2]) != self.frame_shape:
+            self.stats["shape_mismatch"] += 1
+            if not self._shape_warned:
+                logger.warning(f"模板匹配区域尺寸 {frame.shape[1]}x{frame.shape[0]} 与模型训练时的 "
+                               f"{self.frame_shape[1]}x{self.frame_shape[0]} 不符，请重新训练")
+                self._shape_warned = True
+            self.last_match = None
+            return None, evaluated
+
+        self.stats["frames"] += 1
+        nearest, distances = self.classify(self.features(frame))
+        index, distance = int(nearest[0]), float(distances[0])
+        label = self.labels[index]
+
+        best_match = None
+        if label is not None and label in names:
+            if distance <= self.radii[index]:
+                best_match = {"name": label, "score": self.score(index, distance), "location": None}
+                self.stats["matched"] += 1
+            else:
+                self.stats["rejected_radius"] += 1
+        self.last_match = best_match
+        return best_match, evaluated
+
+    def get_stats(self):
+        """获取分类统计"""
+        stats = dict(self.stats)
+        stats["detector"] = "centroid"
+        stats["classes"] = ["无提示" if label is None else label for label in self.labels]
+        return stats
+
+
+def collect_archive_features(paths, template_configs, grid=(96, 24), step=1):
+    """
+    扫描录制归档中的模板匹配区域帧，用模板匹配器标注后提取密度向量
+
+    参数:
+        paths: 归档路径列表
+        template_configs: 模板配置列表（与 TemplateMatcher.load_templates 相同）
+        grid: 网格列数和行数
+        step: 每隔多少帧取样一次
+
+    返回:
+        字典 {窗口尺寸: {"labels": [...], "features": [...], "frame_shape": (height, width)}}
+    """
+    from capture.session_recorder import SessionArchive
+
+    datasets = {}
+    matchers = {}
+    for path in paths:
+        archive = SessionArchive(path)
+        try:
+            _scan_archive(archive, datasets, matchers, template_configs, grid, step)
+        finally:
+            archive.close()
+    return datasets
+
+
+def _scan_archive(archive, datasets, matchers, template_configs, grid, step):
+    """标注归档中的模板匹配区域帧并提取向量（原始编码的帧是内存映射上的视图，不能在关闭归档后持有）"""
+    from capture.session_recorder import RECORD_FRAME
+    from match.template_matcher import TemplateMatcher
+
+    count = 0
+    for index, _ in archive.iter_records(RECORD_FRAME):
+        image, meta = archive.read_frame(index)
+        if meta.get("roi") != "ocr":
+            continue
+        count += 1
+        if (count - 1) % step:
+            continue
+        window_size = tuple(meta.get("window", (image.shape[1], image.shape[0])))
+        matcher = matchers.get(window_size)
+        if matcher is None:
+            matcher = TemplateMatcher()
+            matcher.load_templates(template_configs, window_size)
+            # 标注需要每一帧独立的结果
+            matcher.tracking_enabled = False
+            matchers[window_size] = matcher
+        dataset = datasets.setdefault(window_size, {"labels": [], "features": [],
+                                                    "frame_shape": tuple(image.shape[:2])})
+        if tuple(image.shape[:2]) != dataset["frame_shape"]:
+            logger.warning(f"帧 {index} 的尺寸与之前的帧不同，跳过")
+            continue
+        match = matcher.match_template(image)
+        dataset["labels"].append(match["name"] if match else None)
+        dataset["features"].append(extract_features(image, grid))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从录制归档训练最近质心状态分类器")
+    parser.add_argument("archives", nargs="+", help="录制归档路径")
+    parser.add_argument("--grid", type=int, nargs=2, default=[96, 24], metavar=("COLS", "ROWS"), help="密度向量的网格")
+    parser.add_argument("--step", type=int, default=1, help="每隔多少帧取样一次")
+    parser.add_argument("--radius-scale", type=float, default=1.5, help="接受半径为训练样本距离99分位数的倍数")
+    parser.add_argument("--output", default="./models/centroid", help="模型文件目录")
+    parser.add_argument("--templates", default=os.path.join(ROOT_DIR, "img", "templates"), help="模板目录")
+    parser.add_argument("--dry-run", action="store_true", help="只输出结果，不保存模型文件")
+    args = parser.parse_args()
+
+    template_configs = [{"name": name, "path": os.path.join(args.templates, file_name), "threshold": 0.9}
+                        for name, file_name in TEMPLATE_FILES]
+
+    datasets = collect_archive_features(args.archives, template_configs, tuple(args.grid), max(1, args.step))
+    if not datasets:
+        print("归档中没有模板匹配区域的帧记录")
+        return
+
+    for window_size, dataset in datasets.items():
+        labels = dataset["labels"]
+        counts = {}
+        for label in labels:
+            key = "无提示" if label is None else label
+            counts[key] = counts.get(key, 0) + 1
+        classifier = CentroidClassifier.fit(labels, dataset["features"], tuple(args.grid), dataset["frame_shape"],
+                                            args.radius_scale)
+        if classifier is None:
+            continue
+        # 训练集上与模板匹配标注的一致率
+        nearest, distances = classifier.classify(np.asarray(dataset["features"]))
+        predicted = [classifier.labels[k] if d <= classifier.radii[k] else None for k, d in zip(nearest, distances)]
+        agreement = sum(p == label for p, label in zip(predicted, labels)) / len(labels)
+        report = {"window": list(window_size), "frame_shape": list(dataset["frame_shape"]), "samples": counts,
+                  "radii": {("无提示" if label is None else label): round(float(r), 4)
+                            for label, r in zip(classifier.labels, classifier.radii)},
+                  "train_agreement": agreement}
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if not args.dry_run:
+            path = classifier.save(model_path(window_size, args.output), {"samples": counts})
+            print(f"模型已保存: {path}")
+
+
+if __name__ == "__main__":
+    main()
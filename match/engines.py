@@ -0,0 +1,624 @@
+"""
+模板匹配引擎
+TemplateMatcher 在二值图像中搜索模板最佳位置的具体实现，可按部署选择：
+- opencv: 逐模板在整幅图像上执行 cv2.matchTemplate（默认）
+- pyramid: 先在缩小的二值图像上粗匹配，只在最佳的几个候选位置附近做全分辨率匹配
+- bitpacked: 二值图像按行打包成 uint64，用 AND 和 popcount 计算带掩码的汉明距离，得分与 opencv 引擎相同
+- fft: 每帧只做一次正向FFT，与缓存的各模板频谱相乘得到所有模板的相关结果，再做掩码归一化
+- sparse: 只比较每个模板少量有区分度的采样点，得分最高的候选位置再用 matchTemplate 确认
+
+所有引擎的 search() 返回与 opencv 引擎相同含义的 (相似度分数, 最佳位置)，
+分数为 1 - TM_SQDIFF_NORMED，位置为模板左上角在输入图像中的坐标
+"""
+
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class OpenCVEngine:
+    """逐模板 cv2.matchTemplate 的匹配引擎"""
+
+    name = "opencv"
+
+    def search(self, image, template_info, result_buffer=None, frame_cache=None):
+        """在二值图像中搜索模板的最佳位置
+        :param image: 已二值化的图像（整个区域或其中的窗口）
+        :param template_info: 预编译的模板信息（包含binary和mask）
+        :param result_buffer: matchTemplate的输出缓冲区（可选）
+        :param frame_cache: 当前帧的缓存字典（可选），同一帧的多个模板共享
+        :return: (相似度分数, 最佳位置)
+        """
+        result = self._score_map(image, template_info["binary"], template_info["mask"], result_buffer)
+
+        # 查找最佳匹配位置
+        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+
+        # 使用TM_SQDIFF_NORMED方法，值越小越好，需要转换为相似度分数
+        return 1.0 - min_val, min_loc
+
+    @staticmethod
+    def _score_map(image, binary, mask, result_buffer=None):
+        """计算每个位置的 TM_SQDIFF_NORMED 结果（值越小越好）"""
+        if mask is not None:
+            # 使用掩码进行模板匹配（只考虑非透明区域）
+            return cv2.matchTemplate(image, binary, cv2.TM_SQDIFF_NORMED, result=result_buffer, mask=mask)
+        # 无透明通道，直接匹配
+        return cv2.matchTemplate(image, binary, cv2.TM_SQDIFF_NORMED, result=result_buffer)
+
+    def get_stats(self):
+        """获取引擎统计"""
+        return {"engine": self.name}
+
+
+class PyramidEngine(OpenCVEngine):
+    """由粗到细的金字塔匹配引擎
+
+    帧和模板按 2^levels 缩小后先做一次粗匹配，取得分最高的若干个候选位置，
+    再在每个候选位置附近的小窗口内用全分辨率模板匹配，返回全分辨率下的得分。
+    模板缩小后过小时退回整幅图像的全分辨率匹配
+    """
+
+    name = "pyramid"
+
+    def __init__(self, levels=1, candidates=3, min_size=6):
+        """
+        参数:
+            levels: 缩小的层数，每层缩小一半
+            candidates: 在全分辨率下确认的候选位置数
+            min_size: 缩小后模板的最小边长（像素），小于该值时不使用金字塔
+        """
+        self.levels = max(1, int(levels))
+        self.scale = 2 ** self.levels
+        self.candidates = max(1, int(candidates))
+        self.min_size = min_size
+        # 模板内容哈希 -> 缩小后的模板和掩码
+        self._compiled = {}
+        # 像素比较次数按 候选位置数 x 模板像素数 估算
+        self.stats = {"searches": 0, "fallbacks": 0, "refined": 0, "coarse_ops": 0, "refine_ops": 0, "full_ops": 0}
+
+    def _compile(self, template_info):
+        """缩小模板和掩码，结果按模板内容哈希缓存"""
+        key = template_info.get("hash") or id(template_info["binary"])
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            t_w, t_h = template_info["size"]
+            size = (t_w // self.scale, t_h // self.scale)
+            if min(size) < self.min_size:
+                compiled = {"binary": None, "mask": None, "size": size}
+            else:
+                binary = cv2.resize(template_info["binary"], size, interpolation=cv2.INTER_AREA)
+                mask = template_info["mask"]
+                if mask is not None:
+                    # 缩小后半透明的边缘按多数像素归类，掩码保持0/255
+                    mask = np.where(cv2.resize(mask, size, interpolation=cv2.INTER_AREA) >= 128, 255, 0).astype(np.uint8)
+                compiled = {"binary": binary, "mask": mask, "size": size}
+            self._compiled[key] = compiled
+        return compiled
+
+    def _coarse_image(self, image, frame_cache):
+        """缩小输入图像，同一帧的多个模板共享结果"""
+        size = (image.shape[1] // self.scale, image.shape[0] // self.scale)
+        key = ("pyramid", image.ctypes.data, image.shape, self.scale)
+        coarse = frame_cache.get(key) if frame_cache is not None else None
+        if coarse is None:
+            coarse = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            if frame_cache is not None:
+                frame_cache[key] = coarse
+        return coarse
+
+    def search(self, image, template_info, result_buffer=None, frame_cache=None):
+        """先粗匹配再在候选位置附近全分辨率确认，参数和返回值与 OpenCVEngine.search 相同"""
+        stats = self.stats
+        compiled = self._compile(template_info)
+        c_w, c_h = compiled["size"]
+        t_w, t_h = template_info["size"]
+        height, width = image.shape[:2]
+        full_ops = (height - t_h + 1) * (width - t_w + 1) * t_w * t_h
+        stats["searches"] += 1
+        stats["full_ops"] += full_ops
+        if compiled["binary"] is None or width // self.scale < c_w or height // self.scale < c_h:
+            stats["fallbacks"] += 1
+            stats["refine_ops"] += full_ops
+            return OpenCVEngine.search(self, image, template_info, result_buffer)
+
+        coarse_image = self._coarse_image(image, frame_cache)
+        result = self._score_map(coarse_image, compiled["binary"], compiled["mask"])
+        stats["coarse_ops"] += result.size * c_w * c_h
+
+        scale = self.scale
+        best_score, best_loc = -np.inf, (0, 0)
+        for _ in range(self.candidates):
+            min_val, _, (cx, cy), _ = cv2.minMaxLoc(result)
+            if best_score != -np.inf and not np.isfinite(min_val):
+                break
+            # 粗匹配位置对应全分辨率下 scale 像素的不确定范围，窗口各方向再多留 scale 像素
+            x0, y0 = max(0, (cx - 1) * scale), max(0, (cy - 1) * scale)
+            x1, y1 = min(width - t_w, (cx + 1) * scale), min(height - t_h, (cy + 1) * scale)
+            window = image[y0:y1 + t_h, x0:x1 + t_w]
+            stats["refined"] += 1
+            score, (x, y) = OpenCVEngine.search(self, window, template_info)
+            stats["refine_ops"] += (y1 - y0 + 1) * (x1 - x0 + 1) * t_w * t_h
+            if score > best_score:
+                best_score, best_loc = score, (x + x0, y + y0)
+            # 抑制该候选附近的粗匹配结果，下一个候选取其他位置
+            result[max(0, cy - c_h // 2):cy + c_h // 2 + 1, max(0, cx - c_w // 2):cx + c_w // 2 + 1] = np.inf
+        return best_score, best_loc
+
+    def get_stats(self):
+        """获取引擎统计
+        :return: 搜索次数、退回全分辨率的次数、确认的候选数，以及像素比较次数占全分辨率搜索的比例
+        """
+        stats = dict(self.stats)
+        stats["engine"] = self.name
+        stats["levels"] = self.levels
+        stats["ops_ratio"] = (stats["coarse_ops"] + stats["refine_ops"]) / stats["full_ops"] if stats["full_ops"] else 1.0
+        return stats
+
+
+# SWAR popcount 使用的常量
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_SHIFT_1 = np.uint64(1)
+_SHIFT_2 = np.uint64(2)
+_SHIFT_4 = np.uint64(4)
+# 字节计数累加不超过该次数时不会溢出（每个字节最多8，31 * 8 < 256）
+_LANE_TERMS = 31
+
+
+def _add_byte_counts(words, lanes, scratch):
+    """将每个字节内置位的个数（SWAR popcount 的前三步）累加到 lanes，words 会被覆盖"""
+    np.right_shift(words, _SHIFT_1, out=scratch)
+    scratch &= _M1
+    words -= scratch
+    np.right_shift(words, _SHIFT_2, out=scratch)
+    scratch &= _M2
+    words &= _M2
+    words += scratch
+    np.right_shift(words, _SHIFT_4, out=scratch)
+    words += scratch
+    words &= _M4
+    lanes += words
+
+
+def _flush_lanes(lanes, total):
+    """将字节计数按 uint64 求和后累加到 total，并清空 lanes"""
+    total += lanes.view(np.uint8).reshape(lanes.shape + (8,)).sum(axis=-1, dtype=np.int64)
+    lanes[:] = 0
+
+
+class BitPackedEngine:
+    """位打包的二值匹配引擎
+
+    帧和模板在匹配前都已二值化为0/255，TM_SQDIFF_NORMED 等价于带掩码的汉明距离：
+        score = 1 - H / sqrt(nT * nI)
+    其中 H 为掩码内帧与模板不同的像素数，nT 为掩码内模板的白色像素数，nI 为掩码内帧的白色像素数。
+    H = nI + nT - 2C，C 为掩码内两者都为白色的像素数，因此每个候选位置只需要两个 AND + popcount 计数。
+    帧按行打包成 uint64，同时生成0~63位的64种移位，任意横向位置的64个像素都是某个移位中的一个完整的字；
+    同一帧的打包结果在多个模板之间共享。
+    掩码范围内帧没有白色像素时 nI 为0，得分为 -inf（cv2.matchTemplate 在这些位置因浮点误差得到很大的有限值），
+    两者都远低于匹配阈值，其余位置的得分与 cv2.matchTemplate 的差异在 float32 精度以内
+    """
+
+    name = "bitpacked"
+
+    def __init__(self):
+        # 模板内容哈希 -> 打包后的模板和掩码
+        self._compiled = {}
+        self.stats = {"searches": 0, "candidates": 0, "word_ops": 0, "frames_packed": 0}
+
+    def _compile(self, template_info):
+        """按行打包模板中白色且不透明的像素和掩码，结果按模板内容哈希缓存"""
+        key = template_info.get("hash") or id(template_info["binary"])
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            white = template_info["binary"] > 127
+            mask = template_info["mask"]
+            mask = np.ones(white.shape, dtype=bool) if mask is None else mask > 0
+            compiled = {
+                "white": self._pack_rows(white & mask),
+                "mask": self._pack_rows(mask),
+                "white_count": int(np.count_nonzero(white & mask)),
+            }
+            self._compiled[key] = compiled
+        return compiled
+
+    @staticmethod
+    def _pack_rows(bits, words=None):
+        """按行打包为 uint64，第k个像素对应第 k // 64 个字的第 k % 64 位，不足的位补0
+        :param bits: 二维布尔数组
+        :param words: 每行的字数（可选），默认为刚好容纳一行的字数
+        """
+        height, width = bits.shape
+        words = words or (width + 63) // 64
+        padded = np.zeros((height, words * 64), dtype=bool)
+        padded[:, :width] = bits
+        packed = np.packbits(padded, axis=1, bitorder="little")
+        return packed.view("<u8").astype(np.uint64, copy=False)
+
+    def _shifted_frame(self, image, words, frame_cache):
+        """
+        打包帧并生成64种移位，同一帧的多个模板共享结果
+
+        返回:
+            uint64数组 (64, 高度, 字数)，[s, y, q] 为第y行从 64q+s 开始的64个像素
+        """
+        key = ("bitpacked", image.ctypes.data, image.shape)
+        cached = frame_cache.get(key) if frame_cache is not None else None
+        if cached is not None and cached.shape[2] >= words:
+            return cached
+
+        self.stats["frames_packed"] += 1
+        # 多补一个字，移位时高位从下一个字取
+        base = self._pack_rows(image > 127, words + 1)
+        shifts = np.arange(1, 64, dtype=np.uint64)[:, None, None]
+        shifted = np.empty((64,) + (base.shape[0], words), dtype=np.uint64)
+        shifted[0] = base[:, :words]
+        shifted[1:] = (base[None, :, :words] >> shifts) | (base[None, :, 1:words + 1] << (np.uint64(64) - shifts))
+        if frame_cache is not None:
+            frame_cache[key] = shifted
+        return shifted
+
+    def score_map(self, image, template_info, frame_cache=None):
+        """
+        计算每个位置的 TM_SQDIFF_NORMED 结果（与 cv2.matchTemplate 的输出相同，值越小越好）
+
+        返回:
+            float64数组 (高度 - 模板高度 + 1, 宽度 - 模板宽度 + 1)
+        """
+        compiled = self._compile(template_info)
+        t_w, t_h = template_info["size"]
+        height, width = image.shape[:2]
+        rows, cols = height - t_h + 1, width - t_w + 1
+        template_words = compiled["mask"].shape[1]
+        blocks = (cols + 63) // 64
+        frame = self._shifted_frame(image, blocks + template_words, frame_cache)
+
+        shape = (64, rows, blocks)
+        both = np.zeros(shape, dtype=np.int64)
+        frame_white = np.zeros(shape, dtype=np.int64)
+        both_lanes = np.zeros(shape, dtype=np.uint64)
+        white_lanes = np.zeros(shape, dtype=np.uint64)
+        words = np.empty(shape, dtype=np.uint64)
+        scratch = np.empty(shape, dtype=np.uint64)
+        terms = used = 0
+        for r in range(t_h):
+            for w in range(template_words):
+                mask_word = compiled["mask"][r, w]
+                if not mask_word:
+                    continue
+                window = frame[:, r:r + rows, w:w + blocks]
+                np.bitwise_and(window, compiled["white"][r, w], out=words)
+                _add_byte_counts(words, both_lanes, scratch)
+                np.bitwise_and(window, mask_word, out=words)
+                _add_byte_counts(words, white_lanes, scratch)
+                terms += 1
+                used += 1
+                if terms == _LANE_TERMS:
+                    _flush_lanes(both_lanes, both)
+                    _flush_lanes(white_lanes, frame_white)
+                    terms = 0
+        if terms:
+            _flush_lanes(both_lanes, both)
+            _flush_lanes(white_lanes, frame_white)
+
+        # [s, y, q] -> [y, 64q+s]
+        both = both.transpose(1, 2, 0).reshape(rows, blocks * 64)[:, :cols]
+        frame_white = frame_white.transpose(1, 2, 0).reshape(rows, blocks * 64)[:, :cols]
+        white_count = compiled["white_count"]
+        distance = frame_white + white_count - 2 * both
+
+        stats = self.stats
+        stats["searches"] += 1
+        stats["candidates"] += rows * cols
+        # 每个候选位置、每个非空的模板字各做两次 AND + popcount
+        stats["word_ops"] += 2 * used * 64 * rows * blocks
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return distance / np.sqrt(frame_white * float(white_count))
+
+    def search(self, image, template_info, result_buffer=None, frame_cache=None):
+        """在二值图像中搜索模板的最佳位置，参数和返回值与 OpenCVEngine.search 相同"""
+        result = self.score_map(image, template_info, frame_cache)
+        index = int(np.argmin(result))
+        y, x = divmod(index, result.shape[1])
+        return 1.0 - float(result[y, x]), (x, y)
+
+    def get_stats(self):
+        """获取引擎统计"""
+        stats = dict(self.stats)
+        stats["engine"] = self.name
+        return stats
+
+
+class FFTEngine:
+    """基于FFT的多模板相关匹配引擎
+
+    与 BitPackedEngine 相同，二值图像上的 TM_SQDIFF_NORMED 由两个相关计数决定：
+    C（掩码内帧和模板都为白色的像素数）和 nI（掩码内帧的白色像素数）。
+    帧的频谱每帧只计算一次，各模板的 (模板白色 & 掩码, 掩码) 频谱按模板和FFT尺寸缓存，
+    每个模板只需要两次频谱相乘和两次只计算有效行的逆变换。
+    变换使用 float32（与 cv2.matchTemplate 的输出精度相同），相关计数取整后是精确的整数
+    """
+
+    name = "fft"
+
+    def __init__(self):
+        # (模板内容哈希, FFT尺寸) -> 模板白色像素和掩码的频谱，以及掩码内模板白色像素数
+        self._spectra = {}
+        self.stats = {"searches": 0, "forward_transforms": 0, "inverse_transforms": 0, "cached_spectra": 0}
+
+    @staticmethod
+    def _fft_shape(image):
+        """FFT尺寸：不小于图像尺寸的最优DFT尺寸（有效的相关位置不会发生循环卷绕）"""
+        return cv2.getOptimalDFTSize(image.shape[0]), cv2.getOptimalDFTSize(image.shape[1])
+
+    @staticmethod
+    def _spectrum(plane, shape):
+        """补零到FFT尺寸后做正向变换（CCS压缩格式）"""
+        padded = np.zeros(shape, dtype=np.float32)
+        padded[:plane.shape[0], :plane.shape[1]] = plane
+        return cv2.dft(padded, nonzeroRows=plane.shape[0])
+
+    def _frame_spectrum(self, image, shape, frame_cache):
+        """帧的频谱，同一帧的多个模板共享结果"""
+        key = ("fft", image.ctypes.data, image.shape)
+        spectrum = frame_cache.get(key) if frame_cache is not None else None
+        if spectrum is None:
+            self.stats["forward_transforms"] += 1
+            spectrum = self._spectrum(image > 127, shape)
+            if frame_cache is not None:
+                frame_cache[key] = spectrum
+        return spectrum
+
+    def _template_spectra(self, template_info, shape):
+        """模板白色像素和掩码的频谱，按模板内容哈希和FFT尺寸缓存"""
+        key = (template_info.get("hash") or id(template_info["binary"]), shape)
+        spectra = self._spectra.get(key)
+        if spectra is None:
+            white = template_info["binary"] > 127
+            mask = template_info["mask"]
+            mask = np.ones(white.shape, dtype=bool) if mask is None else mask > 0
+            spectra = {
+                "white": self._spectrum(white & mask, shape),
+                "mask": self._spectrum(mask, shape),
+                "white_count": np.float32(np.count_nonzero(white & mask)),
+            }
+            self._spectra[key] = spectra
+            self.stats["cached_spectra"] = len(self._spectra)
+        return spectra
+
+    def _correlate(self, spectrum, template_spectrum, rows, cols):
+        """频谱相乘后逆变换，只计算有效的行，返回取整后的相关计数"""
+        product = cv2.mulSpectrums(spectrum, template_spectrum, 0, conjB=True)
+        corr = cv2.idft(product, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT, nonzeroRows=rows)
+        self.stats["inverse_transforms"] += 1
+        # 取整并去掉浮点误差产生的 -0（否则没有白色像素的位置会得到 -inf）
+        corr = corr[:rows, :cols]
+        np.rint(corr, out=corr)
+        np.maximum(corr, 0.0, out=corr)
+        return corr
+
+    def score_map(self, image, template_info, frame_cache=None):
+        """
+        计算每个位置的 TM_SQDIFF_NORMED 结果（与 cv2.matchTemplate 的输出相同，值越小越好）
+
+        返回:
+            float32数组 (高度 - 模板高度 + 1, 宽度 - 模板宽度 + 1)
+        """
+        shape = self._fft_shape(image)
+        spectrum = self._frame_spectrum(image, shape, frame_cache)
+        spectra = self._template_spectra(template_info, shape)
+
+        t_w, t_h = template_info["size"]
+        rows, cols = image.shape[0] - t_h + 1, image.shape[1] - t_w + 1
+        both = self._correlate(spectrum, spectra["white"], rows, cols)
+        frame_white = self._correlate(spectrum, spectra["mask"], rows, cols)
+        white_count = spectra["white_count"]
+        self.stats["searches"] += 1
+
+        # H = nI + nT - 2C，结果为 H / sqrt(nT * nI)
+        both *= -2.0
+        both += frame_white
+        both += white_count
+        frame_white *= white_count
+        np.sqrt(frame_white, out=frame_white)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            np.divide(both, frame_white, out=both)
+        return both
+
+    def search(self, image, template_info, result_buffer=None, frame_cache=None):
+        """在二值图像中搜索模板的最佳位置，参数和返回值与 OpenCVEngine.search 相同"""
+        result = self.score_map(image, template_info, frame_cache)
+        index = int(np.argmin(result))
+        y, x = divmod(index, result.shape[1])
+        return 1.0 - float(result[y, x]), (x, y)
+
+    def get_stats(self):
+        """获取引擎统计
+        :return: 搜索次数、正向和逆变换次数（正向变换每帧一次，与模板数量无关）以及缓存的模板频谱数
+        """
+        stats = dict(self.stats)
+        stats["engine"] = self.name
+        return stats
+
+
+class SparseEngine(OpenCVEngine):
+    """稀疏采样点匹配引擎
+
+    模板中大部分像素是透明背景或成片的白色，编译时只保留少量有区分度的采样点：
+    白色与黑色交界的边缘像素，以及均匀分布的内部像素。每个采样点对所有候选位置是帧上的一个切片，
+    累加各采样点的不一致数得到每个位置的稀疏不一致率；不一致率最低的几个候选位置
+    再在小窗口内用 matchTemplate 确认，返回确认后的得分。
+    稀疏不一致率超过 max_mismatch 时认为没有匹配，不做确认，返回得分 0.0
+    """
+
+    name = "sparse"
+
+    def __init__(self, points=64, candidates=2, max_mismatch=0.25, threshold=0.9):
+        """
+        参数:
+            points: 每个模板的采样点数（一半取边缘像素，一半取内部像素）
+            candidates: 用 matchTemplate 确认的候选位置数
+            max_mismatch: 最佳候选的稀疏不一致率超过该值时不做确认，直接判定为未匹配
+            threshold: 模板匹配阈值，max_mismatch 不能低于 1 - threshold，
+                否则得分达到阈值的位置也可能在确认之前被拒绝
+        """
+        self.points = max(2, min(int(points), 255))
+        self.candidates = max(1, int(candidates))
+        if not 0.0 <= max_mismatch <= 1.0:
+            logger.warning(f"稀疏匹配 max_mismatch={max_mismatch} 超出范围 [0, 1]，已截断")
+            max_mismatch = min(max(max_mismatch, 0.0), 1.0)
+        if max_mismatch < 1.0 - threshold:
+            logger.warning(f"稀疏匹配 max_mismatch={max_mismatch} 低于 1 - 匹配阈值({threshold})，"
+                           f"已调整为 {1.0 - threshold:.3f}")
+            max_mismatch = 1.0 - threshold
+        self.max_mismatch = max_mismatch
+        # 模板内容哈希 -> 采样点
+        self._compiled = {}
+        self.stats = {"searches": 0, "confirmed": 0, "rejected": 0, "sparse_comparisons": 0,
+                      "confirm_comparisons": 0, "dense_comparisons": 0}
+
+    def _compile(self, template_info):
+        """选取模板的采样点，结果按模板内容哈希缓存
+        :return: 字典，white/black 为白色和黑色采样点的 (dy, dx) 数组
+        """
+        key = template_info.get("hash") or id(template_info["binary"])
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            white = template_info["binary"] > 127
+            mask = template_info["mask"]
+            mask = np.ones(white.shape, dtype=bool) if mask is None else mask > 0
+
+            # 边缘：与掩码内上下左右相邻像素颜色不同的像素
+            edge = np.zeros(white.shape, dtype=bool)
+            for axis in (0, 1):
+                differs = (np.diff(white, axis=axis) != 0) & (np.diff(mask.astype(np.int8), axis=axis) == 0)
+                differs &= np.take(mask, range(white.shape[axis] - 1), axis=axis)
+                before = [slice(None), slice(None)]
+                after = [slice(None), slice(None)]
+                before[axis], after[axis] = slice(0, -1), slice(1, None)
+                edge[tuple(before)] |= differs
+                edge[tuple(after)] |= differs
+            interior = mask & ~edge
+
+            points = []
+            for candidates, count in ((edge, self.points // 2), (interior, self.points - self.points // 2)):
+                ys, xs = np.nonzero(candidates)
+                if len(ys) == 0:
+                    continue
+                # 按行优先顺序等间隔选取，采样点均匀分布在整个模板上
+                index = np.unique(np.linspace(0, len(ys) - 1, min(count, len(ys))).astype(int))
+                points.extend(zip(ys[index], xs[index]))
+            points = np.array(sorted(set(points)), dtype=np.intp).reshape(-1, 2)
+            values = white[points[:, 0], points[:, 1]]
+            compiled = {"white": points[values], "black": points[~values], "count": len(points)}
+            self._compiled[key] = compiled
+        return compiled
+
+    @staticmethod
+    def _frame_bits(image, frame_cache):
+        """帧的0/1图像，同一帧的多个模板共享结果"""
+        key = ("sparse", image.ctypes.data, image.shape)
+        bits = frame_cache.get(key) if frame_cache is not None else None
+        if bits is None:
+            bits = (image > 127).view(np.uint8)
+            if frame_cache is not None:
+                frame_cache[key] = bits
+        return bits
+
+    def mismatch_map(self, image, template_info, frame_cache=None):
+        """
+        计算每个候选位置上不一致的采样点数
+
+        返回:
+            (uint8数组 (高度 - 模板高度 + 1, 宽度 - 模板宽度 + 1), 采样点数)
+        """
+        compiled = self._compile(template_info)
+        bits = self._frame_bits(image, frame_cache)
+        t_w, t_h = template_info["size"]
+        rows, cols = image.shape[0] - t_h + 1, image.shape[1] - t_w + 1
+
+        # 白色采样点处帧为黑色、黑色采样点处帧为白色都算不一致
+        mismatches = np.full((rows, cols), len(compiled["white"]), dtype=np.uint8)
+        for dy, dx in compiled["white"]:
+            mismatches -= bits[dy:dy + rows, dx:dx + cols]
+        for dy, dx in compiled["black"]:
+            mismatches += bits[dy:dy + rows, dx:dx + cols]
+        self.stats["sparse_comparisons"] += rows * cols * compiled["count"]
+        return mismatches, compiled["count"]
+
+    def search(self, image, template_info, result_buffer=None, frame_cache=None):
+        """稀疏筛选后确认候选位置，参数和返回值与 OpenCVEngine.search 相同"""
+        stats = self.stats
+        stats["searches"] += 1
+        t_w, t_h = template_info["size"]
+        height, width = image.shape[:2]
+        stats["dense_comparisons"] += (height - t_h + 1) * (width - t_w + 1) * t_w * t_h
+
+        mismatches, count = self.mismatch_map(image, template_info, frame_cache)
+        best_score, best_loc = -np.inf, (0, 0)
+        for i in range(self.candidates):
+            min_val, _, (cx, cy), _ = cv2.minMaxLoc(mismatches)
+            ratio = min_val / count
+            if ratio > self.max_mismatch:
+                if i == 0:
+                    stats["rejected"] += 1
+                    # 稀疏不一致率只用于筛选，不作为得分返回，避免估计值通过调用方的阈值
+                    return 0.0, (cx, cy)
+                break
+            # 稀疏不一致数相同的相邻位置都可能是最佳位置，确认窗口各方向多留1像素
+            x0, y0 = max(0, cx - 1), max(0, cy - 1)
+            x1, y1 = min(width - t_w, cx + 1), min(height - t_h, cy + 1)
+            window = image[y0:y1 + t_h, x0:x1 + t_w]
+            stats["confirmed"] += 1
+            stats["confirm_comparisons"] += (y1 - y0 + 1) * (x1 - x0 + 1) * t_w * t_h
+            score, (x, y) = OpenCVEngine.search(self, window, template_info)
+            if score > best_score:
+                best_score, best_loc = score, (x + x0, y + y0)
+            # 抑制该候选附近的位置，下一个候选取其他位置
+            mismatches[max(0, cy - t_h // 2):cy + t_h // 2 + 1, max(0, cx - t_w // 2):cx + t_w // 2 + 1] = 255
+        return best_score, best_loc
+
+    def get_stats(self):
+        """获取引擎统计
+        :return: 搜索次数、确认和直接拒绝的次数，以及像素比较次数占稠密匹配的比例
+        """
+        stats = dict(self.stats)
+        stats["engine"] = self.name
+        compared = stats["sparse_comparisons"] + stats["confirm_comparisons"]
+        stats["comparison_ratio"] = compared / stats["dense_comparisons"] if stats["dense_comparisons"] else 1.0
+        return stats
+
+
+# 引擎名称 -> 引擎类
+ENGINES = {
+    OpenCVEngine.name: OpenCVEngine,
+    PyramidEngine.name: PyramidEngine,
+    BitPackedEngine.name: BitPackedEngine,
+    FFTEngine.name: FFTEngine,
+    SparseEngine.name: SparseEngine,
+}
+
+
+def create_engine(name="opencv", options=None):
+    """
+    按名称创建匹配引擎
+
+    参数:
+        name: 引擎名称，见 ENGINES，未知名称时使用 opencv 引擎
+        options: 引擎参数字典（可选），以 _comment 结尾的说明项会被忽略
+    """
+    engine_class = ENGINES.get(name)
+    if engine_class is None:
+        logger.warning(f"未知的匹配引擎: {name}，使用 {OpenCVEngine.name}")
+        engine_class = OpenCVEngine
+    options = {key: value for key, value in (options or {}).items() if not key.endswith("_comment")}
+    try:
+        return engine_class(**options)
+    except TypeError as e:
+        logger.error(f"匹配引擎 {name} 参数无效: {e}，使用默认参数")
+        return engine_class()
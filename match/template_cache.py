@@ -0,0 +1,118 @@
+import cv2
+import numpy as np
+import hashlib
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def compile_template(template_img):
+    """预编译模板：二值化模板、透明度掩码、尺寸和内容哈希
+    :param template_img: 模板图像（可能带透明通道）
+    :return: 编译结果字典，包含binary, mask, size, hash
+    """
+    has_alpha = len(template_img.shape) > 2 and template_img.shape[2] == 4
+
+    if has_alpha:
+        # 分离RGB和Alpha通道，只考虑非透明区域
+        bgr = template_img[:, :, 0:3]
+        mask = np.uint8(template_img[:, :, 3] > 0) * 255
+    else:
+        bgr = template_img
+        mask = None
+
+    # 对模板图像进行二值化预处理
+    gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY) if len(bgr.shape) == 3 else bgr
+    _, binary = cv2.threshold(gray, 210, 255, cv2.THRESH_BINARY)
+
+    # 内容哈希包含形状信息，用于识别相同的模板
+    digest = hashlib.sha1()
+    digest.update(str(template_img.shape).encode("ascii"))
+    digest.update(np.ascontiguousarray(template_img).tobytes())
+
+    return {
+        "binary": np.ascontiguousarray(binary),
+        "mask": mask,
+        "size": (template_img.shape[1], template_img.shape[0]),
+        "hash": digest.hexdigest()
+    }
+
+
+class TemplateCache:
+    """进程级模板缓存，按路径、分辨率文件夹和文件修改时间缓存已编译的模板
+
+    缓存条目在进程内共享且只读，多个TemplateMatcher可以同时引用
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (路径, 分辨率文件夹) -> (修改时间, 编译后的模板)
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_path, resolution_folder):
+        """获取已编译的模板，文件未缓存或已被修改时从磁盘重新加载
+        :param template_path: 模板文件路径
+        :param resolution_folder: 模板所属的分辨率文件夹
+        :return: 模板信息字典（image, path及编译结果），加载失败返回None
+        """
+        template_path = os.path.abspath(template_path)
+        try:
+            mtime = os.path.getmtime(template_path)
+        except OSError:
+            logger.error(f"模板文件不存在: {template_path}")
+            return None
+
+        key = (template_path, resolution_folder)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[0] == mtime:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+            entry = self._load(template_path)
+            if entry is not None:
+                self._entries[key] = (mtime, entry)
+            return entry
+
+    @staticmethod
+    def _load(template_path):
+        """从磁盘读取并编译模板"""
+        # 读取图像，保留透明通道
+        template_img = cv2.imread(template_path, cv2.IMREAD_UNCHANGED)
+        if template_img is None:
+            # cv2.imread在Windows下无法处理中文路径，改为先读取字节再解码
+            try:
+                data = np.fromfile(template_path, dtype=np.uint8)
+                template_img = cv2.imdecode(data, cv2.IMREAD_UNCHANGED)
+            except Exception as e:
+                logger.error(f"读取模板文件失败: {template_path}, {e}")
+                return None
+            if template_img is None:
+                logger.error(f"无法加载模板图像: {template_path}")
+                return None
+
+        entry = {
+            "image": template_img,
+            "path": template_path
+        }
+        entry.update(compile_template(template_img))
+        return entry
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """获取缓存统计信息"""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# 创建全局模板缓存实例
+template_cache = TemplateCache()
@@ -1,14 +1,23 @@
 import cv2
 import numpy as np
+import hashlib
 import logging
 import os
+import threading
+from collections import OrderedDict
+
+from match.engines import OpenCVEngine, create_engine
+from match.template_cache import template_cache
 
 logger = logging.getLogger(__name__)
 
 class TemplateMatcher:
     """模板匹配类，支持带透明度的图像匹配和不同分辨率模板"""
 
-    def __init__(self):
+    def __init__(self, engine=None):
+        """
+        :param engine: 匹配引擎实例或名称（见 match.engines.ENGINES），默认为逐模板的 opencv 引擎
+        """
         self.templates = {}
         self.last_match = None
         self.base_resolution = (1920, 1080)  # 基准分辨率
@@ -18,14 +27,58 @@ class TemplateMatcher:
             (2560, 1440): "1440p",
             (3840, 2160): "4k"
         }
+        # 帧预处理缓冲区，按线程隔离（检测线程和主循环线程会同时匹配）
+        self._buffers = threading.local()
+        # 位置跟踪：游戏提示出现的位置基本固定，记住每个模板上次匹配的位置，
+        # 下一帧先在其周围的小窗口内搜索，未匹配时才搜索整个区域
+        self.tracking_enabled = True
+        self.tracking_padding = 24
+        self._last_locations = {}
+        self.tracking_stats = {"hits": 0, "misses": 0, "searched_pixels": 0, "full_pixels": 0}
+        # 锚点：标定得到的每个模板在匹配区域内的出现范围，整区域搜索时只搜索该范围
+        self._search_regions = {}
+        self._search_frame_shape = None
+        # 预筛选：用积分图计算每个候选位置各网格单元的白色像素数，与模板的签名比较，
+        # 没有任何位置接近模板签名时跳过该模板的完整匹配（空闲帧大多在这一步被排除）
+        self.prefilter_enabled = True
+        self.prefilter_grid = (4, 16)
+        self._signatures = {}
+        self.prefilter_stats = {"checked": 0, "rejected_total": 0, "rejected_window": 0, "rejected_cells": 0,
+                                "passed": 0}
+        # 匹配结果备忘：游戏提示是静态图像，提示显示期间连续帧二值化后往往完全相同，
+        # 按二值图像的哈希缓存匹配结果（LRU），相同的帧不再执行匹配
+        self.memo_enabled = True
+        self.memo_max_entries = 256
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self.memo_stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.engine = OpenCVEngine()
+        if engine is not None:
+            self.set_engine(engine)
+
+    def set_engine(self, engine, options=None):
+        """设置匹配引擎，所有引擎通过相同的 match_template 接口使用
+        :param engine: 引擎实例或名称
+        :param options: 按名称创建引擎时的参数字典（可选）
+        """
+        self.engine = create_engine(engine, options) if isinstance(engine, str) else engine
+        self.clear_memo()
+        logger.info(f"模板匹配引擎: {self.engine.name}")
+
+    def get_engine_stats(self):
+        """获取匹配引擎统计"""
+        return self.engine.get_stats()
 
     def load_templates(self, template_configs, window_size=None):
         """加载模板配置，根据窗口尺寸选择合适的模板
         :param template_configs: 模板配置列表，每个元素包含name, path, threshold
         :param window_size: 窗口尺寸元组 (width, height)
         """
-        # 清空已加载的模板
+        # 清空已加载的模板和跟踪的位置
         self.templates = {}
+        self._last_locations = {}
+        self._signatures = {}
+        self.clear_memo()
         
         # 确定使用哪个分辨率文件夹
         resolution_folder = self._get_resolution_folder(window_size)
@@ -44,33 +97,16 @@ class TemplateMatcher:
                 # 如果分辨率特定的模板不存在，则使用原始路径
                 template_path = resolution_path if os.path.exists(resolution_path) else original_path
                 
-                # 确保路径是正确的编码格式
-                template_path = os.path.abspath(template_path)
-                
-                # 读取图像，保留透明通道
-                template_img = cv2.imread(template_path, cv2.IMREAD_UNCHANGED)
-                if template_img is None:
-                    logger.error(f"无法加载模板图像: {template_path}")
-                    # 尝试使用不同的编码方式读取
-                    try:
-                        # 尝试使用utf-8编码路径
-                        utf8_path = template_path.encode('utf-8').decode('utf-8')
-                        template_img = cv2.imread(utf8_path, cv2.IMREAD_UNCHANGED)
-                        if template_img is not None:
-                            logger.info(f"使用UTF-8编码成功加载模板: {utf8_path}")
-                        else:
-                            logger.error(f"使用UTF-8编码仍无法加载模板: {utf8_path}")
-                    except Exception as e:
-                        logger.error(f"尝试使用UTF-8编码加载模板失败: {str(e)}")
+                # 从进程级缓存获取已编译的模板，文件未变化时不会重复读取磁盘
+                cached = template_cache.get(template_path, resolution_folder)
+                if cached is None:
                     continue
 
-                # 存储模板信息
-                self.templates[config["name"]] = {
-                    "image": template_img,
-                    "threshold": config["threshold"],
-                    "path": template_path
-                }
-                logger.info(f"已加载模板: {config['name']} (使用: {template_path})")
+                # 缓存条目共享只读，阈值等按匹配器单独保存
+                template_info = dict(cached)
+                template_info["threshold"] = config["threshold"]
+                self.templates[config["name"]] = template_info
+                logger.info(f"已加载模板: {config['name']} (使用: {cached['path']})")
             except Exception as e:
                 logger.error(f"加载模板 {config['name']} 失败: {str(e)}")
 
@@ -105,87 +141,391 @@ class TemplateMatcher:
         :param template_name: 指定模板名称，如果为None则匹配所有模板
         :return: 匹配结果字典或None
         """
-            
-        best_match = None
-        best_score = 0
-
         # 确定要匹配的模板
-        templates_to_match = {}
         if template_name:
-            if template_name in self.templates:
-                templates_to_match[template_name] = self.templates[template_name]
-            else:
+            if template_name not in self.templates:
                 logger.warning(f"未找到指定模板: {template_name}")
                 return None
+            names = (template_name,)
         else:
-            templates_to_match = self.templates
+            names = self.templates
+
+        best_match, _ = self.match_templates(frame, names)
+        return best_match
+
+    def match_templates(self, frame, names, stop_score=None):
+        """按顺序匹配指定的模板，某个模板得分达到stop_score时不再匹配后面的模板
+        :param frame: 输入图像帧
+        :param names: 模板名称序列（按匹配顺序），未加载的模板会被跳过
+        :param stop_score: 提前结束的得分，为None时匹配全部模板
+        :return: (最佳匹配结果字典或None, 实际匹配的模板数)
+        """
+        best_match = None
+        best_score = 0
+        evaluated = 0
+
+        # 每帧只做一次灰度化和二值化，所有模板共享结果
+        frame_binary = self._binarize_frame(frame)
+
+        # 二值图像与之前某一帧完全相同时直接返回当时的结果
+        memo_key = None
+        if self.memo_enabled and self.memo_max_entries > 0:
+            memo_key = self._memo_key(frame_binary, names, stop_score)
+            cached = self._memo_get(memo_key)
+            if cached is not None:
+                best_match, evaluated = cached
+                best_match = dict(best_match) if best_match else None
+                self.last_match = best_match
+                return best_match, evaluated
 
         # 对每个模板进行匹配
-        for name, template_info in templates_to_match.items():
-            template_img = template_info["image"]
+        for name in names:
+            template_info = self.templates.get(name)
+            if template_info is None:
+                continue
             threshold = template_info["threshold"]
-            
+            evaluated += 1
+
+            # 预筛选未通过时不做完整匹配
+            if self.prefilter_enabled and not self._prefilter(frame_binary, template_info, name):
+                continue
+
             # 处理带透明度的模板
-            result = self._match_with_alpha(frame, template_img, threshold)
-            
+            result = self._match_with_alpha(frame_binary, template_info, threshold, name)
+
             if result and result["score"] > best_score:
                 best_score = result["score"]
                 best_match = {
                     "name": name,
                     "score": result["score"],
                     "location": result["location"],
-                    "size": (template_img.shape[1], template_img.shape[0])
+                    "size": template_info["size"]
                 }
+                if stop_score is not None and best_score >= stop_score:
+                    break
 
         self.last_match = best_match
-        return best_match
+        if memo_key is not None:
+            self._memo_put(memo_key, (dict(best_match) if best_match else None, evaluated))
+        return best_match, evaluated
 
-    def _match_with_alpha(self, frame, template, threshold):
-        """带透明度的模板匹配
-        :param frame: 输入图像
-        :param template: 模板图像（可能带透明通道）
-        :param threshold: 匹配阈值
-        :return: 匹配结果或None
+    def score_templates(self, frame, names=None):
+        """计算各模板在搜索范围内的最高得分，不使用阈值、位置跟踪、预筛选和结果备忘（用于分析得分分布和调整阈值）
+        :param frame: 输入图像帧
+        :param names: 模板名称序列，为None时计算全部模板
+        :return: 字典 {模板名称: 得分}
         """
-        # 对输入图像进行二值化预处理
-        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if len(frame.shape) == 3 else frame
-        _, frame_binary = cv2.threshold(frame_gray, 210, 255, cv2.THRESH_BINARY)
+        frame_binary = self._binarize_frame(frame)
+        scores = {}
+        for name in (self.templates if names is None else names):
+            template_info = self.templates.get(name)
+            if template_info is None:
+                continue
+            search_image, _ = self._search_window(frame_binary, template_info, name)
+            score, _ = self._search(search_image, template_info)
+            scores[name] = max(0.0, float(score))
+        return scores
 
-        # 检查模板是否有透明通道
-        has_alpha = template.shape[2] == 4 if len(template.shape) > 2 else False
+    def _memo_key(self, frame_binary, names, stop_score):
+        """备忘的键：二值图像内容的哈希、尺寸、模板顺序和提前结束的得分
+        二值图像只有0和255，先按位打包再计算哈希，需要哈希的字节数减少到1/8
+        """
+        digest = hashlib.blake2b(np.packbits(frame_binary).data, digest_size=16).digest()
+        return digest, frame_binary.shape, tuple(names), stop_score
 
-        if has_alpha:
-            # 分离RGB和Alpha通道
-            bgr = template[:, :, 0:3]
-            alpha = template[:, :, 3]
+    def _memo_get(self, key):
+        """查找备忘的匹配结果，命中时移到最近使用的位置
+        :return: (最佳匹配结果, 匹配的模板数)，未命中返回None
+        """
+        with self._memo_lock:
+            cached = self._memo.get(key)
+            if cached is None:
+                self.memo_stats["misses"] += 1
+                return None
+            self._memo.move_to_end(key)
+            self.memo_stats["hits"] += 1
+            return cached
 
-            # 对模板图像进行二值化预处理
-            bgr_gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
-            _, bgr_binary = cv2.threshold(bgr_gray, 210, 255, cv2.THRESH_BINARY)
+    def _memo_put(self, key, value):
+        """保存匹配结果，超过最大条目数时淘汰最久未使用的条目"""
+        with self._memo_lock:
+            self._memo[key] = value
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_max_entries:
+                self._memo.popitem(last=False)
+                self.memo_stats["evictions"] += 1
 
-            # 创建掩码（只考虑非透明区域）
-            mask = np.uint8(alpha > 0) * 255
+    def clear_memo(self):
+        """清空匹配结果备忘（模板、搜索范围或匹配引擎变化后结果不再有效）"""
+        with self._memo_lock:
+            self._memo.clear()
 
-            # 使用掩码进行模板匹配
-            result = cv2.matchTemplate(frame_binary, bgr_binary, cv2.TM_SQDIFF_NORMED, mask=mask)
+    def get_memo_stats(self):
+        """获取匹配结果备忘统计
+        :return: 命中、未命中和淘汰次数，命中率，当前条目数和上限
+        """
+        with self._memo_lock:
+            stats = dict(self.memo_stats)
+            stats["entries"] = len(self._memo)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["max_entries"] = self.memo_max_entries
+        return stats
+
+    def _binarize_frame(self, frame):
+        """帧预处理：灰度化并二值化，结果写入按线程复用的预分配缓冲区
+        :param frame: 输入图像帧（BGR、BGRX或灰度）
+        :return: 二值化图像（缓冲区在下一帧会被覆盖，调用方不要长期持有）
+        """
+        height, width = frame.shape[:2]
+        buffers = self._buffers
+        if getattr(buffers, "shape", None) != (height, width):
+            buffers.shape = (height, width)
+            buffers.gray = np.empty((height, width), dtype=np.uint8)
+            buffers.binary = np.empty((height, width), dtype=np.uint8)
+            buffers.results = {}
+        # 当前帧的缓存，引擎可在其中保存同一帧多个模板共享的中间结果
+        buffers.frame_cache = {}
+
+        if len(frame.shape) == 3:
+            code = cv2.COLOR_BGRA2GRAY if frame.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+            frame_gray = cv2.cvtColor(frame, code, dst=buffers.gray)
         else:
-            # 对模板图像进行二值化预处理
-            template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY) if len(template.shape) == 3 else template
-            _, template_binary = cv2.threshold(template_gray, 210, 255, cv2.THRESH_BINARY)
+            frame_gray = frame
+        cv2.threshold(frame_gray, 210, 255, cv2.THRESH_BINARY, dst=buffers.binary)
+        return buffers.binary
 
-            # 无透明通道，直接匹配
-            result = cv2.matchTemplate(frame_binary, template_binary, cv2.TM_SQDIFF_NORMED)
+    def _get_result_buffer(self, frame_binary, template_info, key):
+        """获取matchTemplate的输出缓冲区，帧尺寸和模板不变时在帧之间复用
+        :param key: 缓冲区键（模板名称，跟踪窗口使用单独的键）
+        """
+        results = getattr(self._buffers, "results", None)
+        if results is None:
+            return None
+        t_w, t_h = template_info["size"]
+        shape = (frame_binary.shape[0] - t_h + 1, frame_binary.shape[1] - t_w + 1)
+        buffer = results.get(key)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.float32)
+            results[key] = buffer
+        return buffer
+
+    def set_search_regions(self, regions, frame_size):
+        """设置各模板的搜索范围（来自检测区域标定的锚点）
+        :param regions: 字典 {模板名称: (x, y, w, h)}，坐标相对于匹配区域，None或空字典表示不限制
+        :param frame_size: 匹配区域尺寸 (width, height)，帧尺寸不同时不使用搜索范围
+        """
+        self._search_regions = dict(regions or {})
+        self._search_frame_shape = (frame_size[1], frame_size[0]) if frame_size else None
+        self.clear_memo()
+        if self._search_regions:
+            logger.info(f"已设置模板搜索范围: {self._search_regions}")
+
+    def _search_window(self, frame_binary, template_info, name):
+        """获取模板的整区域搜索范围，有锚点时为锚点范围，否则为整个区域
+        :return: (搜索图像, 左上角坐标)
+        """
+        region = self._search_regions.get(name) if name else None
+        if region is None or frame_binary.shape[:2] != self._search_frame_shape:
+            return frame_binary, (0, 0)
+        x, y, w, h = region
+        t_w, t_h = template_info["size"]
+        if w < t_w or h < t_h:
+            return frame_binary, (0, 0)
+        return frame_binary[y:y + h, x:x + w], (x, y)
 
-        # 查找最佳匹配位置
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+    def _tracking_window(self, frame_binary, template_info, name):
+        """获取模板上次匹配位置周围的搜索窗口
+        :return: (窗口视图, 窗口左上角坐标)，没有可用的上次位置时返回(None, None)
+        """
+        last = self._last_locations.get(name)
+        if last is None or last[1] != frame_binary.shape:
+            return None, None
+        (x, y), _ = last
+        t_w, t_h = template_info["size"]
+        pad = self.tracking_padding
+        height, width = frame_binary.shape[:2]
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1, y1 = min(width, x + t_w + pad), min(height, y + t_h + pad)
+        if x1 - x0 < t_w or y1 - y0 < t_h:
+            return None, None
+        return frame_binary[y0:y1, x0:x1], (x0, y0)
+
+    def get_tracking_stats(self):
+        """获取位置跟踪统计
+        :return: 命中次数、未命中次数、命中率以及实际搜索面积占整区域搜索面积的比例
+        """
+        stats = dict(self.tracking_stats)
+        tracked = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / tracked if tracked else 0.0
+        stats["search_area_ratio"] = stats["searched_pixels"] / stats["full_pixels"] if stats["full_pixels"] else 1.0
+        return stats
+
+    def _signature(self, template_info):
+        """计算模板的网格签名：每个网格单元内帧白色像素数的期望范围（按255倍计，与积分图一致）
+        :return: 字典，cells为单元格 (y0, y1, x0, x1)，lower/upper为每个单元格的下限和上限，
+                 allowance为所有单元格超出范围的总量上限
+        """
+        key = (template_info.get("hash") or id(template_info["binary"]), self.prefilter_grid,
+               template_info["threshold"])
+        signature = self._signatures.get(key)
+        if signature is None:
+            white = template_info["binary"] > 127
+            mask = template_info["mask"]
+            mask = np.ones(white.shape, dtype=bool) if mask is None else mask > 0
+            white_count = np.count_nonzero(white & mask)
+
+            # 得分 1 - H / sqrt(nT * nI) 达到阈值t时，H <= (1 - t) * sqrt(nT * nI) 且 H >= |nI - nT|，
+            # 解得 sqrt(nI / nT) <= u = ((1 - t) + sqrt((1 - t)^2 + 4)) / 2，即不一致像素数 H <= (1 - t) * u * nT
+            miss = max(0.0, 1.0 - template_info["threshold"])
+            allowance = miss * (miss + np.sqrt(miss * miss + 4)) / 2 * white_count
+
+            t_h, t_w = white.shape
+            grid_rows, grid_cols = min(self.prefilter_grid[0], t_h), min(self.prefilter_grid[1], t_w)
+            ys = np.linspace(0, t_h, grid_rows + 1).astype(int)
+            xs = np.linspace(0, t_w, grid_cols + 1).astype(int)
+            cells, lower, upper = [], [], []
+            for y0, y1 in zip(ys[:-1], ys[1:]):
+                for x0, x1 in zip(xs[:-1], xs[1:]):
+                    # 不透明部分与模板一致时，单元格内的白色像素数在 [模板白色像素数, 加上透明像素数] 之间，
+                    # 每个不一致的像素最多使单元格超出该范围1个像素
+                    cell_white = np.count_nonzero(white[y0:y1, x0:x1] & mask[y0:y1, x0:x1])
+                    transparent = np.count_nonzero(~mask[y0:y1, x0:x1])
+                    cells.append((y0, y1, x0, x1))
+                    lower.append(cell_white * 255)
+                    upper.append((cell_white + transparent) * 255)
+            signature = {
+                "cells": cells,
+                "lower": lower,
+                "upper": upper,
+                # 多留1个像素，避免边界上的取整误差
+                "allowance": (allowance + 1) * 255,
+                "total": max(0.0, white_count - allowance - 1) * 255,
+                "lower_total": white_count * 255,
+                "upper_total": (white_count + np.count_nonzero(~mask)) * 255,
+            }
+            self._signatures[key] = signature
+        return signature
 
-        # 使用TM_SQDIFF_NORMED方法，值越小越好，需要转换为相似度分数
-        score = 1.0 - min_val  # 转换为相似度分数，值越大越好
-        location = min_loc     # TM_SQDIFF_NORMED使用min_loc作为最佳匹配位置
+    def _integral(self, image):
+        """二值图像的积分图，同一帧的多个模板共享结果"""
+        frame_cache = getattr(self._buffers, "frame_cache", None)
+        key = ("integral", image.ctypes.data, image.shape)
+        integral = frame_cache.get(key) if frame_cache is not None else None
+        if integral is None:
+            integral = cv2.integral(image, sdepth=cv2.CV_32S)
+            if frame_cache is not None:
+                frame_cache[key] = integral
+        return integral
+
+    def _prefilter(self, frame_binary, template_info, name=None):
+        """网格密度预筛选：是否存在某个位置，各网格单元的白色像素数与模板签名足够接近，得分可能达到阈值
+        允许的偏差由模板阈值推导，得分达到阈值的位置一定能通过预筛选
+        :return: True表示需要做完整匹配
+        """
+        stats = self.prefilter_stats
+        stats["checked"] += 1
+        signature = self._signature(template_info)
+        image, _ = self._search_window(frame_binary, template_info, name)
+        integral = self._integral(image)
+
+        # 第一级：整个区域的白色像素数不足时不可能包含模板
+        if integral[-1, -1] < signature["total"]:
+            stats["rejected_total"] += 1
+            return False
+
+        # 第二级：整个模板范围内的白色像素数，只保留偏差不超过上限的候选位置
+        t_w, t_h = template_info["size"]
+        rows, cols = image.shape[0] - t_h + 1, image.shape[1] - t_w + 1
+        counts = (integral[t_h:t_h + rows, t_w:t_w + cols] - integral[:rows, t_w:t_w + cols]
+                  - integral[t_h:t_h + rows, :cols] + integral[:rows, :cols])
+        deviation = np.maximum(signature["lower_total"] - counts, 0) + np.maximum(counts - signature["upper_total"], 0)
+        ys, xs = np.nonzero(deviation <= signature["allowance"])
+        if len(ys) == 0:
+            stats["rejected_window"] += 1
+            return False
+
+        # 第三级：逐个单元格累加剩余候选位置超出签名范围的像素数，每个单元格之后再筛掉超过上限的位置
+        flat = integral.ravel()
+        stride = integral.shape[1]
+        base = ys * stride + xs
+        deviation = np.zeros(len(base), dtype=np.int64)
+        for (y0, y1, x0, x1), lower, upper in zip(signature["cells"], signature["lower"], signature["upper"]):
+            counts = (flat[base + (y1 * stride + x1)] - flat[base + (y0 * stride + x1)]
+                      - flat[base + (y1 * stride + x0)] + flat[base + (y0 * stride + x0)])
+            deviation += np.maximum(lower - counts, 0)
+            deviation += np.maximum(counts - upper, 0)
+            keep = deviation <= signature["allowance"]
+            if not keep.any():
+                stats["rejected_cells"] += 1
+                return False
+            base, deviation = base[keep], deviation[keep]
+        stats["passed"] += 1
+        return True
+
+    def get_prefilter_stats(self):
+        """获取预筛选统计
+        :return: 检查次数、各级排除的次数，以及各级和整体的通过率
+        """
+        stats = dict(self.prefilter_stats)
+        checked = stats["checked"]
+        after_total = checked - stats["rejected_total"]
+        after_window = after_total - stats["rejected_window"]
+        stats["total_pass_rate"] = after_total / checked if checked else 1.0
+        stats["window_pass_rate"] = after_window / after_total if after_total else 1.0
+        stats["cells_pass_rate"] = stats["passed"] / after_window if after_window else 1.0
+        stats["pass_rate"] = stats["passed"] / checked if checked else 1.0
+        return stats
+
+    def _match_with_alpha(self, frame_binary, template_info, threshold, name=None):
+        """带透明度的模板匹配
+        :param frame_binary: 已二值化的输入图像
+        :param template_info: 预编译的模板信息（包含binary和mask）
+        :param threshold: 匹配阈值
+        :param name: 模板名称，用于复用输出缓冲区和位置跟踪
+        :return: 匹配结果或None
+        """
+        stats = self.tracking_stats
+        stats["full_pixels"] += frame_binary.size
+
+        # 先在上次匹配位置周围的小窗口内搜索
+        if name and self.tracking_enabled:
+            window, offset = self._tracking_window(frame_binary, template_info, name)
+            if window is not None:
+                stats["searched_pixels"] += window.size
+                score, location = self._search(window, template_info, (name, "tracking"))
+                if score >= threshold:
+                    stats["hits"] += 1
+                    location = (location[0] + offset[0], location[1] + offset[1])
+                    self._last_locations[name] = (location, frame_binary.shape)
+                    return {
+                        "score": score,
+                        "location": location
+                    }
+                stats["misses"] += 1
+
+        # 窗口内未匹配（或没有上次位置）时搜索整个区域（有锚点时为锚点范围）
+        search_image, offset = self._search_window(frame_binary, template_info, name)
+        stats["searched_pixels"] += search_image.size
+        score, location = self._search(search_image, template_info, name)
+        location = (location[0] + offset[0], location[1] + offset[1])
 
         if score >= threshold:
+            if name:
+                self._last_locations[name] = (location, frame_binary.shape)
             return {
                 "score": score,
                 "location": location
             }
-        return None
\ No newline at end of file
+        return None
+
+    def _search(self, frame_binary, template_info, buffer_key=None):
+        """在二值图像中搜索模板的最佳位置
+        :param frame_binary: 已二值化的图像（整个区域或跟踪窗口）
+        :param template_info: 预编译的模板信息
+        :param buffer_key: 输出缓冲区的键，为None时不复用缓冲区
+        :return: (相似度分数, 最佳位置)
+        """
+        result_buffer = self._get_result_buffer(frame_binary, template_info, buffer_key) if buffer_key else None
+        frame_cache = getattr(self._buffers, "frame_cache", None)
+        return self.engine.search(frame_binary, template_info, result_buffer, frame_cache)
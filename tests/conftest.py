@@ -0,0 +1,45 @@
+"""测试公共配置：将项目根目录加入Python路径，并提供合成模板与贴图的公共工具函数"""
+
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import numpy as np
+
+from match.template_cache import compile_template
+
+
+def make_template_info(seed=0, size=(24, 16), threshold=0.9, white_ratio=0.4):
+    """
+    生成编译后的合成模板：黑底上随机分布的白色像素，上方两行和左侧三列透明
+
+    参数:
+        seed: 随机种子
+        size: 模板尺寸 (width, height)
+        threshold: 匹配阈值
+        white_ratio: 白色像素比例
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    template = np.zeros((height, width, 4), dtype=np.uint8)
+    template[..., 3] = 255
+    template[:2, :, 3] = 0
+    template[:, :3, 3] = 0
+    template[rng.random((height, width)) < white_ratio, :3] = 255
+    info = compile_template(template)
+    info["threshold"] = threshold
+    return info
+
+
+def paste_template(frame, template_info, location):
+    """将模板不透明部分的二值像素贴入二值帧的指定位置（原地修改），返回模板范围的视图"""
+    t_w, t_h = template_info["size"]
+    x, y = location
+    roi = frame[y:y + t_h, x:x + t_w]
+    mask = template_info["mask"] > 0
+    roi[mask] = template_info["binary"][mask]
+    return roi
+
@@ -0,0 +1,41 @@
+"""后台截图环形缓冲区测试"""
+
+import numpy as np
+
+from capture.background_capture import BackgroundCapture
+
+
+def test_read_latest_is_not_overwritten_by_later_frames():
+    background = BackgroundCapture(grab=lambda: None, buffer_size=2)
+    background._publish(np.full((4, 4), 1, dtype=np.uint8))
+    frame = background.read_latest()
+
+    # 两个生产周期后原来的槽位已被改写，读到的帧不受影响
+    for value in (2, 3):
+        background._publish(np.full((4, 4), value, dtype=np.uint8))
+
+    assert (frame == 1).all()
+    assert (background.read_latest() == 3).all()
+
+
+def test_window_resize_never_exposes_unwritten_slots(monkeypatch):
+    background = BackgroundCapture(grab=lambda: None, buffer_size=2)
+    background._publish(np.full((4, 4), 1, dtype=np.uint8))
+
+    # 模拟生产者刚替换缓冲区、新帧尚未发布时的读取
+    original_copyto = np.copyto
+    seen = []
+
+    def copyto_and_read(dst, src):
+        seen.append(background.read_latest())
+        original_copyto(dst, src)
+
+    monkeypatch.setattr(np, "copyto", copyto_and_read)
+    background._publish(np.full((6, 8), 2, dtype=np.uint8))
+    monkeypatch.undo()
+
+    assert seen == [None]
+    frame = background.read_latest()
+    assert frame.shape == (6, 8) and (frame == 2).all()
+    # 每次读取复制一次整帧，计入统计
+    assert background.get_stats()["read_copy_mb"] * 1024 * 1024 == 48
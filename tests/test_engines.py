@@ -0,0 +1,81 @@
+"""匹配引擎测试：各引擎在合成的二值图像上与 opencv 引擎的结果对比"""
+
+import numpy as np
+import pytest
+
+from match.engines import BitPackedEngine, FFTEngine, OpenCVEngine, SparseEngine
+from conftest import make_template_info, paste_template
+
+
+def make_frame(template_info=None, location=(30, 20), size=(96, 64), seed=1):
+    """生成二值帧，可选地在指定位置贴入模板"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    frame = np.where(rng.random((height, width)) < 0.05, 255, 0).astype(np.uint8)
+    if template_info is not None:
+        paste_template(frame, template_info, location)
+    return frame
+
+
+# 宽度70的模板每行跨两个uint64，帧宽150也不是64的倍数
+@pytest.mark.parametrize("seed, size", [(0, (24, 16)), (1, (70, 12)), (2, (33, 20))])
+def test_bitpacked_scores_equal_opencv(seed, size):
+    template_info = make_template_info(seed, size)
+    frame = make_frame(template_info, location=(7 + seed * 13, 5 + seed * 9), size=(150, 48), seed=seed)
+    expected_score, expected_location = OpenCVEngine().search(frame, template_info)
+    score, location = BitPackedEngine().search(frame, template_info)
+
+    assert location == expected_location
+    assert score == pytest.approx(expected_score, abs=1e-5)
+
+
+def test_bitpacked_scores_equal_opencv_without_template():
+    template_info = make_template_info()
+    frame = make_frame(size=(90, 40), seed=5)
+    expected_score, _ = OpenCVEngine().search(frame, template_info)
+    score, _ = BitPackedEngine().search(frame, template_info)
+
+    assert score == pytest.approx(expected_score, abs=1e-5)
+
+
+def test_fft_scores_equal_opencv_for_templates_sharing_a_frame():
+    """同一帧的多个模板共享帧频谱缓存，每个模板的得分和位置都与 opencv 相同"""
+    templates = [make_template_info(seed, size) for seed, size in ((0, (24, 16)), (1, (40, 10)), (2, (17, 21)))]
+    frame = make_frame(templates[1], location=(52, 31), size=(120, 60), seed=3)
+    engine = FFTEngine()
+    frame_cache = {}
+    for template_info in templates:
+        expected_score, expected_location = OpenCVEngine().search(frame, template_info)
+        score, location = engine.search(frame, template_info, frame_cache=frame_cache)
+
+        assert score == pytest.approx(expected_score, abs=1e-5)
+        if expected_score > 0.99:
+            assert location == expected_location == (52, 31)
+
+    assert engine.stats["forward_transforms"] == 1
+
+
+def test_sparse_rejection_returns_zero_score():
+    """稀疏筛选直接拒绝时返回0分，不把估计得分交给调用方的阈值"""
+    template_info = make_template_info()
+    engine = SparseEngine(max_mismatch=0.1)
+    score, _ = engine.search(make_frame(), template_info)
+
+    assert engine.stats["rejected"] == 1
+    assert score == 0.0
+
+
+def test_sparse_matches_opencv_when_template_present():
+    template_info = make_template_info()
+    frame = make_frame(template_info, location=(41, 13))
+    expected = OpenCVEngine().search(frame, template_info)
+    score, location = SparseEngine().search(frame, template_info)
+
+    assert location == expected[1] == (41, 13)
+    assert score == pytest.approx(expected[0], abs=1e-5)
+
+
+def test_sparse_max_mismatch_validated_against_threshold():
+    assert SparseEngine(max_mismatch=1.5).max_mismatch == 1.0
+    assert SparseEngine(max_mismatch=0.05, threshold=0.9).max_mismatch == pytest.approx(0.1)
+    assert SparseEngine(max_mismatch=0.25, threshold=0.9).max_mismatch == 0.25
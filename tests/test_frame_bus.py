@@ -0,0 +1,83 @@
+"""FrameBus 截图共享的测试"""
+
+import threading
+import time
+
+import numpy as np
+
+from bot.clock import VirtualClock
+from capture.frame_bus import FrameBus
+from capture.frame_source import FrameSource
+
+
+class BlockingSource(FrameSource):
+    """每次截图都阻塞到测试放行，返回的帧内容为截图序号"""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def capture_array(self):
+        self.calls += 1
+        index = self.calls
+        self.started.set()
+        self.release.wait(5)
+        return np.full((2, 2, 3), index, dtype=np.uint8)
+
+
+def test_fresh_request_does_not_share_capture_started_before_it():
+    source = BlockingSource()
+    bus = FrameBus(source)
+
+    results = {}
+    stale = threading.Thread(target=lambda: results.setdefault("stale", bus.capture_array()))
+    stale.start()
+    assert source.started.wait(5)
+
+    # 第一次截图仍在进行时要求新帧
+    fresh = threading.Thread(target=lambda: results.setdefault("fresh", bus.capture_fresh_array()))
+    fresh.start()
+    time.sleep(0.05)
+    source.release.set()
+    stale.join(5)
+    fresh.join(5)
+
+    assert results["stale"][0, 0, 0] == 1
+    assert results["fresh"][0, 0, 0] == 2
+    assert source.calls == 2
+
+
+def test_concurrent_plain_requests_share_one_capture():
+    source = BlockingSource()
+    bus = FrameBus(source)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(bus.capture_array())) for _ in range(2)]
+    threads[0].start()
+    assert source.started.wait(5)
+    threads[1].start()
+    time.sleep(0.05)
+    source.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert source.calls == 1
+    assert bus.shared_count == 1
+    assert results[0] is results[1]
+
+
+def test_frame_age_uses_the_bus_clock():
+    """帧龄按注入的时钟计算：虚拟时间推进超过最大帧龄后不再复用缓存帧，与墙上时间无关"""
+    source = BlockingSource()
+    source.release.set()
+    clock = VirtualClock()
+    bus = FrameBus(source, max_age=0.008, clock=clock)
+
+    assert bus.capture_array()[0, 0, 0] == 1
+    assert bus.latest().timestamp == clock.time()
+    clock.advance(0.005)
+    assert bus.capture_array()[0, 0, 0] == 1
+    clock.advance(1.0)
+    assert bus.capture_array()[0, 0, 0] == 2
+    assert bus.get_stats()["cache_hits"] == 1
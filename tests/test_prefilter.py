@@ -0,0 +1,66 @@
+"""网格密度预筛选测试：matchTemplate 得分达到阈值的帧一定能通过预筛选"""
+
+import numpy as np
+
+from conftest import make_template_info, paste_template
+from match.engines import OpenCVEngine
+from match.template_matcher import TemplateMatcher
+
+
+def make_matcher(template_info):
+    matcher = TemplateMatcher()
+    matcher.templates = {"t": template_info}
+    matcher.tracking_enabled = False
+    matcher.memo_enabled = False
+    return matcher
+
+
+def noisy_frame(template_info, rng, size=(100, 50)):
+    """在随机背景上贴入模板，并在模板范围内随机翻转一部分像素，使得分分布在阈值两侧"""
+    width, height = size
+    frame = np.where(rng.random((height, width)) < rng.uniform(0.0, 0.1), 255, 0).astype(np.uint8)
+    t_w, t_h = template_info["size"]
+    location = int(rng.integers(0, width - t_w + 1)), int(rng.integers(0, height - t_h + 1))
+    roi = paste_template(frame, template_info, location)
+    flips = rng.random((t_h, t_w)) < rng.uniform(0.0, 0.08)
+    roi[flips] = 255 - roi[flips]
+    return frame
+
+
+def test_prefilter_never_rejects_a_frame_matchtemplate_accepts():
+    rng = np.random.default_rng(0)
+    engine = OpenCVEngine()
+    accepted = 0
+    for seed, threshold in ((0, 0.9), (1, 0.8), (2, 0.95)):
+        template_info = make_template_info(seed, (30, 14), threshold, white_ratio=0.45)
+        matcher = make_matcher(template_info)
+        for _ in range(150):
+            frame = noisy_frame(template_info, rng)
+            score, _ = engine.search(frame, template_info)
+            if score >= threshold:
+                accepted += 1
+                assert matcher._prefilter(frame, template_info, "t"), f"阈值 {threshold} 得分 {score:.4f} 被预筛选排除"
+    # 确保样本中有足够多刚好达到阈值的帧
+    assert accepted > 50
+
+
+def test_prefilter_does_not_change_match_results():
+    rng = np.random.default_rng(1)
+    template_info = make_template_info(size=(30, 14), white_ratio=0.45)
+    matcher = make_matcher(template_info)
+    for _ in range(100):
+        frame = noisy_frame(template_info, rng)
+        matcher.prefilter_enabled = True
+        with_prefilter = matcher.match_template(frame)
+        matcher.prefilter_enabled = False
+        without_prefilter = matcher.match_template(frame)
+        assert with_prefilter == without_prefilter
+    assert matcher.prefilter_stats["passed"] < matcher.prefilter_stats["checked"]
+
+
+def test_prefilter_rejects_idle_frame():
+    template_info = make_template_info(size=(30, 14), white_ratio=0.45)
+    matcher = make_matcher(template_info)
+
+    assert not matcher._prefilter(np.zeros((50, 100), dtype=np.uint8), template_info, "t")
+    assert matcher.prefilter_stats["rejected_total"] == 1
@@ -0,0 +1,116 @@
+"""会话录制测试：SessionRecorder 写入、SessionArchive 读回，分块写满后循环覆盖最旧的分块"""
+
+import numpy as np
+import pytest
+
+from capture.session_recorder import (PAGE_SIZE, RECORD_FRAME, RECORD_STATE, ArchiveFrameSource,
+                                      SessionArchive, SessionRecorder, _header_size)
+
+CHUNK_COUNT = 3
+FRAME_SHAPE = (20, 30, 3)
+
+
+def record_session(path, frames, encoding="raw"):
+    """录制 frames 帧，每帧之后录制一次状态；帧内容为帧序号减1，便于校验（队列足够长，不丢弃记录）"""
+    budget = _header_size(CHUNK_COUNT) + CHUNK_COUNT * PAGE_SIZE
+    recorder = SessionRecorder(str(path), budget_bytes=budget, chunk_size=PAGE_SIZE, encoding=encoding,
+                               queue_size=frames * 2 + 1)
+    assert recorder.chunk_count == CHUNK_COUNT
+    for i in range(frames):
+        image = np.full(FRAME_SHAPE, i % 256, dtype=np.uint8)
+        recorder.record_frame("ocr", image, region=(5, 7, 30, 20), window_size=(64, 48),
+                              frame_sequence=i + 1, timestamp=100.0 + i)
+        recorder.record_state(i % 4, "拉扯鱼线", 0.95, timestamp=100.0 + i + 0.5)
+    recorder.close()
+    return recorder.get_stats()
+
+
+def read_frames(archive):
+    """读回所有帧的 (帧序号, 像素值)，不持有内存映射上的视图"""
+    frames = []
+    for index, _ in archive.iter_records(RECORD_FRAME):
+        image, meta = archive.read_frame(index)
+        assert image.shape == FRAME_SHAPE
+        assert (image == image.flat[0]).all()
+        frames.append((meta["frame"], int(image.flat[0])))
+        del image
+    return frames
+
+
+@pytest.mark.parametrize("encoding", ["raw", "png"])
+def test_round_trip_without_wraparound(tmp_path, encoding):
+    path = tmp_path / "session.rec"
+    stats = record_session(path, 2, encoding)
+    assert stats["written"] == 4 and not stats["wrapped"]
+
+    archive = SessionArchive(str(path))
+    try:
+        assert archive.describe()["counts"] == {"frame": 2, "state": 2}
+        assert read_frames(archive) == [(1, 0), (2, 1)]
+        state_index = next(index for index, _ in archive.iter_records(RECORD_STATE))
+        assert archive.read_meta(state_index) == {"state": 0, "template": "拉扯鱼线", "score": 0.95}
+    finally:
+        archive.close()
+
+
+def test_round_trip_with_chunk_wraparound(tmp_path):
+    path = tmp_path / "session.rec"
+    frames = 40
+    stats = record_session(path, frames)
+    assert stats["written"] == frames * 2
+    assert stats["wrapped"]
+
+    archive = SessionArchive(str(path))
+    try:
+        records = archive.records
+        # 最旧的分块已被覆盖：保留的是最后写入的一段连续记录，按写入顺序排列
+        sequences = [record.sequence for record in records]
+        assert sequences == list(range(sequences[0], sequences[0] + len(sequences)))
+        assert sequences[-1] == frames * 2
+        assert sequences[0] > 1
+        timestamps = [record.timestamp for record in records]
+        assert timestamps == sorted(timestamps)
+
+        recorded = read_frames(archive)
+        assert recorded[-1] == (frames, frames - 1)
+        assert [sequence for sequence, _ in recorded] == list(range(recorded[0][0], frames + 1))
+        assert all(value == sequence - 1 for sequence, value in recorded)
+
+        assert archive.index_at_time(100.0 + frames) == len(records) - 1
+        assert archive.index_at_time(0.0) == -1
+    finally:
+        archive.close()
+
+
+def test_archive_frame_source_replays_regions(tmp_path):
+    path = tmp_path / "session.rec"
+    record_session(path, 3)
+
+    source = ArchiveFrameSource(str(path))
+    try:
+        assert len(source) == 3
+        assert (source.window_width, source.window_height) == (64, 48)
+        source.seek(2)
+        canvas = source.capture_array()
+        assert (canvas[7:27, 5:35] == 2).all()
+        assert source.capture_array() is None
+    finally:
+        source.archive.close()
+
+
+def test_small_budget_shrinks_chunk_to_fit(tmp_path):
+    budget = _header_size(1) + 3 * PAGE_SIZE + 100
+    recorder = SessionRecorder(str(tmp_path / "small.rec"), budget_bytes=budget, chunk_size=4 * 1024 * 1024)
+    try:
+        assert recorder.chunk_count == 1
+        assert recorder.chunk_size == 3 * PAGE_SIZE
+        assert recorder.file_size <= budget
+        assert (tmp_path / "small.rec").stat().st_size <= budget
+    finally:
+        recorder.close()
+
+
+def test_budget_without_room_for_a_chunk_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        SessionRecorder(str(tmp_path / "tiny.rec"), budget_bytes=_header_size(1) + PAGE_SIZE - 1)
+    assert not (tmp_path / "tiny.rec").exists()
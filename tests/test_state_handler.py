@@ -0,0 +1,102 @@
+"""StateHandler 按模板匹配结果切换状态的测试"""
+
+import threading
+
+import numpy as np
+
+from bot.clock import VirtualClock
+from bot.state_handler import StateHandler
+from bot.state_machine import FishingState
+
+
+def make_handler(state=FishingState.IDLE):
+    handler = StateHandler(None, None, clock=VirtualClock())
+    if state != FishingState.IDLE:
+        assert handler.set_state(state, trigger="test")
+    return handler
+
+
+def test_rejected_transition_is_retried_while_template_persists():
+    handler = make_handler(FishingState.SKIP)
+
+    # 结算画面之后不能直接进入拉扯鱼线，转换被拒绝，模板不记为已处理
+    last = handler._handle_template_match("拉扯鱼线", 0.95, "跳过")
+    assert handler.running_state == FishingState.SKIP
+    assert last == "跳过"
+
+    # 超时回到未开始后，仍在画面上的同一模板可以切换状态
+    handler.set_state(FishingState.IDLE, trigger="timeout")
+    last = handler._handle_template_match("拉扯鱼线", 0.95, last)
+    assert handler.running_state == FishingState.PULL
+    assert last == "拉扯鱼线"
+
+
+def test_accepted_template_is_not_reapplied():
+    handler = make_handler()
+    last = handler._handle_template_match("收线", 0.95, None)
+    assert handler.running_state == FishingState.REEL
+    sequence = handler.last_event.sequence
+
+    assert handler._handle_template_match("收线", 0.95, last) == "收线"
+    assert handler.last_event.sequence == sequence
+
+
+def test_same_state_template_is_remembered():
+    handler = make_handler(FishingState.HOOK)
+    # 收竿和提竿对应同一状态，不需要切换，也不会每帧重试
+    assert handler._handle_template_match("提竿", 0.95, "收竿") == "提竿"
+    assert handler.running_state == FishingState.HOOK
+
+
+def test_low_score_does_not_change_state():
+    handler = make_handler()
+    assert handler._handle_template_match("收线", 0.5, None) == "未开始"
+    assert handler.running_state == FishingState.IDLE
+
+
+class StaticMatcher:
+    """每帧都返回同一个模板的匹配器"""
+
+    def __init__(self, name, score=0.95):
+        self.result = {"name": name, "score": score, "location": (0, 0), "size": (10, 10)}
+
+    def match_template(self, frame):
+        return dict(self.result)
+
+
+class StaticCapture:
+    def capture_region_array(self):
+        return np.zeros((10, 10, 3), dtype=np.uint8)
+
+
+def test_rejected_template_on_screen_times_out_to_idle():
+    """收线时画面上一直是收竿：收线 -> 收竿被拒绝，不能重置无匹配计时器，4秒后回到未开始，再按收竿切换"""
+    clock = VirtualClock()
+    handler = StateHandler(StaticMatcher("收竿"), StaticCapture(), clock=clock)
+    handler.detection_planner = None
+    assert handler.set_state(FishingState.REEL, trigger="test")
+    start = clock.time()
+
+    events = []
+    done = threading.Event()
+
+    def on_event(event):
+        events.append(event)
+        if event.state == FishingState.HOOK:
+            handler.stop_flag = True
+            done.set()
+
+    handler.subscribe(on_event)
+    thread = threading.Thread(target=handler._template_detection_loop, daemon=True)
+    clock.register(thread)
+    thread.start()
+    try:
+        assert done.wait(5.0), f"停留在 {handler.get_current_state()}，虚拟时间 {clock.time() - start:.1f}s"
+    finally:
+        handler.stop_flag = True
+        clock.release()
+        thread.join(timeout=2)
+
+    assert [event.state for event in events] == [FishingState.IDLE, FishingState.HOOK]
+    assert 4.0 < events[0].timestamp - start < 4.5
+    assert handler.state_machine.illegal_transitions[(FishingState.REEL, FishingState.HOOK)] > 1
@@ -0,0 +1,123 @@
+"""钓鱼状态机测试：转换表、守卫条件、进入/退出动作和停留时长统计"""
+
+import pytest
+
+from bot.clock import VirtualClock
+from bot.state_machine import (MIN_TEMPLATE_SCORE, TEMPLATE_STATES, TRANSITIONS, FishingState, StateMachine)
+
+
+def make_machine(**kwargs):
+    return StateMachine(clock=VirtualClock(), **kwargs)
+
+
+def test_transition_table_covers_every_state():
+    assert set(TRANSITIONS) == set(FishingState)
+    for source, targets in TRANSITIONS.items():
+        assert source not in targets
+        if source != FishingState.IDLE:
+            assert FishingState.IDLE in targets
+
+
+@pytest.mark.parametrize("source, target", [
+    (FishingState.REEL, FishingState.HOOK),
+    (FishingState.SKIP, FishingState.PULL),
+    (FishingState.SKIP, FishingState.REEL),
+])
+def test_illegal_transition_is_rejected_and_counted(source, target):
+    machine = make_machine(initial=source)
+
+    assert not machine.can_transition(source, target)
+    assert machine.transition(target, trigger="template") is None
+    assert machine.state == source
+    assert machine.illegal_transitions[(source, target)] == 1
+    assert machine.get_metrics()["illegal_total"] == 1
+
+
+def test_same_state_is_not_a_transition():
+    machine = make_machine(initial=FishingState.PULL)
+
+    assert machine.transition(FishingState.PULL) is None
+    assert not machine.transition_counts
+    assert not machine.illegal_transitions
+
+
+def test_score_guard_rejects_low_template_scores():
+    machine = make_machine()
+
+    assert machine.transition(FishingState.PULL, "拉扯鱼线", MIN_TEMPLATE_SCORE - 0.01, "template") is None
+    assert machine.state == FishingState.IDLE
+    assert machine.guard_rejections[(FishingState.IDLE, FishingState.PULL)] == 1
+
+    transition = machine.transition(FishingState.PULL, "拉扯鱼线", MIN_TEMPLATE_SCORE, "template")
+    assert transition.source == FishingState.IDLE and transition.target == FishingState.PULL
+    # 不是由模板触发的转换没有得分，不受得分守卫限制
+    assert machine.transition(FishingState.IDLE, trigger="timeout") is not None
+
+
+def test_custom_guard_and_transition_table():
+    calls = []
+
+    def only_from_timeout(transition):
+        calls.append(transition)
+        return transition.trigger == "timeout"
+
+    machine = make_machine(transitions={FishingState.IDLE: {FishingState.HOOK}, FishingState.HOOK: set()},
+                           guards={FishingState.HOOK: [only_from_timeout]})
+
+    assert machine.transition(FishingState.HOOK, trigger="template") is None
+    assert machine.transition(FishingState.HOOK, trigger="timeout") is not None
+    assert [transition.trigger for transition in calls] == ["template", "timeout"]
+    # 自定义转换表中 HOOK 没有出口
+    assert machine.transition(FishingState.IDLE) is None
+
+
+def test_enter_and_exit_actions_run_around_the_switch():
+    machine = make_machine()
+    events = []
+    machine.on_exit(FishingState.IDLE, lambda t: events.append(("exit", t.source, machine.state)))
+    machine.on_enter(FishingState.REEL, lambda t: events.append(("enter", t.target, machine.state)))
+
+    machine.transition(FishingState.REEL, "收线", 0.9, "template")
+
+    assert events == [("exit", FishingState.IDLE, FishingState.IDLE),
+                      ("enter", FishingState.REEL, FishingState.REEL)]
+
+
+def test_time_in_state_and_visits():
+    clock = VirtualClock()
+    machine = StateMachine(clock=clock)
+    clock.sleep(2.0)
+    machine.transition(FishingState.PULL, trigger="test")
+    clock.sleep(3.0)
+    machine.transition(FishingState.REEL, trigger="test")
+    clock.sleep(1.5)
+
+    metrics = machine.get_metrics()
+    assert metrics["state"] == "收线"
+    assert metrics["time_in_state"]["未开始"] == pytest.approx(2.0)
+    assert metrics["time_in_state"]["拉扯鱼线"] == pytest.approx(3.0)
+    assert metrics["time_in_state"]["收线"] == pytest.approx(1.5)
+    assert metrics["visits"]["拉扯鱼线"] == 1
+    assert metrics["transitions"] == {"未开始->拉扯鱼线": 1, "拉扯鱼线->收线": 1}
+
+
+def test_next_templates_follow_the_transition_table():
+    machine = make_machine(initial=FishingState.SKIP)
+
+    # 结算画面之后只可能出现提竿类模板（或保持跳过）
+    assert set(machine.next_templates()) == {"收竿", "提竿", "跳过"}
+    assert set(machine.next_templates(FishingState.IDLE)) == set(TEMPLATE_STATES)
+
+
+def test_illegal_transition_warns_once_until_state_changes(caplog):
+    machine = make_machine(initial=FishingState.REEL)
+    with caplog.at_level("WARNING", logger="bot.state_machine"):
+        for _ in range(5):
+            machine.transition(FishingState.HOOK, "收竿", 0.95, "template")
+        assert len(caplog.records) == 1
+
+        machine.transition(FishingState.IDLE, trigger="timeout")
+        machine.transition(FishingState.REEL, "收线", 0.95, "template")
+        machine.transition(FishingState.HOOK, "收竿", 0.95, "template")
+        assert len(caplog.records) == 2
+    assert machine.illegal_transitions[(FishingState.REEL, FishingState.HOOK)] == 6